@@ -8,3 +8,5 @@ class ContenedorCalificacionesConfig(AppConfig):
     def ready(self):
         # Importa signals para actualizar cuentas al modificar equipos
         from . import signals  # noqa: F401
+        # Registra las revisiones de configuración (manage.py check)
+        from . import checks  # noqa: F401
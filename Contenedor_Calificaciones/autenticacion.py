@@ -0,0 +1,75 @@
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, SessionAuthentication, get_authorization_header
+
+from .models import Cuenta, TokenIntegracion
+
+# Autenticación de la API con la sesión del sitio: las cuentas no son usuarios
+# de django.contrib.auth, el login (vista contrasena) deja cuenta_id y rol en
+# la sesión y estas clases los exponen como request.user en las vistas de DRF.
+# Las integraciones usan en cambio un TokenIntegracion en la cabecera
+# Authorization, sin sesión ni CSRF.
+
+
+class UsuarioCuenta:
+    """request.user de DRF para una Cuenta con sesión iniciada."""
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, cuenta):
+        self.cuenta = cuenta
+        self.pk = cuenta.pk
+
+    def __str__(self):
+        return self.cuenta.rut
+
+
+class SesionCuentaAuthentication(SessionAuthentication):
+    """
+    Autentica con la cuenta de request.session['cuenta_id']. Como en
+    SessionAuthentication, los métodos que escriben exigen el token CSRF.
+    """
+
+    def authenticate(self, request):
+        cuenta_id = request._request.session.get('cuenta_id')
+        if not cuenta_id:
+            return None
+        cuenta = Cuenta.objects.filter(pk=cuenta_id).first()
+        if cuenta is None:
+            return None
+        self.enforce_csrf(request)
+        return (UsuarioCuenta(cuenta), None)
+
+
+class TokenIntegracionAuthentication(BaseAuthentication):
+    """
+    Autentica con la cabecera `Authorization: Token <clave>` de un
+    TokenIntegracion activo. Una clave desconocida o revocada responde 401.
+    """
+
+    palabra_clave = 'Token'
+
+    def authenticate(self, request):
+        partes = get_authorization_header(request).split()
+        if not partes or partes[0].lower() != self.palabra_clave.lower().encode():
+            return None
+        if len(partes) != 2:
+            raise exceptions.AuthenticationFailed('Cabecera Authorization inválida: use "Token <clave>".')
+        try:
+            clave = partes[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Token inválido.')
+
+        token = (
+            TokenIntegracion.objects.select_related('cuenta')
+            .filter(clave_hash=TokenIntegracion.hash_clave(clave), activo=True)
+            .first()
+        )
+        if token is None:
+            raise exceptions.AuthenticationFailed('Token inválido o revocado.')
+        TokenIntegracion.objects.filter(pk=token.pk).update(ultimo_uso=timezone.now())
+        return (UsuarioCuenta(token.cuenta), token)
+
+    def authenticate_header(self, request):
+        return self.palabra_clave
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+
+from .models import Empresa
+
+# Filtros de los listados por RUT o nombre de empresa ("contiene", sin
+# distinguir mayúsculas):
+# - en PostgreSQL se usa el mismo icontains de siempre, que compila a
+#   UPPER(col::text) LIKE UPPER('%x%') y lo resuelven los índices GIN de
+#   trigramas sobre esas expresiones (ver migración 0026);
+# - en otros motores (SQLite en desarrollo) un LIKE '%x%' recorre toda la
+#   tabla, así que se busca en un índice invertido de trigramas en memoria y
+#   se filtra por los RUTs encontrados.
+
+# Sobre esta cantidad de empresas encontradas no conviene un `IN (...)` y se
+# vuelve al icontains
+MAXIMO_RUTS = 5000
+
+# Índices en memoria por alias de conexión: (creado, {campo: IndiceNgramas})
+_indices = {}
+_candado = threading.Lock()
+
+
+def ngramas(texto, n=3):
+    """Trigramas de caracteres del texto (incluye espacios y puntuación)."""
+    return {texto[i:i + n] for i in range(len(texto) - n + 1)}
+
+
+class IndiceNgramas:
+    """
+    Índice invertido trigrama -> posiciones de los textos que lo contienen.
+    `buscar(texto)` intersecta las listas de los trigramas del texto buscado
+    (la más corta primero) y confirma cada candidato con `in`; textos de menos
+    de 3 caracteres se comparan contra todos.
+    """
+
+    def __init__(self, pares):
+        self.claves = []
+        self.textos = []
+        self.indice = defaultdict(list)
+        for posicion, (clave, texto) in enumerate(pares):
+            texto = (texto or '').casefold()
+            self.claves.append(clave)
+            self.textos.append(texto)
+            for ngrama in ngramas(texto):
+                self.indice[ngrama].append(posicion)
+
+    def buscar(self, texto):
+        texto = texto.casefold()
+        buscados = ngramas(texto)
+        if not buscados:
+            candidatos = range(len(self.textos))
+        else:
+            listas = sorted((self.indice.get(ngrama, ()) for ngrama in buscados), key=len)
+            candidatos = set(listas[0]).intersection(*listas[1:])
+        return {self.claves[p] for p in candidatos if texto in self.textos[p]}
+
+
+def invalidar():
+    """Descarta los índices en memoria (al guardar o borrar una Empresa)."""
+    _indices.clear()
+
+
+def _indices_empresas(alias):
+    # Se arman con una consulta y se reutilizan hasta que cambie una empresa
+    # en este proceso o pasen BUSQUEDA_INDICE_SEGUNDOS (cambios de otros procesos)
+    guardado = _indices.get(alias)
+    if guardado and time.monotonic() - guardado[0] < settings.BUSQUEDA_INDICE_SEGUNDOS:
+        return guardado[1]
+    with _candado:
+        guardado = _indices.get(alias)
+        if guardado and time.monotonic() - guardado[0] < settings.BUSQUEDA_INDICE_SEGUNDOS:
+            return guardado[1]
+        empresas = list(Empresa.objects.using(alias).values_list('empresa_rut', 'nombre_empresa'))
+        indices = {
+            'empresa_rut': IndiceNgramas((rut, rut) for rut, _ in empresas),
+            'nombre_empresa': IndiceNgramas(empresas),
+        }
+        _indices[alias] = (time.monotonic(), indices)
+        return indices
+
+
+def ruts_que_contienen(rut='', nombre='', alias='default'):
+    """RUTs de las empresas cuyo RUT contiene `rut` y cuyo nombre contiene `nombre`."""
+    indices = _indices_empresas(alias)
+    encontrados = None
+    for campo, texto in (('empresa_rut', rut), ('nombre_empresa', nombre)):
+        if texto:
+            ruts = indices[campo].buscar(texto)
+            encontrados = ruts if encontrados is None else encontrados & ruts
+    return encontrados
+
+
+def filtrar_por_empresa(queryset, rut='', nombre='', campo='rut_empresa'):
+    """
+    Filtra el queryset (de un modelo con llave foránea `campo` a Empresa) a
+    las filas cuya empresa contiene `rut` en su RUT y `nombre` en su nombre.
+    """
+    if not (rut or nombre):
+        return queryset
+    filtros = {}
+    if rut:
+        filtros[f'{campo}__empresa_rut__icontains'] = rut
+    if nombre:
+        filtros[f'{campo}__nombre_empresa__icontains'] = nombre
+
+    if connections[queryset.db].vendor == 'postgresql':
+        return queryset.filter(**filtros)
+    ruts = ruts_que_contienen(rut, nombre, alias=queryset.db)
+    if len(ruts) > MAXIMO_RUTS:
+        return queryset.filter(**filtros)
+    return queryset.filter(**{f'{campo}__in': sorted(ruts)})
@@ -0,0 +1,2 @@
+# Lógica de la carga masiva de calificaciones tributarias
+# (lectura del archivo, validación y guardado). Las vistas siguen en views.py.
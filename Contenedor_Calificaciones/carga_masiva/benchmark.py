@@ -0,0 +1,192 @@
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+from django.db import connection, transaction
+from openpyxl import Workbook
+
+from ..validators import rut_con_digito
+from .empresas import BuscadorParecidas, empresas_por_rut
+from .filas import FilaCalificacion
+from .guardado import guardar_calificaciones
+from .lectores import COLUMNAS_PLANTILLA, abrir_archivo
+from .validacion import armar_datos, validar_columnas, verificar_empresas
+
+# Benchmark de la carga masiva: genera libros con el formato de
+# Plantilla_Carga_Masiva_Nuam.xlsx y mide por separado cada fase del pipeline
+# (lectura, validación, resolución de empresas y guardado).
+
+ENCABEZADOS = ['Nº'] + [nombres[0] for nombres in COLUMNAS_PLANTILLA.values()]
+
+FASES = ['lectura', 'validacion', 'empresas', 'guardado']
+
+TIPOS = ['Anual', 'Mensual', 'Trimestral', 'Rectificatoria']
+UNIDADES = ['CLP', 'UF', 'UTM', 'USD']
+CATEGORIAS = ['A', 'B', 'C', 'Bajo', 'Medio', 'Alto']
+RIESGOS = ['Bajo', 'Medio', 'Alto', 'Crítico']
+
+
+def _rut_no_registrado(azar):
+    return rut_con_digito(azar.randint(50000000, 59999999))
+
+
+# Errores que se inyectan en las filas inválidas: (columna, valor)
+ERRORES_SINTETICOS = [
+    (1, lambda azar: '12.345.678-0'),
+    (1, _rut_no_registrado),
+    (3, lambda azar: 'dos mil'),
+    (3, lambda azar: 1850),
+    (5, lambda azar: -1500),
+    (6, lambda azar: 1.5),
+    (8, lambda azar: 140),
+    (9, lambda azar: 'Z'),
+    (10, lambda azar: 'Extremo'),
+]
+
+
+def generar_libro(ruta, filas, empresas, proporcion_invalidas=0.1, semilla=1):
+    """
+    Escribe en `ruta` un .xlsx con `filas` calificaciones sintéticas para las
+    `empresas` dadas ({rut: nombre}). Una fracción `proporcion_invalidas` de
+    las filas lleva un error de validación elegido al azar.
+    """
+    azar = random.Random(semilla)
+    empresas = list(empresas.items())
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet('Calificación Tributaria')
+    hoja.append(ENCABEZADOS)
+    for numero in range(1, filas + 1):
+        rut, nombre = azar.choice(empresas)
+        fila = [
+            numero, rut, nombre,
+            azar.randint(2015, 2024),
+            azar.choice(TIPOS),
+            round(azar.uniform(1000, 50000000), 2),
+            round(azar.random(), 4),
+            azar.choice(UNIDADES),
+            azar.randint(0, 100),
+            azar.choice(CATEGORIAS),
+            azar.choice(RIESGOS),
+            azar.choice(['', 'Sin observaciones', 'Calificación generada para benchmark']),
+        ]
+        if azar.random() < proporcion_invalidas:
+            columna, valor = azar.choice(ERRORES_SINTETICOS)
+            fila[columna] = valor(azar)
+        hoja.append(fila)
+    libro.save(ruta)
+
+
+def rss_pico_mb():
+    """Memoria residente máxima del proceso hasta ahora, en MB."""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux la informa en KB y macOS en bytes
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def medir_carga(ruta, cuenta_id, tamano_bloque, guardar=True):
+    """
+    Procesa el archivo como la carga masiva (por bloques, en este proceso) y
+    retorna un dict con los segundos de cada fase, las filas por segundo y el
+    pico de memoria. El guardado se hace dentro de una transacción que se
+    deshace al final, así la BD queda igual.
+    """
+    segundos = dict.fromkeys(FASES, 0.0)
+    filas = validas = guardadas = 0
+
+    with transaction.atomic():
+        buscar_parecidas = BuscadorParecidas()
+        lector = abrir_archivo(ruta)
+        try:
+            bloques = lector.bloques(tamano_bloque)
+            while True:
+                inicio = time.perf_counter()
+                bloque = next(bloques, None)
+                segundos['lectura'] += time.perf_counter() - inicio
+                if bloque is None:
+                    break
+
+                inicio = time.perf_counter()
+                resultado, errores = validar_columnas(bloque)
+                segundos['validacion'] += time.perf_counter() - inicio
+
+                inicio = time.perf_counter()
+                ruts = resultado.loc[resultado['rut_valido'], 'rut_empresa'].unique()
+                verificar_empresas(resultado, errores, empresas_por_rut(ruts), buscar_parecidas)
+                segundos['empresas'] += time.perf_counter() - inicio
+
+                inicio = time.perf_counter()
+                datos = armar_datos(resultado, errores)
+                segundos['validacion'] += time.perf_counter() - inicio
+
+                filas += len(datos)
+                datos = [dato for dato in datos if dato.valido]
+                validas += len(datos)
+                if guardar and cuenta_id:
+                    cantidad, duracion = guardar_calificaciones(datos, cuenta_id, 'por_enviar')
+                    guardadas += cantidad
+                    segundos['guardado'] += duracion
+        finally:
+            lector.cerrar()
+        transaction.set_rollback(True)
+
+    total = sum(segundos.values())
+    return {
+        'filas': filas,
+        'filas_validas': validas,
+        'filas_guardadas': guardadas,
+        'segundos': {fase: round(valor, 4) for fase, valor in segundos.items()},
+        # El guardado solo procesa las filas válidas
+        'filas_por_segundo': {
+            fase: round((validas if fase == 'guardado' else filas) / valor) if valor else None
+            for fase, valor in segundos.items()
+        },
+        'segundos_total': round(total, 4),
+        'filas_por_segundo_total': round(filas / total) if total else None,
+        'rss_pico_mb': round(rss_pico_mb(), 1),
+        'motor_bd': connection.vendor,
+    }
+
+
+def _memoria(construir):
+    # Bytes que reserva construir() según tracemalloc (se mantiene vivo hasta medir)
+    tracemalloc.start()
+    try:
+        antes = tracemalloc.get_traced_memory()[0]
+        objetos = construir()
+        usados = tracemalloc.get_traced_memory()[0] - antes
+    finally:
+        tracemalloc.stop()
+    del objetos
+    return usados
+
+
+def bytes_por_fila(ruta, tamano_bloque):
+    """
+    Compara la memoria por fila de las filas validadas del archivo como dict
+    (la representación anterior: un dict con las claves de la plantilla y una
+    lista de errores por fila) y como FilaCalificacion. Ambas comparten los
+    valores, así que la diferencia es la de la estructura de cada fila.
+    """
+    filas = []
+    lector = abrir_archivo(ruta)
+    try:
+        for bloque in lector.bloques(tamano_bloque):
+            filas.extend(armar_datos(*validar_columnas(bloque)))
+    finally:
+        lector.cerrar()
+    if not filas:
+        return None
+
+    campos = FilaCalificacion.__slots__
+    valores = [[getattr(fila, campo) for campo in campos] for fila in filas]
+    como_dict = _memoria(lambda: [
+        {**dict(zip(campos, fila)), 'errores': list(fila[-2])} for fila in valores
+    ])
+    como_slots = _memoria(lambda: [FilaCalificacion(*fila[:-1]) for fila in valores])
+    return {
+        'filas': len(filas),
+        'bytes_por_fila_dict': round(como_dict / len(filas)),
+        'bytes_por_fila_slots': round(como_slots / len(filas)),
+    }
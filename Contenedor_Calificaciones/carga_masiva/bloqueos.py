@@ -0,0 +1,60 @@
+from contextlib import contextmanager
+
+from django.db import connection
+
+# Bloqueo por cuenta para las escrituras de la carga masiva: dos cargas de la
+# misma cuenta no guardan al mismo tiempo, así la revisión de huellas ya
+# importadas y el INSERT que la sigue no se cruzan entre ellas.
+#
+# En PostgreSQL es un advisory lock de sesión (sobrevive a los commits del
+# guardado por partes; requiere una conexión directa o un pooler en modo
+# sesión). En otros motores, como SQLite en desarrollo, no hace nada.
+
+# Primer entero del advisory lock, para no chocar con otros usos de pg_advisory_lock
+ESPACIO_CARGA_MASIVA = 7301
+
+
+class CuentaOcupada(Exception):
+    """Otra carga masiva de la misma cuenta está guardando."""
+
+
+@contextmanager
+def bloqueo_cuenta(cuenta_id, esperar=True):
+    """
+    Toma el bloqueo de carga masiva de la cuenta mientras dura el bloque
+    `with`. Si `esperar` es False y otra carga lo tiene, lanza CuentaOcupada
+    en vez de esperar a que se libere.
+    """
+    if connection.vendor != 'postgresql':
+        yield
+        return
+
+    with connection.cursor() as cursor:
+        if esperar:
+            cursor.execute('SELECT pg_advisory_lock(%s, %s)', [ESPACIO_CARGA_MASIVA, cuenta_id])
+        else:
+            cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', [ESPACIO_CARGA_MASIVA, cuenta_id])
+            if not cursor.fetchone()[0]:
+                raise CuentaOcupada('Hay otra carga masiva de esta cuenta guardándose en este momento.')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [ESPACIO_CARGA_MASIVA, cuenta_id])
+
+
+def cuenta_ocupada(cuenta_id):
+    """
+    True si alguna conexión tiene ahora el bloqueo de carga masiva de la
+    cuenta (un guardado o una ingesta en curso). Sin PostgreSQL no se puede
+    saber y retorna False.
+    """
+    if connection.vendor != 'postgresql':
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', [ESPACIO_CARGA_MASIVA, cuenta_id])
+        if not cursor.fetchone()[0]:
+            return True
+        cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [ESPACIO_CARGA_MASIVA, cuenta_id])
+    return False
@@ -0,0 +1,71 @@
+from ..models import CalificacionTributaria, FilaCargaMasiva
+from .huella import huella_de_dato
+
+# Huellas por consulta `huella__in`
+HUELLAS_POR_CONSULTA = 1000
+
+MENSAJE_YA_IMPORTADA = 'Esta calificación ya fue importada anteriormente.'
+
+
+def _en_partes(valores):
+    valores = list(valores)
+    for inicio in range(0, len(valores), HUELLAS_POR_CONSULTA):
+        yield valores[inicio:inicio + HUELLAS_POR_CONSULTA]
+
+
+def huellas_existentes(cuenta_id, huellas):
+    """
+    Retorna el subconjunto de `huellas` que la cuenta ya tiene en
+    calificaciones no eliminadas, con unas pocas consultas `huella__in`.
+    """
+    existentes = set()
+    for parte in _en_partes(huellas):
+        existentes.update(
+            CalificacionTributaria.objects
+            .filter(cuenta_id=cuenta_id, huella__in=parte)
+            .exclude(estado_calificacion='eliminado')
+            .values_list('huella', flat=True)
+        )
+    return existentes
+
+
+def _filas_previas(lote, huellas):
+    # {huella: fila} de las filas válidas que ya están en el staging del lote
+    previas = {}
+    for parte in _en_partes(huellas):
+        previas.update(
+            FilaCargaMasiva.objects
+            .filter(lote=lote, valido=True, huella__in=parte)
+            .values_list('huella', 'fila')
+        )
+    return previas
+
+
+def marcar_duplicados(lote, datos):
+    """
+    Calcula la huella de las filas válidas de un bloque y marca como no
+    válidas las que la cuenta ya importó antes o que repiten una fila anterior
+    del mismo archivo. Todo se revisa por conjuntos (una consulta por cada
+    HUELLAS_POR_CONSULTA huellas), no fila por fila.
+    Retorna la cantidad de filas marcadas.
+    """
+    validos = [dato for dato in datos if dato.valido]
+    for dato in validos:
+        dato.huella = huella_de_dato(dato)
+
+    huellas = {dato.huella for dato in validos}
+    ya_importadas = huellas_existentes(lote.cuenta_id, huellas)
+    anteriores = _filas_previas(lote, huellas - ya_importadas)
+
+    marcadas = 0
+    for dato in validos:
+        huella = dato.huella
+        if huella in ya_importadas:
+            dato.agregar_error(MENSAJE_YA_IMPORTADA)
+        elif huella in anteriores:
+            dato.agregar_error(f'Fila repetida: es igual a la fila {anteriores[huella]} del archivo.')
+        else:
+            anteriores[huella] = dato.fila
+            continue
+        marcadas += 1
+    return marcadas
@@ -0,0 +1,119 @@
+from collections import Counter, defaultdict
+
+from django.db import connection
+
+from ..models import Empresa
+from .similitud import SIMILITUD_MINIMA, trigramas
+
+# RUTs por consulta `empresa_rut__in` (mantiene acotada la cantidad de
+# parámetros por sentencia, p. ej. en SQLite)
+RUTS_POR_CONSULTA = 1000
+
+# Empresa registrada de nombre más parecido a cada nombre: la búsqueda usa el
+# índice de trigramas sobre nombre_normalizado (ver migración 0022)
+SQL_PARECIDAS = """
+    SELECT q.nombre, e.empresa_rut, e.nombre_empresa, similarity(e.nombre_normalizado, q.nombre)
+    FROM unnest(%s::text[]) AS q(nombre)
+    CROSS JOIN LATERAL (
+        SELECT empresa_rut, nombre_empresa, nombre_normalizado
+        FROM empresa
+        WHERE nombre_normalizado %% q.nombre
+        ORDER BY nombre_normalizado <-> q.nombre, empresa_rut
+        LIMIT 1
+    ) AS e
+"""
+
+# pg_trgm instalado, por alias de conexión
+_pg_trgm = {}
+
+
+def empresas_por_rut(ruts):
+    """
+    Retorna {rut: nombre_empresa} con las empresas registradas entre los RUTs
+    (ya formateados) recibidos. Se resuelven todos con unas pocas consultas
+    `empresa_rut__in` en vez de una consulta por fila.
+    """
+    ruts = list(dict.fromkeys(r for r in ruts if r))
+    empresas = {}
+    for inicio in range(0, len(ruts), RUTS_POR_CONSULTA):
+        empresas.update(
+            Empresa.objects
+            .filter(empresa_rut__in=ruts[inicio:inicio + RUTS_POR_CONSULTA])
+            .values_list('empresa_rut', 'nombre_empresa')
+        )
+    return empresas
+
+
+def _usa_pg_trgm():
+    # Se revisa una vez por conexión si la BD es PostgreSQL con pg_trgm
+    if connection.vendor != 'postgresql':
+        return False
+    if connection.alias not in _pg_trgm:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _pg_trgm[connection.alias] = cursor.fetchone() is not None
+    return _pg_trgm[connection.alias]
+
+
+def _parecidas_pg(nombres):
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_PARECIDAS, [nombres])
+        return {nombre: (rut, nombre_empresa, valor) for nombre, rut, nombre_empresa, valor in cursor.fetchall()}
+
+
+class IndiceEmpresas:
+    """
+    Sin pg_trgm: índice invertido trigrama -> empresas registradas, armado con
+    una consulta. `parecidas(nombres)` compara cada nombre solo contra las
+    empresas con las que comparte algún trigrama.
+    """
+
+    def __init__(self):
+        self.empresas = list(
+            Empresa.objects.order_by('empresa_rut').values_list('empresa_rut', 'nombre_empresa', 'nombre_normalizado')
+        )
+        self.trigramas = [trigramas(normalizado) for _, _, normalizado in self.empresas]
+        self.indice = defaultdict(list)
+        for posicion, grupo in enumerate(self.trigramas):
+            for trigrama in grupo:
+                self.indice[trigrama].append(posicion)
+
+    def parecidas(self, nombres):
+        parecidas = {}
+        for nombre in nombres:
+            grupo = trigramas(nombre)
+            comunes = Counter(posicion for trigrama in grupo for posicion in self.indice.get(trigrama, ()))
+            mejor, posicion = max(
+                ((cantidad / (len(grupo) + len(self.trigramas[p]) - cantidad), -p) for p, cantidad in comunes.items()),
+                default=(0.0, None),
+            )
+            if mejor >= SIMILITUD_MINIMA:
+                rut, nombre_empresa, _ = self.empresas[-posicion]
+                parecidas[nombre] = (rut, nombre_empresa, mejor)
+        return parecidas
+
+
+class BuscadorParecidas:
+    """
+    Retorna {nombre: (rut, nombre_empresa, similitud)} con la empresa
+    registrada de nombre más parecido a cada nombre recibido (ya normalizado
+    con normalizar_nombre_empresa), para los que alguna alcanza
+    SIMILITUD_MINIMA. En PostgreSQL con pg_trgm se resuelven todos en una
+    consulta que usa el índice de trigramas; si no, se comparan en memoria con
+    un IndiceEmpresas que se arma en la primera búsqueda y se reutiliza en las
+    siguientes. Se crea uno por lote (o ingesta) y se llama en cada bloque.
+    """
+
+    def __init__(self):
+        self._indice = None
+
+    def __call__(self, nombres):
+        nombres = [n for n in dict.fromkeys(nombres) if n]
+        if not nombres:
+            return {}
+        if _usa_pg_trgm():
+            return _parecidas_pg(nombres)
+        if self._indice is None:
+            self._indice = IndiceEmpresas()
+        return self._indice.parecidas(nombres)
+
@@ -0,0 +1,54 @@
+class FilaCalificacion:
+    """
+    Una fila de la carga masiva mientras pasa por el pipeline (lectura,
+    validación, staging y guardado). Usa __slots__ en vez de un dict por fila:
+    no repite las claves en cada fila y ocupa bastante menos memoria en
+    archivos grandes (ver `benchmark_carga_masiva --memoria`).
+
+    `huella` identifica los datos normalizados (duplicados) y `hash_contenido`
+    el contenido tal como venía en el archivo (reutilizar la validación de una
+    carga anterior, ver reutilizacion.py).
+
+    `errores` es una tupla (compartida y vacía en las filas válidas); para
+    agregar un error se usa agregar_error, que además invalida la fila.
+    """
+
+    __slots__ = (
+        'fila', 'rut_empresa', 'nombre_empresa', 'anio_tributario', 'tipo_calificacion',
+        'monto_tributario', 'factor_tributario', 'unidad_valor', 'puntaje_calificacion',
+        'categoria_calificacion', 'nivel_riesgo', 'justificacion_resultado', 'huella',
+        'hash_contenido', 'errores', 'valido',
+    )
+
+    def __init__(self, fila, rut_empresa, nombre_empresa, anio_tributario, tipo_calificacion,
+                 monto_tributario, factor_tributario, unidad_valor, puntaje_calificacion,
+                 categoria_calificacion, nivel_riesgo, justificacion_resultado, huella='',
+                 hash_contenido='', errores=()):
+        self.fila = fila
+        self.rut_empresa = rut_empresa
+        self.nombre_empresa = nombre_empresa
+        self.anio_tributario = anio_tributario
+        self.tipo_calificacion = tipo_calificacion
+        self.monto_tributario = monto_tributario
+        self.factor_tributario = factor_tributario
+        self.unidad_valor = unidad_valor
+        self.puntaje_calificacion = puntaje_calificacion
+        self.categoria_calificacion = categoria_calificacion
+        self.nivel_riesgo = nivel_riesgo
+        self.justificacion_resultado = justificacion_resultado
+        self.huella = huella
+        self.hash_contenido = hash_contenido
+        self.errores = tuple(errores)
+        self.valido = not self.errores
+
+    def agregar_error(self, mensaje):
+        self.errores += (mensaje,)
+        self.valido = False
+
+    def __repr__(self):
+        return f'<FilaCalificacion {self.fila} {"válida" if self.valido else "con errores"}>'
+
+
+# Campos de FilaCalificacion que se guardan en el staging (FilaCargaMasiva),
+# en el orden del constructor
+CAMPOS_FILA = list(FilaCalificacion.__slots__[:14])
@@ -0,0 +1,218 @@
+import csv
+import io
+import logging
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, connection, transaction
+from django.utils import timezone
+
+from ..models import CalificacionTributaria
+from .duplicados import huellas_existentes
+from .empresas import empresas_por_rut
+from .huella import huella_de_dato
+
+logger = logging.getLogger(__name__)
+
+TABLA = CalificacionTributaria._meta.db_table
+
+# Columnas de calificacion_tributaria que escribe la carga masiva
+COLUMNAS_CALIFICACION = [
+    'cuenta_id', 'empresa_rut', 'nombre_empresa', 'anio_tributario',
+    'tipo_calificacion', 'monto_tributario', 'factor_tributario',
+    'unidad_valor', 'puntaje_calificacion', 'categoria_calificacion',
+    'nivel_riesgo', 'justificacion_resultado', 'metodo_calificacion',
+    'estado_calificacion', 'fecha_calculo', 'huella',
+    'revisado_por', 'observacion_revision',
+]
+
+# En CSV un campo vacío sin comillas es NULL; en estas columnas de texto debe
+# llegar como cadena vacía
+COLUMNAS_TEXTO = [
+    'nombre_empresa', 'tipo_calificacion', 'unidad_valor', 'justificacion_resultado', 'huella',
+    'revisado_por', 'observacion_revision',
+]
+
+
+def usa_copy(cursor):
+    # COPY solo existe en PostgreSQL (psycopg2); en otros motores, como
+    # SQLite en pruebas, se usan INSERT parametrizados en lote
+    return connection.vendor == 'postgresql' and hasattr(cursor.cursor, 'copy_expert')
+
+
+def escribir_filas(cursor, tabla, columnas, tuplas, columnas_texto=()):
+    """
+    Inserta las tuplas en la tabla con un solo COPY ... FROM STDIN en
+    PostgreSQL, o con executemany en los demás motores. `columnas_texto` son
+    las columnas donde un valor vacío es cadena vacía y no NULL (solo COPY).
+    """
+    if usa_copy(cursor):
+        opciones = 'FORMAT csv'
+        if columnas_texto:
+            opciones += f", FORCE_NOT_NULL ({', '.join(columnas_texto)})"
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(tuplas)
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN WITH ({opciones})", buffer)
+    else:
+        cursor.executemany(
+            f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join(['%s'] * len(columnas))})",
+            tuplas
+        )
+
+
+def cumple_modelo(dato, estado):
+    """
+    Revalida una fila con las reglas de CalificacionTributaria (validadores,
+    choices y clean()) como lo haría full_clean(), pero sin sus consultas.
+    """
+    calificacion = CalificacionTributaria(
+        anio_tributario=dato.anio_tributario,
+        tipo_calificacion=dato.tipo_calificacion,
+        monto_tributario=dato.monto_tributario,
+        factor_tributario=dato.factor_tributario,
+        unidad_valor=dato.unidad_valor,
+        puntaje_calificacion=dato.puntaje_calificacion,
+        categoria_calificacion=dato.categoria_calificacion,
+        nivel_riesgo=dato.nivel_riesgo,
+        justificacion_resultado=dato.justificacion_resultado,
+        metodo_calificacion='masiva',
+        estado_calificacion=estado,
+    )
+    try:
+        calificacion.clean_fields(exclude=['cuenta_id', 'rut_empresa'])
+        calificacion.clean()
+    except ValidationError:
+        return False
+    return True
+
+
+def guardar_calificaciones(filas, cuenta_id, estado, tamano=5000, validar_filas=False, rechazadas=None):
+    """
+    Inserta las filas válidas (FilaCalificacion) como calificaciones masivas, de a
+    `tamano` filas: resuelve las empresas de cada parte con una consulta y la
+    escribe con COPY (PostgreSQL) o executemany. Se omiten las filas que la
+    cuenta ya tiene importadas (misma huella) y las filas cuya empresa ya no
+    existe; estas últimas se agregan a `rechazadas` (si se pasa una lista)
+    como (FilaCalificacion, mensaje), para informarlas como errores.
+
+    Por defecto la carga es confiable: las filas ya se validaron al subir el
+    archivo y los CHECK de calificacion_tributaria garantizan los valores (una
+    fila que no cumpla hace fallar la parte con IntegrityError). Con
+    `validar_filas` además se revalida cada fila con cumple_modelo y las que no
+    cumplen también se omiten y se agregan a `rechazadas`.
+    Debe llamarse dentro de una transacción (ver guardar_separando_rechazadas
+    para no perder la parte completa por una fila).
+    Retorna (guardadas, segundos).
+    """
+    inicio = time.perf_counter()
+    guardadas = 0
+    filas = iter(filas)
+
+    with connection.cursor() as cursor:
+        usar_copy = usa_copy(cursor)
+        fecha = timezone.now()
+        fecha = fecha.isoformat() if usar_copy else connection.ops.adapt_datetimefield_value(fecha)
+        while True:
+            parte = list(islice(filas, tamano))
+            if not parte:
+                break
+            empresas = empresas_por_rut(dato.rut_empresa for dato in parte)
+            # Se vuelve a revisar por si otra carga guardó las mismas calificaciones
+            # después de la validación
+            for dato in parte:
+                dato.huella = dato.huella or huella_de_dato(dato)
+            ya_importadas = huellas_existentes(cuenta_id, {dato.huella for dato in parte})
+            if validar_filas:
+                cumplen = []
+                for dato in parte:
+                    if cumple_modelo(dato, estado):
+                        cumplen.append(dato)
+                    elif rechazadas is not None:
+                        rechazadas.append((dato, 'La fila no cumple las reglas de la calificación tributaria.'))
+                if len(cumplen) < len(parte):
+                    logger.warning('Carga masiva: %s filas no cumplen las reglas del modelo y se omiten',
+                                   len(parte) - len(cumplen))
+                parte = cumplen
+            sin_empresa = [dato for dato in parte if dato.rut_empresa not in empresas]
+            if sin_empresa:
+                logger.warning('Carga masiva: %s filas con empresas eliminadas después de validarlas se omiten',
+                               len(sin_empresa))
+                if rechazadas is not None:
+                    rechazadas.extend(
+                        (dato, f'La empresa con RUT {dato.rut_empresa} ya no está registrada.') for dato in sin_empresa
+                    )
+            tuplas = [
+                (
+                    cuenta_id,
+                    dato.rut_empresa,
+                    empresas[dato.rut_empresa],
+                    dato.anio_tributario,
+                    dato.tipo_calificacion,
+                    dato.monto_tributario,
+                    dato.factor_tributario,
+                    dato.unidad_valor,
+                    dato.puntaje_calificacion,
+                    dato.categoria_calificacion,
+                    dato.nivel_riesgo,
+                    dato.justificacion_resultado or '',
+                    'masiva',
+                    estado,
+                    fecha,
+                    dato.huella,
+                    '',  # revisado_por: aún sin revisión
+                    '',  # observacion_revision
+                )
+                for dato in parte
+                if dato.rut_empresa in empresas and dato.huella not in ya_importadas
+            ]
+            escribir_filas(cursor, TABLA, COLUMNAS_CALIFICACION, tuplas, COLUMNAS_TEXTO)
+            guardadas += len(tuplas)
+
+    segundos = time.perf_counter() - inicio
+    logger.info(
+        'Carga masiva: %s calificaciones guardadas en %.2fs (%.0f filas/s, %s)',
+        guardadas, segundos, guardadas / segundos if segundos else 0,
+        'COPY' if usar_copy else 'executemany'
+    )
+    return guardadas, segundos
+
+
+def guardar_separando_rechazadas(parte, cuenta_id, estado, validar_filas=False):
+    """
+    Guarda una parte de filas con guardar_calificaciones dentro de un
+    savepoint. Si la BD la rechaza (un CHECK, un largo máximo), la divide en
+    mitades, cada una en su propio savepoint, hasta aislar las filas que
+    fallan; el resto se guarda igual. Debe llamarse dentro de una transacción.
+    Retorna (guardadas, segundos, rechazadas), con rechazadas una lista de
+    (FilaCalificacion, mensaje) con las filas que la BD rechazó y las que
+    guardar_calificaciones omitió (empresa eliminada, reglas del modelo).
+    """
+    inicio = time.perf_counter()
+    rechazadas = []
+
+    def guardar(filas):
+        # Las omitidas se cuentan solo si la parte se confirma; si falla se
+        # vuelven a revisar al reintentar cada mitad
+        omitidas = []
+        try:
+            with transaction.atomic():
+                guardadas = guardar_calificaciones(
+                    filas, cuenta_id, estado, len(filas) or 1, validar_filas, omitidas
+                )[0]
+        except (IntegrityError, DataError) as e:
+            # Solo errores de los datos: uno de conexión sí debe hacer fallar la parte
+            if len(filas) == 1:
+                mensaje = (str(e).strip() or type(e).__name__).splitlines()[0]
+                rechazadas.append((filas[0], f'La base de datos rechazó la fila: {mensaje}'))
+                return 0
+            mitad = len(filas) // 2
+            return guardar(filas[:mitad]) + guardar(filas[mitad:])
+        rechazadas.extend(omitidas)
+        return guardadas
+
+    guardadas = guardar(list(parte)) if parte else 0
+    if rechazadas:
+        logger.warning('Carga masiva: %s filas no se guardaron; se pasan a errores', len(rechazadas))
+    return guardadas, time.perf_counter() - inicio, rechazadas
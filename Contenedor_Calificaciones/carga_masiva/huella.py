@@ -0,0 +1,45 @@
+import hashlib
+
+
+def calcular_huella(rut_empresa, anio_tributario, tipo_calificacion, monto_tributario,
+                    factor_tributario, unidad_valor, puntaje_calificacion,
+                    categoria_calificacion, nivel_riesgo):
+    """
+    Huella (sha256 en hex) del contenido de una calificación: dos calificaciones
+    con los mismos datos tienen la misma huella aunque difieran en mayúsculas,
+    espacios o en cómo se escribió el número. No incluye la justificación ni
+    el nombre de la empresa (se deriva del RUT).
+
+    No depende de la BD ni de Django: la usan el modelo, la carga masiva y la
+    migración que rellena las calificaciones existentes.
+    """
+    def texto(valor):
+        return ' '.join(str(valor or '').split()).casefold()
+
+    def numero(valor):
+        return '' if valor is None else f'{float(valor):.6f}'
+
+    def entero(valor):
+        return '' if valor is None else str(int(valor))
+
+    partes = [
+        texto(rut_empresa),
+        entero(anio_tributario),
+        texto(tipo_calificacion),
+        numero(monto_tributario),
+        numero(factor_tributario),
+        texto(unidad_valor),
+        entero(puntaje_calificacion),
+        texto(categoria_calificacion),
+        texto(nivel_riesgo),
+    ]
+    return hashlib.sha256('\x1f'.join(partes).encode('utf-8')).hexdigest()
+
+
+def huella_de_dato(dato):
+    """Huella de una fila de la carga masiva (FilaCalificacion)."""
+    return calcular_huella(
+        dato.rut_empresa, dato.anio_tributario, dato.tipo_calificacion,
+        dato.monto_tributario, dato.factor_tributario, dato.unidad_valor,
+        dato.puntaje_calificacion, dato.categoria_calificacion, dato.nivel_riesgo,
+    )
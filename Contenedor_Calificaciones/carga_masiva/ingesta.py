@@ -0,0 +1,174 @@
+import codecs
+import json
+from itertools import islice
+
+import pandas as pd
+from django.db import transaction
+
+from .bloqueos import bloqueo_cuenta
+from .duplicados import MENSAJE_YA_IMPORTADA, huellas_existentes
+from .empresas import BuscadorParecidas, empresas_por_rut
+from .guardado import guardar_calificaciones
+from .huella import huella_de_dato
+from .lectores import COLUMNAS_PLANTILLA
+from .validacion import validar_bloque
+
+# Ingesta por API: el cuerpo del request es NDJSON (un objeto por línea) o un
+# arreglo JSON de objetos con las claves de COLUMNAS_PLANTILLA. Se lee de a
+# poco, se valida por bloques con las mismas reglas que la carga por archivo y
+# cada bloque se guarda en su propia transacción. El resultado de cada
+# registro se entrega apenas se procesa su bloque.
+
+TAMANO_LECTURA = 64 * 1024
+ESPACIOS = ' \t\r\n'
+
+
+def _leer_inicio(flujo):
+    # Lee hasta el primer carácter que no es espacio (o BOM) para saber el formato
+    inicio = b''
+    while True:
+        datos = flujo.read(TAMANO_LECTURA)
+        if not datos:
+            return inicio, ''
+        inicio += datos
+        contenido = inicio.lstrip(codecs.BOM_UTF8 + ESPACIOS.encode())
+        if contenido:
+            return inicio, chr(contenido[0])
+
+
+def _registros_ndjson(inicio, flujo):
+    resto = inicio
+    numero = 0
+    while True:
+        datos = flujo.read(TAMANO_LECTURA)
+        lineas = (resto + datos).split(b'\n')
+        resto = lineas.pop() if datos else b''
+        for linea in lineas:
+            numero += 1
+            if linea.strip():
+                try:
+                    yield numero, json.loads(linea)
+                except ValueError as e:
+                    yield numero, f'JSON inválido: {e}'
+        if not datos:
+            return
+
+
+def _registros_arreglo(inicio, flujo):
+    decodificador = codecs.getincrementaldecoder('utf-8-sig')()
+    json_decoder = json.JSONDecoder()
+    texto = decodificador.decode(inicio).lstrip(ESPACIOS)[1:]
+    posicion = 0
+    fin_flujo = False
+    numero = 0
+    while True:
+        # Saltar espacios y la coma entre elementos
+        while posicion < len(texto) and texto[posicion] in ESPACIOS + ',':
+            posicion += 1
+        if posicion < len(texto) and texto[posicion] == ']':
+            return
+        try:
+            if posicion >= len(texto):
+                raise json.JSONDecodeError('Fin del contenido', texto, posicion)
+            registro, posicion = json_decoder.raw_decode(texto, posicion)
+        except json.JSONDecodeError as e:
+            if fin_flujo:
+                yield numero + 1, f'JSON inválido: {e.msg}'
+                return
+            # El elemento puede estar cortado entre dos lecturas: leer más
+            datos = flujo.read(TAMANO_LECTURA)
+            fin_flujo = not datos
+            texto = texto[posicion:] + decodificador.decode(datos, final=fin_flujo)
+            posicion = 0
+            continue
+        numero += 1
+        yield numero, registro
+
+
+def leer_registros(flujo):
+    """
+    Genera (numero, registro) por cada elemento del cuerpo, leyéndolo de a
+    TAMANO_LECTURA bytes. `numero` es la línea (NDJSON) o la posición en el
+    arreglo (JSON); si el elemento no se pudo leer, `registro` es el mensaje
+    de error. En un arreglo mal formado se informa el error y se deja de leer.
+    """
+    inicio, primer_caracter = _leer_inicio(flujo)
+    if primer_caracter == '[':
+        return _registros_arreglo(inicio, flujo)
+    return _registros_ndjson(inicio, flujo)
+
+
+def _armar_bloque(registros):
+    # Mismo formato que los bloques de los lectores de archivos
+    return pd.DataFrame(
+        [[numero, *(registro.get(clave) for clave in COLUMNAS_PLANTILLA)] for numero, registro in registros],
+        columns=['fila', *COLUMNAS_PLANTILLA],
+        dtype=object,
+    )
+
+
+def _procesar_bloque(leidos, cuenta_id, estado, vistas, buscar_parecidas):
+    # Separa los registros que no son objetos y valida el resto
+    resultados = {}
+    registros = []
+    for numero, registro in leidos:
+        if isinstance(registro, str):
+            resultados[numero] = {'linea': numero, 'estado': 'error', 'errores': [registro]}
+        elif not isinstance(registro, dict):
+            resultados[numero] = {'linea': numero, 'estado': 'error', 'errores': ['Se esperaba un objeto JSON.']}
+        else:
+            registros.append((numero, registro))
+
+    datos = validar_bloque(_armar_bloque(registros), empresas_por_rut, buscar_parecidas) if registros else []
+    validos = [dato for dato in datos if dato.valido]
+    for dato in validos:
+        dato.huella = huella_de_dato(dato)
+    ya_importadas = huellas_existentes(cuenta_id, {dato.huella for dato in validos})
+
+    nuevos = []
+    for dato in datos:
+        resultado = {'linea': dato.fila, 'estado': 'error', 'errores': list(dato.errores)}
+        if dato.valido:
+            if dato.huella in ya_importadas:
+                resultado.update(estado='duplicada', errores=[MENSAJE_YA_IMPORTADA])
+            elif dato.huella in vistas:
+                resultado.update(estado='duplicada', errores=['Registro repetido dentro del mismo envío.'])
+            else:
+                vistas.add(dato.huella)
+                nuevos.append(dato)
+                resultado['estado'] = 'creada'
+        resultados[dato.fila] = resultado
+
+    if nuevos:
+        # Empresas eliminadas entre la validación y el guardado
+        omitidas = []
+        with transaction.atomic():
+            guardar_calificaciones(nuevos, cuenta_id, estado, rechazadas=omitidas)
+        for dato, mensaje in omitidas:
+            resultados[dato.fila].update(estado='error', errores=[mensaje])
+    return [resultados[numero] for numero, _ in leidos]
+
+
+def ingerir(flujo, cuenta_id, estado, tamano=1000):
+    """
+    Lee, valida y guarda los registros del flujo de a `tamano` y genera el
+    resultado de cada uno ({'linea', 'estado', 'errores'}, con estado
+    'creada', 'duplicada' o 'error'). Al final genera {'resumen': {...}}.
+    Si otra carga de la cuenta está guardando lanza bloqueos.CuentaOcupada.
+    """
+    registros = leer_registros(flujo)
+    resumen = {'creada': 0, 'duplicada': 0, 'error': 0}
+    # Huellas guardadas en esta ingesta, para no repetir registros del mismo cuerpo
+    vistas = set()
+    buscar_parecidas = BuscadorParecidas()
+    with bloqueo_cuenta(cuenta_id, esperar=False):
+        while True:
+            leidos = list(islice(registros, tamano))
+            if not leidos:
+                break
+            for resultado in _procesar_bloque(leidos, cuenta_id, estado, vistas, buscar_parecidas):
+                resumen[resultado['estado']] += 1
+                yield resultado
+    yield {'resumen': {
+        'creadas': resumen['creada'], 'duplicadas': resumen['duplicada'], 'con_errores': resumen['error'],
+    }}
@@ -0,0 +1,352 @@
+import codecs
+import csv
+import io
+import os
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from openpyxl import load_workbook
+
+# Columnas de la plantilla Plantilla_Carga_Masiva_Nuam.xlsx.
+# Cada clave interna acepta varios nombres (toleran variaciones de tildes),
+# el primero es el nombre oficial que se muestra cuando la columna falta.
+COLUMNAS_PLANTILLA = {
+    'rut_empresa': ['RUT de la Empresa'],
+    'nombre_empresa': ['Nombre de la Empresa'],
+    'anio_tributario': ['Año Tributario'],
+    'tipo_calificacion': ['Tipo de Calificación', 'Tipo de Calificacion'],
+    'monto_tributario': ['Monto Tributario'],
+    'factor_tributario': ['Factor Tributario'],
+    'unidad_valor': ['Unidad de Valor'],
+    'puntaje_calificacion': ['Puntaje de Calificación', 'Puntaje de Calificacion'],
+    'categoria_calificacion': ['Categoría de la Calificación', 'Categoria de la Calificación', 'Categoría de la Calificacion', 'Categoria de la Calificacion'],
+    'nivel_riesgo': ['Nivel de Riesgo'],
+    'justificacion_resultado': ['Justificación del resultado (Observaciones)', 'Justificacion del resultado (Observaciones)'],
+}
+
+# Formatos que acepta la carga masiva
+EXTENSIONES_PERMITIDAS = ('.xlsx', '.xls', '.csv', '.ods', '.parquet')
+
+
+def encontrar_columna(columnas, posibles_nombres):
+    # Devuelve el primer nombre de la lista que exista entre las columnas
+    for nombre in posibles_nombres:
+        if nombre in columnas:
+            return nombre
+    return None
+
+
+def mapear_columnas(encabezados):
+    """
+    Relaciona cada columna de la plantilla con su posición en el encabezado.
+    Retorna (indices, faltantes) donde faltantes son los nombres oficiales
+    de las columnas que no se encontraron.
+    """
+    encabezados = [str(e).strip() if e is not None else '' for e in encabezados]
+    indices = {}
+    faltantes = []
+    for clave, posibles_nombres in COLUMNAS_PLANTILLA.items():
+        nombre = encontrar_columna(encabezados, posibles_nombres)
+        if nombre is None:
+            faltantes.append(posibles_nombres[0])
+        else:
+            indices[clave] = encabezados.index(nombre)
+    return indices, faltantes
+
+
+class LectorExcel:
+    """
+    Lee la primera hoja de un Excel fila por fila con openpyxl en modo
+    read_only, sin cargar el libro completo en memoria.
+    """
+
+    def __init__(self, origen):
+        self._libro = load_workbook(origen, read_only=True, data_only=True)
+        hoja = self._libro.worksheets[0]
+        # En modo read_only openpyxl confía en las dimensiones guardadas en el
+        # archivo; algunas planillas las traen mal y se perderían filas.
+        hoja.reset_dimensions()
+        self._filas = self._iterar(hoja)
+        encabezados = next(self._filas, None)
+        self.vacio = encabezados is None
+        self.indices, self.columnas_faltantes = mapear_columnas(encabezados or [])
+
+    def _iterar(self, hoja):
+        return hoja.iter_rows(values_only=True)
+
+    def _valor(self, valor):
+        return valor
+
+    def filas(self):
+        """
+        Genera tuplas (numero_fila, valores) donde numero_fila es la fila real
+        en la planilla (el encabezado es la fila 1) y valores es un dict con las
+        claves de COLUMNAS_PLANTILLA. Las celdas vacías vienen como None.
+        """
+        for numero_fila, fila in enumerate(self._filas, start=2):
+            largo = len(fila)
+            yield numero_fila, {
+                clave: self._valor(fila[indice]) if indice < largo else None
+                for clave, indice in self.indices.items()
+            }
+
+    def bloques(self, tamano):
+        """
+        Agrupa las filas en DataFrames de hasta `tamano` filas, con la columna
+        'fila' y las claves de COLUMNAS_PLANTILLA. Omite las filas sin RUT.
+        Así la validación trabaja por columnas sin tener todo el archivo en memoria.
+        """
+        columnas = ['fila', *COLUMNAS_PLANTILLA]
+        bloque = []
+        for numero_fila, valores in self.filas():
+            rut = valores.get('rut_empresa')
+            if rut is None or str(rut).strip() == '':
+                continue
+            valores['fila'] = numero_fila
+            bloque.append(valores)
+            if len(bloque) >= tamano:
+                yield pd.DataFrame.from_records(bloque, columns=columnas)
+                bloque = []
+        if bloque:
+            yield pd.DataFrame.from_records(bloque, columns=columnas)
+
+    def cerrar(self):
+        self._libro.close()
+
+
+class LectorCalamine(LectorExcel):
+    """
+    Lector alternativo usando python-calamine (implementado en Rust), bastante
+    más rápido que openpyxl y que además soporta .xls. Es opcional: si el
+    paquete no está instalado se usa LectorExcel.
+    """
+
+    def __init__(self, origen):
+        from python_calamine import CalamineWorkbook
+
+        if isinstance(origen, str):
+            self._libro = CalamineWorkbook.from_path(origen)
+        else:
+            self._libro = CalamineWorkbook.from_filelike(origen)
+        self._filas = self._iterar(self._libro.get_sheet_by_index(0))
+        encabezados = next(self._filas, None)
+        self.vacio = encabezados is None
+        self.indices, self.columnas_faltantes = mapear_columnas(encabezados or [])
+
+    def _iterar(self, hoja):
+        return iter(hoja.iter_rows())
+
+    def _valor(self, valor):
+        # calamine entrega '' para las celdas vacías
+        return None if valor == '' else valor
+
+    def cerrar(self):
+        cerrar = getattr(self._libro, 'close', None)
+        if cerrar:
+            cerrar()
+
+
+def armar_bloque(tabla, posiciones, fila_inicial):
+    """
+    Arma un bloque con el formato de LectorExcel.bloques a partir de un
+    DataFrame con las columnas del archivo: toma las columnas por posición,
+    numera las filas desde `fila_inicial` y omite las que no traen RUT.
+    """
+    bloque = pd.DataFrame(
+        {clave: tabla.iloc[:, posicion].to_numpy(dtype=object) for clave, posicion in posiciones.items()}
+    )
+    bloque.insert(0, 'fila', np.arange(fila_inicial, fila_inicial + len(tabla)))
+    rut = bloque['rut_empresa']
+    con_rut = rut.notna().to_numpy() & (rut.astype(str).str.strip() != '').to_numpy()
+    return bloque[con_rut].reset_index(drop=True)
+
+
+class LectorTabla:
+    """
+    Base de los lectores que entregan el archivo directamente en DataFrames
+    (CSV, ODS, Parquet) en vez de fila por fila. Las subclases implementan
+    _tablas(tamano) y llaman a _iniciar con los encabezados.
+    """
+
+    def _iniciar(self, encabezados):
+        self.vacio = not encabezados
+        self.indices, self.columnas_faltantes = mapear_columnas(encabezados or [])
+        # Posición de cada columna dentro de los DataFrames que entrega _tablas
+        self._posiciones = self.indices
+
+    def _tablas(self, tamano):
+        raise NotImplementedError
+
+    def bloques(self, tamano):
+        fila = 2  # el encabezado es la fila 1, igual que en las planillas
+        for tabla in self._tablas(tamano):
+            bloque = armar_bloque(tabla, self._posiciones, fila)
+            fila += len(tabla)
+            if len(bloque):
+                yield bloque
+
+    def cerrar(self):
+        pass
+
+
+def _leer_muestra(origen, tamano=64 * 1024):
+    # Primeros bytes del archivo, sin perder la posición si es un objeto archivo
+    if isinstance(origen, (str, os.PathLike)):
+        with open(origen, 'rb') as f:
+            return f.read(tamano)
+    muestra = origen.read(tamano)
+    origen.seek(0)
+    return muestra
+
+
+class LectorCSV(LectorTabla):
+    """
+    Lee un CSV por partes con pandas (read_csv con chunksize). Detecta el
+    separador (, ; tab |) y la codificación (UTF-8 o Latin-1, la que usa
+    Excel en Windows al exportar).
+    """
+
+    def __init__(self, origen):
+        self._origen = origen
+        muestra = _leer_muestra(origen)
+        try:
+            # Decodificador incremental: si la muestra corta un carácter
+            # multibyte al final, esos bytes quedan pendientes en vez de fallar
+            texto = codecs.getincrementaldecoder('utf-8-sig')().decode(muestra, final=False)
+            self._codificacion = 'utf-8-sig'
+        except UnicodeDecodeError:
+            texto = muestra.decode('latin-1')
+            self._codificacion = 'latin-1'
+        try:
+            self._separador = csv.Sniffer().sniff(texto.split('\n', 1)[0], delimiters=',;\t|').delimiter
+        except csv.Error:
+            self._separador = ','
+        self._iniciar(next(csv.reader(io.StringIO(texto), delimiter=self._separador), None))
+
+    def _tablas(self, tamano):
+        # Todo se lee como texto: la validación convierte los números
+        return pd.read_csv(
+            self._origen, sep=self._separador, encoding=self._codificacion,
+            dtype=str, keep_default_na=False, na_values=[''],
+            skip_blank_lines=False, chunksize=tamano,
+        )
+
+
+class LectorODS(LectorTabla):
+    """
+    Lee una planilla OpenDocument (.ods) con pandas y odfpy. odfpy no permite
+    leer por partes, así que la hoja se carga completa; por eso abrir_archivo
+    rechaza los .ods de más de CARGA_MASIVA_MAX_ODS_MB.
+    """
+
+    def __init__(self, origen):
+        try:
+            hoja = pd.read_excel(origen, engine='odf', header=None, dtype=object)
+        except ImportError:
+            raise ValueError('Para leer archivos .ods se requiere el paquete odfpy o python-calamine.')
+        self._hoja = hoja.iloc[1:]
+        self._iniciar(hoja.iloc[0].tolist() if len(hoja) else None)
+
+    def _tablas(self, tamano):
+        for inicio in range(0, len(self._hoja), tamano):
+            yield self._hoja.iloc[inicio:inicio + tamano]
+
+
+class LectorParquet(LectorTabla):
+    """
+    Lee un archivo Parquet por grupos de filas con pyarrow, cargando solo las
+    columnas de la plantilla (el formato es columnar, el resto no se lee).
+    """
+
+    def __init__(self, origen):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError('Para leer archivos Parquet se requiere el paquete pyarrow.')
+        self._archivo = pq.ParquetFile(origen)
+        nombres = self._archivo.schema_arrow.names
+        self._iniciar(nombres)
+        self._columnas = [nombres[indice] for indice in self.indices.values()]
+        self._posiciones = {clave: posicion for posicion, clave in enumerate(self.indices)}
+
+    def _tablas(self, tamano):
+        for lote in self._archivo.iter_batches(batch_size=tamano, columns=self._columnas):
+            yield lote.to_pandas()
+
+    def cerrar(self):
+        self._archivo.close()
+
+
+MOTORES_EXCEL = {
+    'openpyxl': LectorExcel,
+    'calamine': LectorCalamine,
+}
+
+
+def _tamano(origen):
+    # Bytes del archivo, sea una ruta o un objeto archivo
+    if isinstance(origen, (str, os.PathLike)):
+        return os.path.getsize(origen)
+    posicion = origen.tell()
+    tamano = origen.seek(0, os.SEEK_END)
+    origen.seek(posicion)
+    return tamano
+
+
+def _origen(archivo):
+    # Si Django ya guardó el archivo en disco (TemporaryUploadedFile) se lee
+    # directamente desde esa ruta en vez de pasar por memoria
+    if hasattr(archivo, 'temporary_file_path'):
+        return archivo.temporary_file_path()
+    if hasattr(archivo, 'seek'):
+        archivo.seek(0)
+    return archivo
+
+
+def abrir_excel(archivo, motor=None):
+    """
+    Abre el archivo subido con el motor configurado en CARGA_MASIVA_MOTOR_EXCEL.
+    """
+    motor = motor or getattr(settings, 'CARGA_MASIVA_MOTOR_EXCEL', 'openpyxl')
+    origen = _origen(archivo)
+
+    lector = MOTORES_EXCEL.get(motor, LectorExcel)
+    if lector is LectorCalamine:
+        try:
+            return LectorCalamine(origen)
+        except ImportError:
+            lector = LectorExcel
+    return lector(origen)
+
+
+def abrir_archivo(archivo, motor=None):
+    """
+    Abre un archivo de carga masiva (ruta o archivo subido) con el lector que
+    corresponde a su extensión. Todos los lectores exponen lo mismo: vacio,
+    columnas_faltantes, bloques(tamano) y cerrar().
+    """
+    nombre = archivo if isinstance(archivo, str) else getattr(archivo, 'name', '')
+    extension = os.path.splitext(nombre)[1].lower()
+
+    if extension in ('.xlsx', '.xls'):
+        return abrir_excel(archivo, motor)
+    origen = _origen(archivo)
+    if extension == '.csv':
+        return LectorCSV(origen)
+    if extension == '.ods':
+        # Las planillas ODS se leen completas en memoria (el XML del libro no
+        # se puede recorrer por partes), así que se limita su tamaño
+        maximo_mb = settings.CARGA_MASIVA_MAX_ODS_MB
+        if _tamano(origen) > maximo_mb * 1024 * 1024:
+            raise ValueError(
+                f'Los archivos .ods pueden pesar máximo {maximo_mb} MB; '
+                'para archivos más grandes use .xlsx o .csv.'
+            )
+        try:
+            return LectorCalamine(origen)
+        except ImportError:
+            return LectorODS(origen)
+    if extension == '.parquet':
+        return LectorParquet(origen)
+    raise ValueError(f'Formato de archivo no soportado: {extension or nombre}')
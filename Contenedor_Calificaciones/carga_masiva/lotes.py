@@ -0,0 +1,241 @@
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ..models import EnvioIdempotente, FilaCargaMasiva, LoteCargaMasiva, SubidaFragmentada
+from .filas import CAMPOS_FILA, FilaCalificacion
+from .guardado import escribir_filas
+
+# Rango de una columna integer en la BD; los valores fuera de él solo pueden
+# venir de filas con errores y se guardan como NULL
+ENTERO_MIN, ENTERO_MAX = -2**31, 2**31 - 1
+
+TABLA_FILAS = FilaCargaMasiva._meta.db_table
+
+# Estados en que un lote está en la cola o lo está procesando una tarea
+ESTADOS_EN_PROCESO = ('en_cola', 'validando', 'por_guardar', 'guardando')
+
+COLUMNAS_STAGING = ['lote_id', *CAMPOS_FILA, 'errores', 'valido']
+COLUMNAS_STAGING_TEXTO = [
+    'rut_empresa', 'nombre_empresa', 'tipo_calificacion', 'unidad_valor', 'justificacion_resultado', 'huella',
+    'hash_contenido',
+]
+
+
+def _entero(valor):
+    if valor is None or not ENTERO_MIN <= valor <= ENTERO_MAX:
+        return None
+    return valor
+
+
+def _tupla_staging(lote_id, dato):
+    return (
+        lote_id,
+        dato.fila,
+        dato.rut_empresa or '',
+        dato.nombre_empresa or '',
+        _entero(dato.anio_tributario),
+        dato.tipo_calificacion or '',
+        dato.monto_tributario,
+        dato.factor_tributario,
+        dato.unidad_valor or '',
+        _entero(dato.puntaje_calificacion),
+        dato.categoria_calificacion,
+        dato.nivel_riesgo,
+        dato.justificacion_resultado or '',
+        dato.huella or '',
+        dato.hash_contenido or '',
+        json.dumps(dato.errores),
+        dato.valido,
+    )
+
+
+def borrar_archivo(lote):
+    """Elimina la copia en disco del archivo subido, si todavía existe."""
+    if lote.archivo_ruta and os.path.exists(lote.archivo_ruta):
+        os.remove(lote.archivo_ruta)
+
+
+def limpiar_lotes_vencidos():
+    """
+    Elimina los lotes (sus filas y archivos), las subidas por partes y las
+    claves de idempotencia con más de CARGA_MASIVA_RETENCION_HORAS de
+    antigüedad, se hayan guardado o no. Los lotes que siguen en cola o en
+    proceso se conservan: la tarea que los procesa todavía los necesita.
+    """
+    limite = timezone.now() - timedelta(hours=settings.CARGA_MASIVA_RETENCION_HORAS)
+    vencidos = LoteCargaMasiva.objects.filter(fecha_creacion__lt=limite).exclude(estado__in=ESTADOS_EN_PROCESO)
+    for lote in vencidos.exclude(archivo_ruta='').only('archivo_ruta'):
+        borrar_archivo(lote)
+    vencidos.delete()
+
+    # Subidas por partes que nunca se completaron
+    subidas = SubidaFragmentada.objects.filter(fecha_creacion__lt=limite)
+    for subida in subidas.exclude(ruta='').only('ruta'):
+        if os.path.exists(subida.ruta):
+            os.remove(subida.ruta)
+    subidas.delete()
+
+    EnvioIdempotente.objects.filter(fecha_creacion__lt=limite).delete()
+
+
+def _nuevo_lote(cuenta, archivo_nombre):
+    limpiar_lotes_vencidos()
+    lote = LoteCargaMasiva(cuenta=cuenta, archivo_nombre=archivo_nombre[:255])
+    os.makedirs(settings.CARGA_MASIVA_DIRECTORIO, exist_ok=True)
+    extension = os.path.splitext(archivo_nombre)[1].lower()
+    lote.archivo_ruta = os.path.join(settings.CARGA_MASIVA_DIRECTORIO, f'{lote.lote_id}{extension}')
+    return lote
+
+
+def crear_lote(cuenta, archivo):
+    """
+    Crea el lote en cola para la cuenta y copia el archivo subido a
+    CARGA_MASIVA_DIRECTORIO, donde lo leerá la tarea de validación.
+    Aprovecha de limpiar los lotes vencidos.
+    """
+    lote = _nuevo_lote(cuenta, archivo.name)
+    with open(lote.archivo_ruta, 'wb') as destino:
+        for parte in archivo.chunks():
+            destino.write(parte)
+    lote.save()
+    return lote
+
+
+def crear_lote_desde_ruta(cuenta, archivo_nombre, ruta):
+    """
+    Igual que crear_lote, pero con un archivo que ya está en disco (p. ej. el
+    armado por una subida fragmentada): se mueve en vez de copiarse.
+    """
+    lote = _nuevo_lote(cuenta, archivo_nombre)
+    os.replace(ruta, lote.archivo_ruta)
+    lote.save()
+    return lote
+
+
+def tomar_lote(lote_id, desde, hacia, **campos):
+    """
+    Pasa el lote del estado `desde` a `hacia` solo si sigue en `desde`.
+    Retorna True si este proceso lo tomó (evita procesarlo dos veces).
+    """
+    return LoteCargaMasiva.objects.filter(pk=lote_id, estado=desde).update(
+        estado=hacia, fecha_actualizacion=timezone.now(), **campos
+    ) == 1
+
+
+def actualizar_lote(lote, **campos):
+    """Actualiza campos del lote (p. ej. el progreso) sin tocar el resto."""
+    for campo, valor in campos.items():
+        setattr(lote, campo, valor)
+    LoteCargaMasiva.objects.filter(pk=lote.pk).update(fecha_actualizacion=timezone.now(), **campos)
+
+
+def agregar_filas(lote, datos):
+    """
+    Guarda en el staging las filas validadas (válidas y con errores) de un
+    bloque, como las arma validar_bloque (FilaCalificacion). Se escriben con
+    COPY / executemany, igual que el guardado definitivo.
+    """
+    lote_id = FilaCargaMasiva._meta.get_field('lote').get_db_prep_value(lote.pk, connection)
+    with transaction.atomic(), connection.cursor() as cursor:
+        escribir_filas(
+            cursor, TABLA_FILAS, COLUMNAS_STAGING,
+            [_tupla_staging(lote_id, dato) for dato in datos],
+            COLUMNAS_STAGING_TEXTO
+        )
+
+
+def marcar_rechazadas(lote, rechazadas):
+    """
+    Pasa a filas con errores las filas válidas que no se pudieron guardar
+    (lista de (FilaCalificacion, mensaje), ver guardar_separando_rechazadas) y
+    ajusta los contadores del lote.
+    """
+    for dato, mensaje in rechazadas:
+        FilaCargaMasiva.objects.filter(lote=lote, fila=dato.fila).update(valido=False, errores=[mensaje])
+    actualizar_lote(
+        lote,
+        filas_validas=lote.filas_validas - len(rechazadas),
+        filas_con_errores=lote.filas_con_errores + len(rechazadas),
+    )
+
+
+def obtener_lote(lote_id, cuenta_id):
+    """Retorna el lote de la cuenta, o None si no existe o pertenece a otra."""
+    try:
+        return LoteCargaMasiva.objects.get(pk=lote_id, cuenta_id=cuenta_id)
+    except (LoteCargaMasiva.DoesNotExist, ValidationError):
+        return None
+
+
+def filas_validas(lote, tamano=2000):
+    """
+    Genera las filas válidas del lote como FilaCalificacion, en orden de
+    fila y leyendo la BD por partes (sin cargar el lote completo en memoria).
+    """
+    valores = (
+        FilaCargaMasiva.objects
+        .filter(lote=lote, valido=True)
+        .order_by('fila')
+        .values_list(*CAMPOS_FILA)
+        .iterator(chunk_size=tamano)
+    )
+    return (FilaCalificacion(*fila) for fila in valores)
+
+
+def parte_filas_validas(lote, despues_de, tamano):
+    """
+    Las siguientes `tamano` filas válidas del lote después de la fila
+    `despues_de`, como FilaCalificacion. Cada llamada es una consulta
+    independiente, así que sirve entre transacciones (un cursor de servidor
+    no sobrevive al commit).
+    """
+    valores = (
+        FilaCargaMasiva.objects
+        .filter(lote=lote, valido=True, fila__gt=despues_de)
+        .order_by('fila')
+        .values_list(*CAMPOS_FILA)[:tamano]
+    )
+    return [FilaCalificacion(*fila) for fila in valores]
+
+
+# Filtros de la vista previa paginada
+FILTROS_PREVIEW = {
+    'todas': {},
+    'errores': {'valido': False},
+    'validas': {'valido': True},
+}
+
+
+def pagina_filas(lote, filtro='todas', despues_de=0, tamano=50):
+    """
+    Una página de la vista previa: las `tamano` filas siguientes a la fila
+    `despues_de` (paginación por clave, usa idx_fila_lote_valido_fila, así que
+    cuesta lo mismo en cualquier página y con cualquier tamaño de lote).
+    Retorna (filas, siguiente), donde `siguiente` es el valor de `despues_de`
+    para pedir la página que sigue, o None si no hay más.
+    """
+    filas = list(
+        FilaCargaMasiva.objects
+        .filter(lote=lote, fila__gt=despues_de, **FILTROS_PREVIEW[filtro])
+        .order_by('fila')
+        .values(*CAMPOS_FILA, 'errores', 'valido')[:tamano + 1]
+    )
+    if len(filas) > tamano:
+        return filas[:tamano], filas[tamano - 1]['fila']
+    return filas, None
+
+
+def filas_con_errores(lote):
+    """Queryset de las filas con errores del lote (como dicts), en orden de fila."""
+    return (
+        FilaCargaMasiva.objects
+        .filter(lote=lote, valido=False)
+        .order_by('fila')
+        .values(*CAMPOS_FILA, 'errores')
+    )
@@ -0,0 +1,47 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+from django.utils import timezone
+
+from .validacion import validar_columnas
+
+
+def validar_por_bloques(bloques, procesos, umbral):
+    """
+    Genera (resultado, errores) de validar_columnas para cada bloque, en el
+    mismo orden en que vienen (cada bloque conserva su columna 'fila').
+
+    Si el archivo tiene al menos `umbral` filas y `procesos` > 1, los bloques
+    se validan en paralelo en un ProcessPoolExecutor; los archivos chicos se
+    validan en este mismo proceso, donde levantar procesos no conviene.
+    """
+    anio_actual = timezone.now().year
+    bloques = iter(bloques)
+
+    # Leer bloques hasta alcanzar el umbral para saber si el archivo es grande
+    iniciales = []
+    filas = 0
+    if procesos > 1:
+        for bloque in bloques:
+            iniciales.append(bloque)
+            filas += len(bloque)
+            if filas >= umbral:
+                break
+
+    if procesos <= 1 or filas < umbral:
+        for bloque in chain(iniciales, bloques):
+            yield validar_columnas(bloque, anio_actual)
+        return
+
+    # 'spawn' evita heredar el estado del proceso web (hilos, conexiones a la BD)
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn')) as ejecutor:
+        # Se mantienen pocos bloques en vuelo para no acumular el archivo en memoria
+        pendientes = deque()
+        for bloque in chain(iniciales, bloques):
+            pendientes.append(ejecutor.submit(validar_columnas, bloque, anio_actual))
+            if len(pendientes) >= procesos * 2:
+                yield pendientes.popleft().result()
+        while pendientes:
+            yield pendientes.popleft().result()
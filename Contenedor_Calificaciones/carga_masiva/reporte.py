@@ -0,0 +1,131 @@
+import csv
+import io
+import zipfile
+from xml.sax.saxutils import escape
+
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import get_column_letter
+
+from .lotes import filas_con_errores
+
+# Reporte descargable con las filas con errores de un lote. Se arma leyendo el
+# staging por partes, así que no depende del tamaño del archivo original.
+
+ENCABEZADOS_REPORTE = [
+    'Fila', 'RUT de la Empresa', 'Nombre de la Empresa', 'Año Tributario',
+    'Tipo de Calificación', 'Errores',
+]
+
+# Caracteres con que Excel interpreta una celda como fórmula
+PREFIJOS_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _celda(valor):
+    # Los textos vienen del archivo subido: se neutralizan posibles fórmulas
+    if isinstance(valor, str) and valor.startswith(PREFIJOS_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def filas_reporte(lote, tamano=2000):
+    """Genera las filas del reporte (listas con ENCABEZADOS_REPORTE)."""
+    for dato in filas_con_errores(lote).iterator(chunk_size=tamano):
+        yield [
+            dato['fila'],
+            _celda(dato['rut_empresa']),
+            _celda(dato['nombre_empresa']),
+            dato['anio_tributario'],
+            _celda(dato['tipo_calificacion']),
+            _celda(' | '.join(dato['errores'])),
+        ]
+
+
+class _Eco:
+    # Pseudo-archivo para csv.writer: devuelve la línea en vez de guardarla
+    def write(self, valor):
+        return valor
+
+
+def reporte_csv(lote):
+    """Genera el reporte en CSV línea a línea, para un StreamingHttpResponse."""
+    escritor = csv.writer(_Eco())
+    # BOM para que Excel abra el archivo como UTF-8
+    yield '\ufeff' + escritor.writerow(ENCABEZADOS_REPORTE)
+    for fila in filas_reporte(lote):
+        yield escritor.writerow(fila)
+
+
+class _Salida:
+    # Destino de zipfile que junta lo escrito para entregarlo por partes (sin
+    # seek: zipfile escribe el .xlsx de corrido, con descriptores de datos)
+    def __init__(self):
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+def _plantilla_xlsx():
+    """
+    Arma con openpyxl (modo write-only) un libro con solo el encabezado y
+    retorna (partes del zip, ruta de la hoja, XML de la hoja hasta las filas,
+    XML de la hoja después de las filas).
+    """
+    libro = Workbook(write_only=True)
+    libro.create_sheet('Errores').append(ENCABEZADOS_REPORTE)
+    contenido = io.BytesIO()
+    libro.save(contenido)
+    with zipfile.ZipFile(contenido) as plantilla:
+        partes = [(info.filename, plantilla.read(info)) for info in plantilla.infolist()]
+    hoja = 'xl/worksheets/sheet1.xml'
+    xml = dict(partes)[hoja]
+    corte = xml.index(b'</sheetData>')
+    return partes, hoja, xml[:corte], xml[corte:]
+
+
+def _fila_xml(numero, valores):
+    celdas = []
+    for columna, valor in enumerate(valores, start=1):
+        referencia = f'{get_column_letter(columna)}{numero}'
+        if valor is None:
+            continue
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            celdas.append(f'<c r="{referencia}" t="n"><v>{valor}</v></c>')
+        else:
+            texto = escape(ILLEGAL_CHARACTERS_RE.sub('', str(valor)))
+            celdas.append(f'<c r="{referencia}" t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>')
+    return f'<row r="{numero}">{"".join(celdas)}</row>'.encode()
+
+
+def reporte_xlsx(lote, filas_por_envio=1000):
+    """
+    Genera el reporte .xlsx por partes, para un StreamingHttpResponse: el
+    libro base (estilos, encabezado) lo arma openpyxl en modo write-only y
+    las filas de la hoja se comprimen y se envían a medida que se leen del
+    staging, sin esperar a tener el archivo completo ni escribirlo a disco.
+    """
+    partes, ruta_hoja, inicio_hoja, fin_hoja = _plantilla_xlsx()
+    salida = _Salida()
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED) as libro:
+        for nombre, contenido in partes:
+            if nombre != ruta_hoja:
+                libro.writestr(nombre, contenido)
+                continue
+            with libro.open(nombre, 'w', force_zip64=True) as hoja:
+                hoja.write(inicio_hoja)
+                for numero, fila in enumerate(filas_reporte(lote), start=2):
+                    hoja.write(_fila_xml(numero, fila))
+                    if numero % filas_por_envio == 0:
+                        yield salida.vaciar()
+                hoja.write(fin_hoja)
+    yield salida.vaciar()
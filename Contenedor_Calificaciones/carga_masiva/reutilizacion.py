@@ -0,0 +1,121 @@
+import hashlib
+from collections import deque
+from operator import attrgetter
+
+import pandas as pd
+
+from ..models import FilaCargaMasiva, LoteCargaMasiva
+from .duplicados import _en_partes
+from .filas import CAMPOS_FILA, FilaCalificacion
+from .lectores import COLUMNAS_PLANTILLA
+from .validacion import verificar_empresas
+
+# Revalidación incremental: cuando un calificador corrige unas pocas filas y
+# vuelve a subir el archivo, las filas que no cambiaron (mismo hash de
+# contenido) y que en su carga anterior quedaron válidas no se vuelven a
+# validar; se copian del staging de esa carga. Lo único que depende de la BD,
+# la empresa del RUT y su nombre, se vuelve a revisar para esas filas con una
+# consulta por bloque, porque la empresa pudo cambiar o eliminarse desde
+# entonces. Las filas con errores siempre se revalidan completas (por ejemplo,
+# una empresa que se registró después). La revisión de duplicados se hace
+# igual para todas las filas.
+
+ESTADOS_CON_FILAS = ('validado', 'por_guardar', 'guardando', 'guardado')
+
+SEPARADOR = '\x1f'
+
+
+def hashes_contenido(bloque):
+    """Hash del contenido crudo de cada fila del bloque (32 caracteres hex)."""
+    columnas = [bloque[columna].tolist() for columna in COLUMNAS_PLANTILLA]
+    return [
+        hashlib.blake2b(SEPARADOR.join(map(str, valores)).encode(), digest_size=16).hexdigest()
+        for valores in zip(*columnas)
+    ]
+
+
+def lote_anterior(lote):
+    """Id de la carga anterior de la misma cuenta con filas en el staging, o None."""
+    return (
+        LoteCargaMasiva.objects
+        .filter(cuenta_id=lote.cuenta_id, estado__in=ESTADOS_CON_FILAS,
+                total_filas__gt=0, fecha_creacion__lt=lote.fecha_creacion)
+        .exclude(pk=lote.pk)
+        .order_by('-fecha_creacion')
+        .values_list('pk', flat=True)
+        .first()
+    )
+
+
+class ValidacionesPrevias:
+    """
+    Separa de cada bloque las filas que se pueden reutilizar de la carga
+    anterior. `filtrar` entrega los bloques con las filas a validar y
+    `completar`, llamado con el resultado de cada bloque en el mismo orden,
+    le agrega las filas reutilizadas, con sus empresas verificadas otra vez
+    (`resolver_empresas` y `buscar_parecidas` como en completar_validacion),
+    y el hash de contenido de cada fila.
+    """
+
+    def __init__(self, lote, resolver_empresas, buscar_parecidas=None):
+        self.anterior = lote_anterior(lote)
+        self._resolver_empresas = resolver_empresas
+        self._buscar_parecidas = buscar_parecidas
+        self.reutilizadas = 0
+        # (hashes por fila, filas reutilizadas) de los bloques entregados y aún no completados
+        self._pendientes = deque()
+
+    def _validas_previas(self, hashes):
+        # {hash: valores} de las filas válidas de la carga anterior con esos hashes
+        previas = {}
+        for parte in _en_partes(hashes):
+            for valores in (
+                FilaCargaMasiva.objects
+                .filter(lote_id=self.anterior, valido=True, hash_contenido__in=parte)
+                .values_list(*CAMPOS_FILA)
+            ):
+                previas[valores[-1]] = valores
+        return previas
+
+    def filtrar(self, bloques):
+        for bloque in bloques:
+            hashes = hashes_contenido(bloque)
+            previas = self._validas_previas(set(hashes)) if self.anterior else {}
+            numeros = bloque['fila'].tolist()
+
+            reutilizadas = []
+            for numero, hash_contenido in zip(numeros, hashes):
+                if hash_contenido in previas:
+                    fila = FilaCalificacion(*previas[hash_contenido])
+                    fila.fila = numero
+                    reutilizadas.append(fila)
+            self._pendientes.append((dict(zip(numeros, hashes)), reutilizadas))
+
+            if reutilizadas:
+                bloque = bloque[[h not in previas for h in hashes]].reset_index(drop=True)
+            yield bloque
+
+    def completar(self, datos):
+        hashes, reutilizadas = self._pendientes.popleft()
+        for dato in datos:
+            dato.hash_contenido = hashes[dato.fila]
+        if not reutilizadas:
+            return datos
+        self.reutilizadas += len(reutilizadas)
+        self._verificar_empresas(reutilizadas)
+        return sorted(datos + reutilizadas, key=attrgetter('fila'))
+
+    def _verificar_empresas(self, filas):
+        # Misma revisión de empresas que las filas validadas (verificar_empresas),
+        # con una sola consulta para todas las filas reutilizadas del bloque
+        resultado = pd.DataFrame({
+            'rut_empresa': [fila.rut_empresa for fila in filas],
+            'nombre_empresa': [fila.nombre_empresa for fila in filas],
+        }, dtype=object)
+        resultado['rut_valido'] = True
+        errores = pd.DataFrame(index=resultado.index, columns=['rut_empresa'], dtype=object)
+        empresas = self._resolver_empresas(resultado['rut_empresa'].unique())
+        verificar_empresas(resultado, errores, empresas, self._buscar_parecidas)
+        for fila, mensaje in zip(filas, errores['rut_empresa'].tolist()):
+            if isinstance(mensaje, str):
+                fila.agregar_error(mensaje)
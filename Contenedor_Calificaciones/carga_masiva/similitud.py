@@ -0,0 +1,26 @@
+import re
+
+# Similitud por trigramas, la misma de pg_trgm, para comparar nombres en
+# memoria cuando la BD no la ofrece (no depende de la BD ni de Django).
+
+# Similitud mínima para sugerir una empresa por su nombre (la misma que usa
+# por defecto el operador % de pg_trgm)
+SIMILITUD_MINIMA = 0.3
+
+
+def trigramas(texto):
+    """Trigramas de un texto, calculados igual que en pg_trgm."""
+    resultado = set()
+    for palabra in re.findall(r'[^\W_]+', texto.lower()):
+        palabra = f'  {palabra} '
+        resultado.update(palabra[i:i + 3] for i in range(len(palabra) - 2))
+    return resultado
+
+
+def similitud(a, b):
+    """Similitud entre dos textos (0 a 1), la misma que similarity() de pg_trgm."""
+    trigramas_a, trigramas_b = trigramas(a), trigramas(b)
+    if not trigramas_a or not trigramas_b:
+        return 0.0
+    comunes = len(trigramas_a & trigramas_b)
+    return comunes / (len(trigramas_a) + len(trigramas_b) - comunes)
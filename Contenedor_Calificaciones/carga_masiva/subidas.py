@@ -0,0 +1,143 @@
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.db import transaction
+
+from ..models import SubidaFragmentada
+from . import lotes, tareas
+from .lectores import EXTENSIONES_PERMITIDAS
+
+# Protocolo de subida por partes (reanudable):
+#   1. iniciar_subida: el cliente informa nombre, tamaño y SHA-256 del archivo.
+#   2. recibir_parte: envía las partes en orden, cada una con su cabecera
+#      Content-Range ("bytes inicio-fin/total"). Si se corta, consulta
+#      bytes_recibidos y continúa desde ahí.
+#   3. Con la última parte se verifica el checksum y el archivo armado pasa a
+#      ser un LoteCargaMasiva en cola, igual que una subida normal.
+
+RANGO_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+TAMANO_LECTURA = 64 * 1024
+
+
+class ErrorSubida(Exception):
+    """Error del protocolo de subida; `estado_http` es el código a responder."""
+
+    def __init__(self, mensaje, estado_http=400):
+        super().__init__(mensaje)
+        self.estado_http = estado_http
+
+
+def iniciar_subida(cuenta, archivo_nombre, tamano_total, sha256):
+    """Registra una subida nueva y crea su archivo parcial vacío."""
+    if not archivo_nombre.lower().endswith(EXTENSIONES_PERMITIDAS):
+        raise ErrorSubida('El archivo debe ser formato Excel (.xlsx o .xls), CSV, ODS o Parquet')
+    try:
+        tamano_total = int(tamano_total)
+    except (TypeError, ValueError):
+        raise ErrorSubida('Tamaño de archivo inválido.')
+    if tamano_total <= 0:
+        raise ErrorSubida('El archivo está vacío.')
+    if tamano_total > settings.CARGA_MASIVA_MAX_ARCHIVO_MB * 1024 * 1024:
+        raise ErrorSubida(f'El archivo supera el máximo de {settings.CARGA_MASIVA_MAX_ARCHIVO_MB} MB.', 413)
+    sha256 = (sha256 or '').strip().lower()
+    if not re.fullmatch(r'[0-9a-f]{64}', sha256):
+        raise ErrorSubida('Checksum SHA-256 inválido.')
+
+    lotes.limpiar_lotes_vencidos()
+    subida = SubidaFragmentada(
+        cuenta=cuenta, archivo_nombre=archivo_nombre[:255],
+        tamano_total=tamano_total, sha256=sha256,
+    )
+    directorio = os.path.join(settings.CARGA_MASIVA_DIRECTORIO, 'subidas')
+    os.makedirs(directorio, exist_ok=True)
+    subida.ruta = os.path.join(directorio, f'{subida.subida_id}.parte')
+    open(subida.ruta, 'wb').close()
+    subida.save()
+    return subida
+
+
+def _leer_rango(content_range, tamano_total):
+    coincidencia = RANGO_RE.match((content_range or '').strip())
+    if not coincidencia:
+        raise ErrorSubida('Falta la cabecera Content-Range ("bytes inicio-fin/total").')
+    inicio, fin, total = (int(g) for g in coincidencia.groups())
+    if total != tamano_total or fin < inicio or fin >= total:
+        raise ErrorSubida('Content-Range no corresponde al archivo de la subida.')
+    if fin - inicio + 1 > settings.CARGA_MASIVA_TAMANO_PARTE:
+        raise ErrorSubida(f'Cada parte puede tener como máximo {settings.CARGA_MASIVA_TAMANO_PARTE} bytes.', 413)
+    return inicio, fin
+
+
+def recibir_parte(subida, content_range, flujo):
+    """
+    Escribe una parte en el archivo parcial leyendo `flujo` (el cuerpo del
+    request) de a poco, sin cargar la parte completa en memoria. Las partes
+    deben llegar en orden; una parte ya recibida se ignora (reintento).
+    Retorna la subida actualizada.
+    """
+    if subida.estado == 'completa':
+        return subida
+    if subida.estado != 'recibiendo':
+        raise ErrorSubida('La subida falló; debe iniciarse nuevamente.', 409)
+
+    inicio, fin = _leer_rango(content_range, subida.tamano_total)
+    if fin < subida.bytes_recibidos:
+        return subida
+    if inicio != subida.bytes_recibidos:
+        raise ErrorSubida(f'Parte fuera de orden: se esperaba el byte {subida.bytes_recibidos}.', 409)
+
+    restante = fin - inicio + 1
+    with open(subida.ruta, 'r+b') as destino:
+        destino.seek(inicio)
+        while restante:
+            datos = flujo.read(min(TAMANO_LECTURA, restante))
+            if not datos:
+                raise ErrorSubida('La parte llegó incompleta; vuelva a enviarla.')
+            destino.write(datos)
+            restante -= len(datos)
+
+    # Avanza solo si nadie más avanzó la subida entretanto
+    SubidaFragmentada.objects.filter(pk=subida.pk, bytes_recibidos=inicio).update(bytes_recibidos=fin + 1)
+    subida.refresh_from_db()
+
+    if subida.bytes_recibidos == subida.tamano_total:
+        completar_subida(subida)
+    return subida
+
+
+def _sha256_archivo(ruta):
+    sha256 = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for datos in iter(lambda: archivo.read(1024 * 1024), b''):
+            sha256.update(datos)
+    return sha256.hexdigest()
+
+
+def completar_subida(subida):
+    """
+    Verifica el checksum del archivo armado y lo deja como lote en cola para
+    el pipeline de carga masiva. Si no coincide la subida queda en error.
+    """
+    if _sha256_archivo(subida.ruta) != subida.sha256:
+        os.remove(subida.ruta)
+        SubidaFragmentada.objects.filter(pk=subida.pk).update(estado='error', ruta='')
+        subida.refresh_from_db()
+        raise ErrorSubida('El checksum del archivo no coincide; vuelva a subirlo.', 422)
+
+    with transaction.atomic():
+        # Solo uno de los requests que completen la subida crea el lote
+        if not SubidaFragmentada.objects.filter(pk=subida.pk, estado='recibiendo').update(estado='completa'):
+            subida.refresh_from_db()
+            return subida
+        lote = lotes.crear_lote_desde_ruta(subida.cuenta, subida.archivo_nombre, subida.ruta)
+        SubidaFragmentada.objects.filter(pk=subida.pk).update(lote=lote, ruta='')
+        tareas.encolar(lote.pk)
+    subida.refresh_from_db()
+    return subida
+
+
+def obtener_subida(subida_id, cuenta_id):
+    """Retorna la subida de la cuenta, o None si no existe o pertenece a otra."""
+    return SubidaFragmentada.objects.filter(pk=subida_id, cuenta_id=cuenta_id).first()
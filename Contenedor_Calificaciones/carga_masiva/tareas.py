@@ -0,0 +1,287 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from ..models import FilaCargaMasiva, LoteCargaMasiva
+from . import lotes
+from .bloqueos import bloqueo_cuenta, cuenta_ocupada
+from .duplicados import marcar_duplicados
+from .empresas import BuscadorParecidas, empresas_por_rut
+from .guardado import guardar_separando_rechazadas
+from .lectores import abrir_archivo
+from .paralelo import validar_por_bloques
+from .reutilizacion import ValidacionesPrevias
+from .validacion import completar_validacion
+
+logger = logging.getLogger(__name__)
+
+# Cola local de la carga masiva: el propio LoteCargaMasiva es el trabajo y su
+# estado indica qué falta hacer. Según CARGA_MASIVA_EJECUCION se procesa en un
+# hilo del mismo proceso web ('hilo'), en el mismo request ('sincrono', útil
+# en pruebas) o en un proceso aparte con `manage.py procesar_cargas_masivas`
+# ('worker'). Ninguna opción requiere servicios externos.
+
+ESTADOS_EN_PROCESO = lotes.ESTADOS_EN_PROCESO
+
+_ejecutor = None
+_ejecutor_lock = threading.Lock()
+
+
+def _hasta_max_filas(bloques, max_filas, errores_globales):
+    # Corta los bloques al llegar a CARGA_MASIVA_MAX_FILAS y deja el aviso
+    total = 0
+    for bloque in bloques:
+        if total + len(bloque) > max_filas:
+            errores_globales.append(f'⚠️ Se permiten máximo {max_filas} calificaciones por archivo.  Las filas adicionales fueron ignoradas.')
+            bloque = bloque.iloc[:max_filas - total]
+            if len(bloque):
+                yield bloque
+            return
+        total += len(bloque)
+        yield bloque
+
+
+def validar_lote(lote):
+    """
+    Lee el archivo del lote por bloques, valida cada bloque (en paralelo si el
+    archivo es grande) y lo guarda en el staging, actualizando el progreso
+    después de cada bloque. Las filas que no cambiaron desde la carga anterior
+    de la cuenta y eran válidas se reutilizan sin validarlas de nuevo.
+    """
+    errores_globales = []
+    total = validas = duplicadas = 0
+
+    lector = abrir_archivo(lote.archivo_ruta)
+    try:
+        # Validar que no esté vacío
+        if lector.vacio:
+            errores_globales.append('El archivo está vacío.')
+
+        # Validar que existan todas las columnas necesarias
+        elif lector.columnas_faltantes:
+            errores_globales.append(f"Faltan columnas en el archivo: {', '.join(lector.columnas_faltantes)}")
+
+        else:
+            bloques = _hasta_max_filas(
+                lector.bloques(settings.CARGA_MASIVA_TAMANO_BLOQUE),
+                settings.CARGA_MASIVA_MAX_FILAS,
+                errores_globales
+            )
+            buscar_parecidas = BuscadorParecidas()
+            previas = ValidacionesPrevias(lote, empresas_por_rut, buscar_parecidas)
+            validados = validar_por_bloques(
+                previas.filtrar(bloques), settings.CARGA_MASIVA_PROCESOS, settings.CARGA_MASIVA_UMBRAL_PARALELO
+            )
+            for resultado, errores in validados:
+                datos = previas.completar(completar_validacion(resultado, errores, empresas_por_rut, buscar_parecidas))
+                duplicadas += marcar_duplicados(lote, datos)
+                lotes.agregar_filas(lote, datos)
+                total += len(datos)
+                validas += sum(1 for d in datos if d.valido)
+                lotes.actualizar_lote(
+                    lote, total_filas=total, filas_validas=validas,
+                    filas_con_errores=total - validas - duplicadas, filas_duplicadas=duplicadas,
+                    filas_reutilizadas=previas.reutilizadas
+                )
+
+            if previas.reutilizadas:
+                logger.info('Lote %s: %s filas sin cambios reutilizadas del lote %s',
+                            lote.pk, previas.reutilizadas, previas.anterior)
+
+            if total == 0:
+                errores_globales.append('No se encontraron filas válidas con datos en el archivo.')
+    finally:
+        lector.cerrar()
+        lotes.borrar_archivo(lote)
+
+    lotes.actualizar_lote(
+        lote,
+        estado='validado' if total else 'error',
+        archivo_ruta='',
+        errores_globales=errores_globales,
+    )
+
+
+def guardar_lote(lote):
+    """
+    Guarda las filas válidas del lote como calificaciones. Con
+    CARGA_MASIVA_MODO_GUARDADO='transaccion' todo va en una sola transacción;
+    con 'partes' (por defecto) cada CARGA_MASIVA_TAMANO_GUARDADO filas se
+    confirman en su propia transacción junto con el avance del lote
+    (ultima_fila_guardada), así un error o un reinicio solo pierde la parte en
+    curso y el guardado continúa desde la última parte confirmada.
+    Mientras guarda tiene el bloqueo de carga masiva de la cuenta.
+    """
+    with bloqueo_cuenta(lote.cuenta_id):
+        _guardar_lote(lote)
+
+
+def _guardar_lote(lote):
+    # Las filas que no se pueden guardar (la BD las rechaza o su empresa se
+    # eliminó, ver guardar_separando_rechazadas) pasan a errores en el staging
+    # en vez de hacer fallar el lote completo
+    if settings.CARGA_MASIVA_MODO_GUARDADO == 'transaccion':
+        with transaction.atomic():
+            filas = lotes.filas_validas(lote)
+            guardadas = segundos = 0
+            while parte := list(islice(filas, settings.CARGA_MASIVA_TAMANO_GUARDADO)):
+                guardadas_parte, segundos_parte, rechazadas = guardar_separando_rechazadas(
+                    parte, lote.cuenta_id, lote.estado_destino, validar_filas=settings.CARGA_MASIVA_VALIDAR_FILAS,
+                )
+                guardadas += guardadas_parte
+                segundos += segundos_parte
+                if rechazadas:
+                    lotes.marcar_rechazadas(lote, rechazadas)
+            lotes.actualizar_lote(
+                lote, estado='guardado', filas_guardadas=guardadas, duracion_guardado=segundos
+            )
+        return
+
+    while True:
+        parte = lotes.parte_filas_validas(
+            lote, lote.ultima_fila_guardada, settings.CARGA_MASIVA_TAMANO_GUARDADO
+        )
+        if not parte:
+            break
+        with transaction.atomic():
+            guardadas, segundos, rechazadas = guardar_separando_rechazadas(
+                parte, lote.cuenta_id, lote.estado_destino, validar_filas=settings.CARGA_MASIVA_VALIDAR_FILAS
+            )
+            if rechazadas:
+                lotes.marcar_rechazadas(lote, rechazadas)
+            lotes.actualizar_lote(
+                lote,
+                filas_guardadas=lote.filas_guardadas + guardadas,
+                ultima_fila_guardada=parte[-1].fila,
+                duracion_guardado=(lote.duracion_guardado or 0) + segundos,
+            )
+    lotes.actualizar_lote(lote, estado='guardado')
+
+
+def ejecutar(lote_id):
+    """
+    Procesa lo que le falte al lote: lo valida si está en cola o lo guarda si
+    fue confirmado. Si otro hilo o worker ya lo tomó, no hace nada.
+    """
+    if lotes.tomar_lote(lote_id, 'en_cola', 'validando'):
+        lote = LoteCargaMasiva.objects.get(pk=lote_id)
+        try:
+            validar_lote(lote)
+        except Exception as e:
+            logger.exception('Error al validar el lote %s', lote_id)
+            lote.filas.all().delete()
+            lotes.actualizar_lote(
+                lote, estado='error', archivo_ruta='',
+                errores_globales=[f'Error al procesar el archivo: {str(e)}'],
+            )
+
+    elif lotes.tomar_lote(lote_id, 'por_guardar', 'guardando'):
+        lote = LoteCargaMasiva.objects.get(pk=lote_id)
+        try:
+            guardar_lote(lote)
+        except Exception as e:
+            # Se deshizo la transacción en curso: el lote vuelve a quedar listo
+            # para guardar (por partes, desde la última parte confirmada)
+            logger.exception('Error al guardar el lote %s', lote_id)
+            lotes.actualizar_lote(
+                lote, estado='validado',
+                errores_globales=lote.errores_globales + [f'Error al guardar: {str(e)}'],
+            )
+
+
+def _ejecutar_en_hilo(lote_id):
+    try:
+        ejecutar(lote_id)
+    finally:
+        # Cada hilo abre su propia conexión; se cierra al terminar
+        connections.close_all()
+
+
+def _obtener_ejecutor():
+    global _ejecutor
+    with _ejecutor_lock:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(
+                max_workers=settings.CARGA_MASIVA_HILOS,
+                thread_name_prefix='carga_masiva'
+            )
+        return _ejecutor
+
+
+def encolar(lote_id):
+    """
+    Programa el procesamiento del lote según CARGA_MASIVA_EJECUCION, una vez
+    confirmada la transacción actual (para que el lote ya sea visible).
+    """
+    modo = settings.CARGA_MASIVA_EJECUCION
+    if modo == 'sincrono':
+        transaction.on_commit(lambda: ejecutar(lote_id))
+    elif modo == 'hilo':
+        transaction.on_commit(lambda: _obtener_ejecutor().submit(_ejecutar_en_hilo, lote_id))
+    # En modo 'worker' el lote queda en la BD hasta que lo tome procesar_cargas_masivas
+
+
+def reanudar_interrumpidos(lote_id=None):
+    """
+    Recupera los lotes que quedaron a medio procesar sin avanzar durante
+    CARGA_MASIVA_MINUTOS_SIN_PROGRESO (p. ej. porque se reinició el proceso
+    que los tenía):
+    - 'validando': vuelve a la cola (sin las filas ya validadas) si el archivo
+      sigue en disco; si no, queda en 'error' para que se suba de nuevo;
+    - 'guardando': vuelve a 'por_guardar' y continúa desde la última parte
+      confirmada (o desde el comienzo, si se guardaba en una sola
+      transacción). En PostgreSQL se deja en paz mientras alguna conexión
+      tenga el bloqueo de carga masiva de la cuenta, porque el guardado sigue
+      en curso (una transacción larga no muestra avance).
+    """
+    limite = timezone.now() - timedelta(minutes=settings.CARGA_MASIVA_MINUTOS_SIN_PROGRESO)
+    detenidos = LoteCargaMasiva.objects.filter(
+        estado__in=['validando', 'guardando'], fecha_actualizacion__lt=limite
+    )
+    if lote_id is not None:
+        detenidos = detenidos.filter(pk=lote_id)
+
+    for pk, estado, cuenta_id, archivo_ruta in detenidos.values_list(
+        'lote_id', 'estado', 'cuenta_id', 'archivo_ruta'
+    ):
+        if estado == 'guardando':
+            if not cuenta_ocupada(cuenta_id) and lotes.tomar_lote(pk, 'guardando', 'por_guardar'):
+                logger.warning('Lote %s sin avance en el guardado; se reanuda', pk)
+                encolar(pk)
+            continue
+
+        # Las filas validadas se borran en la misma transacción que cambia el
+        # estado, así ningún worker toma el lote con filas a medias
+        with transaction.atomic():
+            if archivo_ruta and os.path.exists(archivo_ruta):
+                if lotes.tomar_lote(
+                    pk, 'validando', 'en_cola', total_filas=0, filas_validas=0,
+                    filas_con_errores=0, filas_duplicadas=0, filas_reutilizadas=0,
+                ):
+                    FilaCargaMasiva.objects.filter(lote_id=pk).delete()
+                    logger.warning('Lote %s sin avance en la validación; se valida de nuevo', pk)
+                    encolar(pk)
+            elif lotes.tomar_lote(
+                pk, 'validando', 'error', archivo_ruta='',
+                errores_globales=['La validación del archivo se interrumpió. Por favor, súbalo nuevamente.'],
+            ):
+                FilaCargaMasiva.objects.filter(lote_id=pk).delete()
+                logger.warning('Lote %s sin avance en la validación y sin archivo; queda con error', pk)
+
+
+def siguiente_pendiente():
+    """ID del lote más antiguo que espera ser validado o guardado, o None."""
+    return (
+        LoteCargaMasiva.objects
+        .filter(estado__in=['en_cola', 'por_guardar'])
+        .order_by('fecha_creacion')
+        .values_list('lote_id', flat=True)
+        .first()
+    )
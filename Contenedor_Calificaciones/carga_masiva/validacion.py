@@ -0,0 +1,310 @@
+import numpy as np
+import pandas as pd
+from django.utils import timezone
+
+from ..validators import normalizar_nombre_empresa
+from .filas import FilaCalificacion
+from .similitud import similitud
+
+# Valores aceptados en el Excel y su equivalente en la BD
+CATEGORIA_MAP = {
+    'A': 'alto', 'B': 'medio', 'C': 'bajo',
+    'a': 'alto', 'b': 'medio', 'c': 'bajo',
+    'bajo': 'bajo', 'medio': 'medio', 'alto': 'alto',
+    'BAJO': 'bajo', 'MEDIO': 'medio', 'ALTO': 'alto',
+    'Bajo': 'bajo', 'Medio': 'medio', 'Alto': 'alto'
+}
+
+RIESGO_MAP = {
+    'bajo': 'bajo', 'medio': 'medio', 'alto': 'alto', 'critico': 'critico', 'crítico': 'critico',
+    'BAJO': 'bajo', 'MEDIO': 'medio', 'ALTO': 'alto', 'CRITICO': 'critico', 'CRÍTICO': 'critico',
+    'Bajo': 'bajo', 'Medio': 'medio', 'Alto': 'alto', 'Critico': 'critico', 'Crítico': 'critico'
+}
+
+# Columnas de la matriz de errores, en el orden en que se muestran los mensajes
+COLUMNAS_ERRORES = [
+    'rut_empresa',
+    'anio_tributario',
+    'tipo_calificacion',
+    'monto_tributario',
+    'factor_tributario',
+    'unidad_valor',
+    'puntaje_calificacion',
+    'categoria_calificacion',
+    'nivel_riesgo',
+]
+
+CAMPOS_TEXTO = [
+    'nombre_empresa',
+    'tipo_calificacion',
+    'unidad_valor',
+    'justificacion_resultado',
+]
+
+# max_length de esos campos en CalificacionTributaria (este módulo no importa
+# los modelos porque también corre en otros procesos, ver paralelo.py). Un
+# valor más largo lo rechazaría la BD al guardar
+LARGOS_MAXIMOS = {
+    'tipo_calificacion': ('Tipo de calificación', 100),
+    'unidad_valor': ('Unidad de valor', 50),
+}
+
+
+def _por_valor_unico(serie, funcion, vacio=''):
+    # Aplica la función una sola vez por cada valor distinto de la columna
+    # (las planillas repiten mucho los valores) y las celdas vacías quedan en `vacio`
+    codigos, unicos = pd.factorize(serie)
+    valores = np.empty(len(unicos) + 1, dtype=object)
+    valores[:-1] = [funcion(v) for v in unicos]
+    valores[-1] = vacio
+    return pd.Series(valores[codigos], index=serie.index)
+
+
+def _texto(serie):
+    # Equivalente a str(valor).strip() dejando '' en las celdas vacías
+    return _por_valor_unico(serie, lambda v: str(v).strip())
+
+
+def _numero(serie):
+    # Convierte a float; lo que no se pueda convertir (o no sea finito) queda NaN
+    numeros = pd.to_numeric(serie, errors='coerce').astype('float64')
+    return numeros.where(np.isfinite(numeros))
+
+
+def _agregar_error(errores, columna, mascara, mensaje):
+    # Escribe el mensaje solo en las filas marcadas por la máscara. Si el
+    # mensaje depende del valor se pasa una función que recibe esas filas.
+    if mascara.any():
+        errores.loc[mascara, columna] = mensaje(mascara) if callable(mensaje) else mensaje
+
+
+def _dv_ruts(cuerpos):
+    """
+    Calcula con módulo 11 el dígito verificador de una lista de cuerpos de RUT
+    (solo dígitos) usando una matriz de dígitos en vez de un ciclo por RUT.
+    """
+    largo = max(len(c) for c in cuerpos)
+    texto = ''.join(c.zfill(largo) for c in cuerpos).encode('ascii')
+    digitos = (np.frombuffer(texto, dtype=np.uint8).reshape(len(cuerpos), largo) - ord('0')).astype(np.int64)
+
+    # Factores 2, 3, 4, 5, 6, 7, 2, 3... desde el dígito de la derecha
+    factores = 2 + (np.arange(largo)[::-1] % 6)
+    resto = (digitos @ factores) % 11
+    return np.where(resto == 0, '0', np.where(resto == 1, 'K', (11 - resto).astype(str)))
+
+
+def _validar_ruts(ruts):
+    """
+    Valida una columna completa de RUTs (ya convertidos a texto).
+    Retorna (mascara de RUTs válidos, RUTs formateados con puntos y guion).
+    """
+    codigos, unicos = pd.factorize(ruts)
+    limpios = [r.upper().replace('.', '').replace('-', '') for r in unicos]
+    cuerpos = [r[:-1] for r in limpios]
+    dvs = [r[-1:] for r in limpios]
+
+    validos = np.zeros(len(unicos) + 1, dtype=bool)
+    validos[:-1] = [len(r) >= 2 and c.isascii() and c.isdigit() for r, c in zip(limpios, cuerpos)]
+    candidatos = np.flatnonzero(validos)
+    if len(candidatos):
+        calculados = _dv_ruts([cuerpos[i] for i in candidatos])
+        validos[candidatos] = calculados == np.array([dvs[i] for i in candidatos])
+
+    formateados = np.empty(len(unicos) + 1, dtype=object)
+    for i in np.flatnonzero(validos):
+        formateados[i] = f"{int(cuerpos[i]):,}".replace(",", ".") + '-' + dvs[i]
+
+    indice = ruts.index
+    return pd.Series(validos[codigos], index=indice), pd.Series(formateados[codigos], index=indice)
+
+
+def validar_columnas(bloque, anio_actual=None):
+    """
+    Valida un bloque de filas (DataFrame con las claves de COLUMNAS_PLANTILLA
+    y la columna 'fila') columna por columna usando máscaras. No consulta la
+    BD, así que puede ejecutarse en otro proceso (ver paralelo.py).
+
+    Retorna (resultado, errores):
+    - resultado: DataFrame con los valores normalizados, el RUT formateado y la
+      columna booleana 'rut_valido'.
+    - errores: matriz de errores con una columna por campo validado
+      (COLUMNAS_ERRORES); cada celda tiene el mensaje o None.
+    """
+    indice = bloque.index
+    anio_actual = anio_actual or timezone.now().year
+    errores = pd.DataFrame(None, index=indice, columns=COLUMNAS_ERRORES, dtype=object)
+    resultado = pd.DataFrame({'fila': bloque['fila']}, index=indice)
+
+    # RUT de la empresa (la existencia en BD se revisa en verificar_empresas)
+    rut_crudo = _texto(bloque['rut_empresa'])
+    rut_valido, rut_formateado = _validar_ruts(rut_crudo)
+    _agregar_error(errores, 'rut_empresa', ~rut_valido, lambda m: 'RUT inválido: ' + rut_crudo[m])
+    resultado['rut_empresa'] = rut_formateado.where(rut_valido, rut_crudo)
+    resultado['rut_valido'] = rut_valido
+
+    for campo in CAMPOS_TEXTO:
+        resultado[campo] = _texto(bloque[campo])
+    for campo, (nombre, largo) in LARGOS_MAXIMOS.items():
+        _agregar_error(
+            errores, campo, resultado[campo].str.len() > largo,
+            f'{nombre} no puede tener más de {largo} caracteres'
+        )
+
+    # Año tributario
+    anio = np.trunc(_numero(bloque['anio_tributario']))
+    invalido = anio.isna()
+    _agregar_error(errores, 'anio_tributario', invalido, lambda m: 'Año tributario inválido: ' + _texto(bloque['anio_tributario'][m]))
+    fuera_rango = ~invalido & ((anio < 1900) | (anio > anio_actual))
+    _agregar_error(
+        errores, 'anio_tributario', fuera_rango,
+        lambda m: anio[m].map(lambda a: f'Año tributario {int(a)} fuera de rango (1900-{anio_actual})')
+    )
+    resultado['anio_tributario'] = anio
+
+    # Monto tributario
+    monto = _numero(bloque['monto_tributario'])
+    _agregar_error(errores, 'monto_tributario', monto.isna(), lambda m: 'Monto tributario inválido: ' + _texto(bloque['monto_tributario'][m]))
+    _agregar_error(errores, 'monto_tributario', monto < 0, 'Monto tributario no puede ser negativo')
+    resultado['monto_tributario'] = monto
+
+    # Factor tributario
+    factor = _numero(bloque['factor_tributario'])
+    _agregar_error(errores, 'factor_tributario', factor.isna(), lambda m: 'Factor tributario inválido: ' + _texto(bloque['factor_tributario'][m]))
+    _agregar_error(errores, 'factor_tributario', factor < 0, 'Factor tributario no puede ser negativo')
+    _agregar_error(errores, 'factor_tributario', factor > 1, 'Factor tributario debe ser un valor entre 0 y 1 (Ej: 0.5 para 50%)')
+    resultado['factor_tributario'] = factor
+
+    # Puntaje (0-100)
+    puntaje = np.trunc(_numero(bloque['puntaje_calificacion']))
+    _agregar_error(errores, 'puntaje_calificacion', puntaje.isna(), lambda m: 'Puntaje inválido: ' + _texto(bloque['puntaje_calificacion'][m]))
+    _agregar_error(errores, 'puntaje_calificacion', (puntaje < 0) | (puntaje > 100), 'Puntaje debe estar entre 0 y 100')
+    resultado['puntaje_calificacion'] = puntaje
+
+    # Categoría
+    crudo = _texto(bloque['categoria_calificacion'])
+    categoria = crudo.map(CATEGORIA_MAP)
+    _agregar_error(
+        errores, 'categoria_calificacion', categoria.isna(),
+        lambda m: 'Categoría inválida: ' + crudo[m] + '. Debe ser: A, B, C o Bajo, Medio, Alto'
+    )
+    resultado['categoria_calificacion'] = categoria
+
+    # Nivel de riesgo
+    crudo = _texto(bloque['nivel_riesgo'])
+    riesgo = crudo.map(RIESGO_MAP)
+    _agregar_error(
+        errores, 'nivel_riesgo', riesgo.isna(),
+        lambda m: 'Nivel de riesgo inválido: ' + crudo[m] + '.  Debe ser: Bajo, Medio, Alto o Crítico'
+    )
+    resultado['nivel_riesgo'] = riesgo
+
+    return resultado, errores
+
+
+def _sugerencia(parecida, rut):
+    # Empresa de nombre parecido, si es otra distinta a la del RUT de la fila
+    if parecida is None or parecida[0] == rut:
+        return ''
+    return f' ¿Quiso decir "{parecida[1]}" (RUT {parecida[0]})? Similitud: {parecida[2]:.0%}.'
+
+
+def verificar_empresas(resultado, errores, empresas, buscar_parecidas=None):
+    """
+    Marca en la matriz de errores los RUTs válidos cuya empresa no está
+    registrada o cuyo nombre no coincide. `empresas` es un dict
+    {rut formateado: nombre registrado}. Si se pasa `buscar_parecidas`
+    (p. ej. un empresas.BuscadorParecidas), el mensaje de cada fila que no
+    coincide sugiere la empresa registrada de nombre más parecido, buscadas
+    todas con una sola llamada por bloque.
+    """
+    valido = resultado['rut_valido']
+    ruts = resultado['rut_empresa']
+    nombres_bd = ruts.map(empresas)
+    no_registrada = valido & nombres_bd.isna()
+    registrada = valido & nombres_bd.notna()
+
+    # Se comparan los nombres normalizados: mayúsculas, tildes, puntuación
+    # ("S.A." / "SA") y espacios no cuentan como diferencia
+    nombre_bd = _por_valor_unico(nombres_bd, normalizar_nombre_empresa)
+    nombre_excel = _por_valor_unico(resultado['nombre_empresa'], normalizar_nombre_empresa)
+    distinto = registrada & (nombre_bd != nombre_excel)
+
+    parecidas = {}
+    if buscar_parecidas is not None and (no_registrada | distinto).any():
+        parecidas = buscar_parecidas(nombre_excel[no_registrada | distinto].unique().tolist())
+
+    _agregar_error(errores, 'rut_empresa', no_registrada, lambda m: [
+        f'Empresa con RUT {rut} no está registrada.' + _sugerencia(parecidas.get(nombre), rut)
+        for rut, nombre in zip(ruts[m], nombre_excel[m])
+    ])
+    _agregar_error(errores, 'rut_empresa', distinto, lambda m: [
+        f'El nombre "{nombre}" no coincide con la empresa registrada para el RUT {rut} '
+        f'("{registrado}", similitud {similitud(normalizado, normalizado_bd):.0%}).'
+        + _sugerencia(parecidas.get(normalizado), rut)
+        for nombre, rut, registrado, normalizado, normalizado_bd in zip(
+            resultado['nombre_empresa'][m], ruts[m], nombres_bd[m], nombre_excel[m], nombre_bd[m]
+        )
+    ])
+
+
+def _lista(serie, convertir=None):
+    # Pasa una columna a lista de Python dejando None en los vacíos (NaN)
+    if convertir is None:
+        return [None if v != v else v for v in serie.tolist()]
+    return [None if v != v else convertir(v) for v in serie.tolist()]
+
+
+def armar_datos(resultado, errores):
+    """
+    Convierte el resultado de la validación en una lista de FilaCalificacion
+    (una por fila, con sus errores y si es válida).
+    """
+    # Solo se recorren las filas de la matriz que tienen algún error
+    matriz = errores.to_numpy()
+    mensajes = [()] * len(matriz)
+    for i in np.flatnonzero(errores.notna().to_numpy().any(axis=1)):
+        mensajes[i] = tuple(m for m in matriz[i] if isinstance(m, str))
+    columnas = zip(
+        resultado['fila'].tolist(),
+        resultado['rut_empresa'].tolist(),
+        resultado['nombre_empresa'].tolist(),
+        _lista(resultado['anio_tributario'], int),
+        resultado['tipo_calificacion'].tolist(),
+        _lista(resultado['monto_tributario']),
+        _lista(resultado['factor_tributario']),
+        resultado['unidad_valor'].tolist(),
+        _lista(resultado['puntaje_calificacion'], int),
+        _lista(resultado['categoria_calificacion']),
+        _lista(resultado['nivel_riesgo']),
+        resultado['justificacion_resultado'].tolist(),
+        mensajes,
+    )
+    return [
+        FilaCalificacion(
+            int(fila), rut, nombre, anio, tipo, monto, factor, unidad,
+            puntaje, categoria, riesgo, justificacion, errores=errores_fila
+        )
+        for (fila, rut, nombre, anio, tipo, monto, factor, unidad,
+             puntaje, categoria, riesgo, justificacion, errores_fila) in columnas
+    ]
+
+
+def completar_validacion(resultado, errores, resolver_empresas, buscar_parecidas=None):
+    """
+    Completa la validación de columnas con la existencia de las empresas y
+    arma las filas (FilaCalificacion). `resolver_empresas` recibe los RUTs
+    formateados del bloque y retorna {rut: nombre_empresa} con los que existen
+    en la BD; `buscar_parecidas` es opcional (ver verificar_empresas).
+    """
+    ruts = resultado.loc[resultado['rut_valido'], 'rut_empresa'].unique()
+    verificar_empresas(resultado, errores, resolver_empresas(ruts), buscar_parecidas)
+    return armar_datos(resultado, errores)
+
+
+def validar_bloque(bloque, resolver_empresas, buscar_parecidas=None):
+    """
+    Valida un bloque completo: columnas, existencia de las empresas y arma las
+    filas (FilaCalificacion).
+    """
+    resultado, errores = validar_columnas(bloque)
+    return completar_validacion(resultado, errores, resolver_empresas, buscar_parecidas)
@@ -0,0 +1,31 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.checks import Error, register
+
+# Revisiones de configuración de la app (se ejecutan con cada comando de
+# manage.py, incluido el worker procesar_cargas_masivas, que no arranca si fallan).
+
+
+@register()
+def revisar_directorio_carga_masiva(app_configs, **kwargs):
+    """
+    En modo 'worker' el archivo lo guarda el proceso web y lo lee el worker,
+    que en Heroku es otro dyno con su propio disco: CARGA_MASIVA_DIRECTORIO
+    tiene que ser un almacenamiento compartido, no la carpeta temporal local.
+    """
+    if settings.CARGA_MASIVA_EJECUCION != 'worker':
+        return []
+    directorio = os.path.realpath(settings.CARGA_MASIVA_DIRECTORIO)
+    temporal = os.path.realpath(tempfile.gettempdir())
+    if os.path.commonpath([directorio, temporal]) != temporal:
+        return []
+    return [Error(
+        'Con CARGA_MASIVA_EJECUCION=worker, CARGA_MASIVA_DIRECTORIO no puede estar '
+        f'en la carpeta temporal local ({temporal}): el worker no vería los archivos '
+        'que recibe el proceso web.',
+        hint='Configure CARGA_MASIVA_DIRECTORIO con un volumen compartido por los '
+             'procesos web y worker, o use CARGA_MASIVA_EJECUCION=hilo.',
+        id='Contenedor_Calificaciones.E001',
+    )]
@@ -0,0 +1,122 @@
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils.formats import number_format
+
+# Totales de los listados sin un COUNT(*) completo en cada request:
+# - resultados chicos: conteo exacto acotado (COUNT sobre un LIMIT), barato;
+# - resultados grandes: conteo exacto guardado en caché por la firma del
+#   filtro (su SQL) durante LISTADOS_CONTEO_CACHE_SEGUNDOS;
+# - en PostgreSQL, si el resultado es enorme: estimación del planificador
+#   (pg_class.reltuples sin filtros, EXPLAIN con filtros), que se muestra como
+#   aproximada ("~12.400").
+
+
+def _como_numero(otro):
+    # Solo se compara con números u otro Conteo; con el resto Python decide
+    if isinstance(otro, Conteo):
+        return otro.valor
+    if isinstance(otro, (int, float)):
+        return otro
+    return None
+
+
+@functools.total_ordering
+class Conteo:
+    """
+    Total de un listado. Se compara y convierte como un número (sirve con
+    `> 0` y `pluralize` en las plantillas) y se muestra con separador de
+    miles, con "~" delante si es una estimación.
+    """
+
+    def __init__(self, valor, aproximado=False):
+        self.valor = valor
+        self.aproximado = aproximado
+
+    def __int__(self):
+        return self.valor
+
+    def __float__(self):
+        return float(self.valor)
+
+    def __bool__(self):
+        return bool(self.valor)
+
+    def __eq__(self, otro):
+        otro = _como_numero(otro)
+        return NotImplemented if otro is None else self.valor == otro
+
+    def __lt__(self, otro):
+        otro = _como_numero(otro)
+        return NotImplemented if otro is None else self.valor < otro
+
+    def __hash__(self):
+        return hash(self.valor)
+
+    def __str__(self):
+        texto = number_format(self.valor, force_grouping=True)
+        return f'~{texto}' if self.aproximado else texto
+
+    def __repr__(self):
+        return f'<Conteo {self}>'
+
+
+def _redondear(valor):
+    # Las estimaciones se muestran con 3 cifras significativas
+    cifras = len(str(valor))
+    return round(valor, 3 - cifras) if cifras > 3 else valor
+
+
+def _clave(queryset):
+    sql, params = queryset.query.sql_with_params()
+    firma = hashlib.sha1(f'{queryset.db}|{sql}|{params!r}'.encode()).hexdigest()
+    return f'conteo:{firma}'
+
+
+def estimar(queryset):
+    """
+    Filas que el planificador de PostgreSQL estima para el queryset, o None en
+    otros motores (o si la tabla nunca se analizó).
+    """
+    conexion = connections[queryset.db]
+    if conexion.vendor != 'postgresql':
+        return None
+    with conexion.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [queryset.model._meta.db_table])
+            fila = cursor.fetchone()
+            return fila[0] if fila and fila[0] >= 0 else None
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+def contar(queryset):
+    """Retorna el Conteo del queryset según la estrategia de arriba."""
+    queryset = queryset.order_by()
+    limite = settings.LISTADOS_CONTEO_EXACTO_HASTA
+
+    acotado = queryset[:limite + 1].count()
+    if acotado <= limite:
+        return Conteo(acotado)
+
+    clave = _clave(queryset)
+    guardado = cache.get(clave)
+    if guardado is not None:
+        return Conteo(*guardado)
+
+    estimado = estimar(queryset)
+    if estimado is not None and estimado >= settings.LISTADOS_CONTEO_ESTIMADO_DESDE:
+        conteo = Conteo(_redondear(max(estimado, acotado)), aproximado=True)
+    else:
+        conteo = Conteo(queryset.count())
+    cache.set(clave, (conteo.valor, conteo.aproximado), settings.LISTADOS_CONTEO_CACHE_SEGUNDOS)
+    return conteo
@@ -0,0 +1,193 @@
+import json
+import re
+
+from django.apps import apps
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import CalificacionTributaria, Cuenta
+
+# Revisión de los índices de la app (comando reportar_indices):
+# - en PostgreSQL, índices sin uso (pg_stat_user_indexes.idx_scan = 0),
+#   duplicados exactos y redundantes (sus columnas son el comienzo de otro
+#   índice con el mismo predicado);
+# - planes de las consultas frecuentes de los listados, para comparar antes y
+#   después de un cambio de índices.
+
+SQL_INDICES = '''
+SELECT s.relname, s.indexrelname, s.idx_scan, pg_relation_size(s.indexrelid),
+       i.indisunique OR i.indisprimary, am.amname,
+       i.indkey::text, i.indclass::text, i.indoption::text,
+       coalesce(pg_get_expr(i.indexprs, i.indrelid), ''),
+       coalesce(pg_get_expr(i.indpred, i.indrelid), '')
+FROM pg_stat_user_indexes s
+JOIN pg_index i ON i.indexrelid = s.indexrelid
+JOIN pg_class c ON c.oid = s.indexrelid
+JOIN pg_am am ON am.oid = c.relam
+WHERE s.relname = ANY(%s)
+ORDER BY s.relname, s.indexrelname
+'''
+
+SQL_STATS_RESET = 'SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()'
+
+
+class Indice:
+    """Un índice según pg_index y pg_stat_user_indexes."""
+
+    def __init__(self, tabla, nombre, usos, tamano, unico, metodo, columnas, clases, opciones,
+                 expresiones, predicado):
+        self.tabla = tabla
+        self.nombre = nombre
+        self.usos = usos
+        self.tamano = tamano
+        self.unico = unico
+        self.metodo = metodo
+        self.columnas = columnas.split()
+        self.clases = clases.split()
+        self.opciones = opciones.split()
+        self.expresiones = expresiones
+        self.predicado = predicado
+
+    def firma(self):
+        # Dos índices con la misma firma son el mismo índice
+        return (self.tabla, self.metodo, tuple(self.columnas), tuple(self.clases),
+                tuple(self.opciones), self.expresiones, self.predicado)
+
+    def es_prefijo_de(self, otro):
+        n = len(self.columnas)
+        return (
+            self.tabla == otro.tabla and self.metodo == otro.metodo == 'btree'
+            and not self.expresiones and not otro.expresiones
+            and self.predicado == otro.predicado
+            and n < len(otro.columnas)
+            and otro.columnas[:n] == self.columnas and otro.clases[:n] == self.clases
+        )
+
+
+def tablas_de_la_app():
+    return [modelo._meta.db_table for modelo in apps.get_app_config('Contenedor_Calificaciones').get_models()]
+
+
+def leer_indices(tablas=None):
+    """Índices de las tablas (por defecto las de la app); solo PostgreSQL."""
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_INDICES, [tablas or tablas_de_la_app()])
+        return [Indice(*fila) for fila in cursor.fetchall()]
+
+
+def estadisticas_desde():
+    """Desde cuándo cuenta pg_stat_user_indexes (último reinicio de estadísticas)."""
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_STATS_RESET)
+        fila = cursor.fetchone()
+    return fila[0] if fila else None
+
+
+def sin_uso(indices):
+    # Los únicos y las llaves primarias se mantienen aunque no se lean: imponen una regla
+    return [indice for indice in indices if indice.usos == 0 and not indice.unico]
+
+
+def duplicados(indices):
+    """Pares (sobrante, índice que lo cubre): duplicados exactos y prefijos."""
+    pares = []
+    vistos = {}
+    for indice in indices:
+        igual = vistos.setdefault(indice.firma(), indice)
+        if igual is not indice:
+            # Sobra el que no es único
+            pares.append((igual, indice) if indice.unico and not igual.unico else (indice, igual))
+    sobrantes = {sobrante.nombre for sobrante, _ in pares}
+    for indice in indices:
+        if indice.unico or indice.nombre in sobrantes:
+            continue
+        for otro in indices:
+            if indice.es_prefijo_de(otro):
+                pares.append((indice, otro))
+                break
+    return pares
+
+
+def consultas_frecuentes():
+    """
+    {nombre: queryset} con las consultas de los listados, armadas con la cuenta
+    que tiene más calificaciones y su equipo (o vacío si no hay datos).
+    """
+    fila = (
+        CalificacionTributaria.objects.values('cuenta_id')
+        .annotate(total=Count('pk')).order_by('-total').first()
+    )
+    if fila is None:
+        return {}
+    cuenta = Cuenta.objects.get(pk=fila['cuenta_id'])
+    equipo = Cuenta.objects.filter(equipo_trabajo=cuenta.equipo_trabajo) if cuenta.equipo_trabajo_id else [cuenta]
+    jefe_rut = (
+        CalificacionTributaria.objects.exclude(revisado_por='')
+        .values_list('revisado_por', flat=True).first()
+    ) or cuenta.rut
+    calificaciones = CalificacionTributaria.objects.order_by()
+    keyset = ('-fecha_calculo', '-calificacion_id')
+    return {
+        'tus_calificaciones': calificaciones.filter(
+            cuenta_id=cuenta, estado_calificacion__in=['por_aprobar', 'aprobado', 'rechazado']
+        ).order_by('-fecha_calculo')[:10],
+        'por_enviar': calificaciones.filter(
+            cuenta_id=cuenta, estado_calificacion='por_enviar'
+        ).order_by('-fecha_calculo')[:10],
+        'pendientes_jefe': calificaciones.filter(
+            cuenta_id__in=equipo, estado_calificacion='por_aprobar'
+        ).order_by(*keyset)[:11],
+        'revisadas_jefe': calificaciones.filter(
+            revisado_por=jefe_rut, estado_calificacion='aprobado'
+        ).order_by(*keyset)[:11],
+        'pendientes_del_mes': calificaciones.filter(
+            cuenta_id__in=equipo, estado_calificacion='por_aprobar',
+            fecha_calculo__gte=timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0),
+        ).values('pk'),
+        'duplicados_carga': calificaciones.filter(
+            cuenta_id=cuenta, huella__in=['0' * 32]
+        ).exclude(estado_calificacion='eliminado').values('huella'),
+    }
+
+
+def _indices_del_plan(nodo, encontrados):
+    if 'Index Name' in nodo:
+        encontrados.append(nodo['Index Name'])
+    for hijo in nodo.get('Plans', ()):
+        _indices_del_plan(hijo, encontrados)
+    return encontrados
+
+
+def plan(queryset, analizar=False):
+    """
+    Plan de la consulta: {'costo', 'ms', 'indices', 'texto'}. En PostgreSQL
+    `costo` es el total estimado por el planificador y, con analizar=True (que
+    ejecuta la consulta), `ms` el tiempo real; en otros motores solo se
+    informan los índices.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor != 'postgresql':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            texto = '\n'.join(fila[-1] for fila in cursor.fetchall())
+            return {
+                'costo': None,
+                'ms': None,
+                'indices': re.findall(r'USING (?:COVERING )?INDEX (\w+)', texto),
+                'texto': texto,
+            }
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        resultado = cursor.fetchone()[0]
+        cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}' if analizar else f'EXPLAIN {sql}', params)
+        texto = '\n'.join(fila[0] for fila in cursor.fetchall())
+    if isinstance(resultado, str):
+        resultado = json.loads(resultado)
+    raiz = resultado[0]['Plan']
+    tiempo = re.search(r'Execution Time: ([\d.]+) ms', texto) if analizar else None
+    return {
+        'costo': raiz['Total Cost'],
+        'ms': float(tiempo.group(1)) if tiempo else None,
+        'indices': _indices_del_plan(raiz, []),
+        'texto': texto,
+    }
@@ -0,0 +1,117 @@
+import json
+import os
+import platform
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from Contenedor_Calificaciones.carga_masiva import benchmark
+from Contenedor_Calificaciones.models import Cuenta, Empresa
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark de la carga masiva: genera libros sintéticos con el formato de '
+        'la plantilla y mide lectura, validación, resolución de empresas y guardado. '
+        'El guardado se deshace al terminar. Los resultados quedan en un JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--filas', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+            help='Tamaños de archivo a medir (por defecto 1000 10000 100000 1000000).'
+        )
+        parser.add_argument(
+            '--invalidas', type=float, default=0.1,
+            help='Fracción de filas con errores de validación (por defecto 0.1).'
+        )
+        parser.add_argument(
+            '--semilla', type=int, default=1,
+            help='Semilla del generador, para repetir exactamente el mismo archivo.'
+        )
+        parser.add_argument(
+            '--directorio', default=os.path.join(tempfile.gettempdir(), 'nuam_benchmark'),
+            help='Dónde dejar los libros generados; se reutilizan entre ejecuciones.'
+        )
+        parser.add_argument(
+            '--salida',
+            help='Archivo JSON de resultados (por defecto benchmark_carga_masiva_<fecha>.json).'
+        )
+        parser.add_argument(
+            '--cuenta', type=int,
+            help='ID de la cuenta con que se guardan las calificaciones (por defecto la primera).'
+        )
+        parser.add_argument(
+            '--sin-guardado', action='store_true',
+            help='No mide la fase de guardado.'
+        )
+        parser.add_argument(
+            '--memoria', action='store_true',
+            help='Mide además los bytes por fila validada como dict y como FilaCalificacion.'
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['invalidas'] <= 1:
+            raise CommandError('--invalidas debe estar entre 0 y 1.')
+
+        empresas = dict(
+            Empresa.objects.order_by('empresa_rut').values_list('empresa_rut', 'nombre_empresa')[:500]
+        )
+        if not empresas:
+            raise CommandError('Se necesita al menos una empresa registrada para generar los archivos.')
+
+        cuenta_id = None
+        if not options['sin_guardado']:
+            cuentas = Cuenta.objects.order_by('pk')
+            if options['cuenta']:
+                cuentas = cuentas.filter(pk=options['cuenta'])
+            cuenta_id = cuentas.values_list('pk', flat=True).first()
+            if cuenta_id is None:
+                raise CommandError('No hay una cuenta con que medir el guardado (use --cuenta o --sin-guardado).')
+
+        os.makedirs(options['directorio'], exist_ok=True)
+        resultados = []
+        # De menor a mayor: el pico de memoria del proceso solo puede crecer
+        for filas in sorted(options['filas']):
+            ruta = os.path.join(
+                options['directorio'],
+                f"carga_{filas}_{options['invalidas']}_{options['semilla']}.xlsx"
+            )
+            if not os.path.exists(ruta):
+                self.stdout.write(f'Generando {ruta}...')
+                benchmark.generar_libro(ruta, filas, empresas, options['invalidas'], options['semilla'])
+
+            self.stdout.write(f'Midiendo {filas} filas...')
+            resultado = benchmark.medir_carga(
+                ruta, cuenta_id, settings.CARGA_MASIVA_TAMANO_BLOQUE, guardar=cuenta_id is not None
+            )
+            resultado['archivo_mb'] = round(os.path.getsize(ruta) / (1024 * 1024), 2)
+            if options['memoria']:
+                resultado['memoria'] = benchmark.bytes_por_fila(ruta, settings.CARGA_MASIVA_TAMANO_BLOQUE)
+            if resultado.get('memoria'):
+                self.stdout.write(
+                    f"  memoria por fila: dict {resultado['memoria']['bytes_por_fila_dict']} B, "
+                    f"FilaCalificacion {resultado['memoria']['bytes_por_fila_slots']} B"
+                )
+            resultados.append(resultado)
+            self.stdout.write(
+                '  ' + ', '.join(f'{fase} {segundos:.2f}s' for fase, segundos in resultado['segundos'].items())
+                + f" | {resultado['filas_por_segundo_total']} filas/s | RSS pico {resultado['rss_pico_mb']} MB"
+            )
+
+        fecha = timezone.now()
+        salida = options['salida'] or f"benchmark_carga_masiva_{fecha:%Y%m%d_%H%M%S}.json"
+        with open(salida, 'w', encoding='utf-8') as archivo:
+            json.dump({
+                'fecha': fecha.isoformat(),
+                'python': platform.python_version(),
+                'plataforma': platform.platform(),
+                'motor_excel': settings.CARGA_MASIVA_MOTOR_EXCEL,
+                'tamano_bloque': settings.CARGA_MASIVA_TAMANO_BLOQUE,
+                'proporcion_invalidas': options['invalidas'],
+                'semilla': options['semilla'],
+                'resultados': resultados,
+            }, archivo, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {salida}'))
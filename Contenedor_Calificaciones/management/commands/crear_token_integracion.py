@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Contenedor_Calificaciones.models import Cuenta, TokenIntegracion
+from Contenedor_Calificaciones.validators import formatear_rut
+from Contenedor_Calificaciones.views import ROL_CALIFICADOR
+
+
+class Command(BaseCommand):
+    help = (
+        'Crea un token de integración para la cuenta de un Calificador '
+        'Tributario (cabecera Authorization: Token <clave> de la API de '
+        'ingesta), o revoca los tokens de la cuenta con --revocar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('rut', help='RUT de la cuenta del Calificador Tributario.')
+        parser.add_argument(
+            '--nombre',
+            help='Nombre que identifica a la integración (por defecto "Integración").'
+        )
+        parser.add_argument(
+            '--revocar', action='store_true',
+            help='Desactiva los tokens de la cuenta (solo los del --nombre indicado, si se da).'
+        )
+
+    def handle(self, *args, **options):
+        cuenta = Cuenta.objects.filter(rut=formatear_rut(options['rut'])).first()
+        if cuenta is None:
+            raise CommandError(f'No existe una cuenta con RUT {options["rut"]}.')
+
+        if options['revocar']:
+            tokens = cuenta.tokens_integracion.filter(activo=True)
+            if options['nombre']:
+                tokens = tokens.filter(nombre=options['nombre'])
+            revocados = tokens.update(activo=False)
+            self.stdout.write(self.style.SUCCESS(f'{revocados} tokens revocados.'))
+            return
+
+        if cuenta.rol != ROL_CALIFICADOR:
+            raise CommandError('Solo un Calificador Tributario puede usar la API de ingesta.')
+
+        token, clave = TokenIntegracion.crear(cuenta, options['nombre'] or 'Integración')
+        self.stdout.write(f'Token "{token.nombre}" creado para {cuenta.rut}. Guárdelo, no se vuelve a mostrar:')
+        self.stdout.write(clave)
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from Contenedor_Calificaciones.carga_masiva import tareas
+
+
+class Command(BaseCommand):
+    help = (
+        'Worker de la carga masiva: valida y guarda los lotes pendientes. '
+        'Se usa con CARGA_MASIVA_EJECUCION=worker (p. ej. en un dyno worker).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez', action='store_true',
+            help='Procesa los lotes pendientes y termina, en vez de quedar esperando.'
+        )
+        parser.add_argument(
+            '--intervalo', type=float, default=2.0,
+            help='Segundos de espera cuando no hay lotes pendientes (por defecto 2).'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            tareas.reanudar_interrumpidos()
+            lote_id = tareas.siguiente_pendiente()
+            if lote_id is None:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            self.stdout.write(f'Procesando lote {lote_id}...')
+            tareas.ejecutar(lote_id)
@@ -0,0 +1,26 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from Contenedor_Calificaciones.revisiones import rellenar_revisiones
+
+
+class Command(BaseCommand):
+    help = (
+        'Rellena revisado_por, fecha_revision y observacion_revision de las '
+        'calificaciones aprobadas o rechazadas que aún no las tienen (la '
+        'migración 0024 ya lo hace al aplicarse).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamano', type=int, default=2000,
+            help='Calificaciones que se actualizan por transacción (por defecto 2000).'
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for estado, actualizadas, ultimo in rellenar_revisiones(apps, options['tamano']):
+            total += actualizadas
+            self.stdout.write(f'{estado}: {actualizadas} calificaciones actualizadas (hasta id {ultimo}).')
+
+        self.stdout.write(self.style.SUCCESS(f'Listo: {total} calificaciones con la revisión rellenada.'))
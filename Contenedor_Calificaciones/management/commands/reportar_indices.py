@@ -0,0 +1,123 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.template.defaultfilters import filesizeformat
+
+from Contenedor_Calificaciones import indices
+
+
+class Command(BaseCommand):
+    help = (
+        'Reporta los índices de la app sin uso, duplicados o redundantes (según '
+        'pg_stat_user_indexes) y los planes de las consultas frecuentes de los '
+        'listados. Con --guardar y --comparar se comparan los planes antes y '
+        'después de un cambio de índices (por ejemplo, de una migración).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--planes', action='store_true',
+            help='Muestra además el plan de cada consulta frecuente.'
+        )
+        parser.add_argument(
+            '--analizar', action='store_true',
+            help='Usa EXPLAIN ANALYZE (ejecuta las consultas, que solo leen) para medir el tiempo real.'
+        )
+        parser.add_argument(
+            '--guardar',
+            help='Guarda los planes en este archivo JSON (p. ej. antes de migrar).'
+        )
+        parser.add_argument(
+            '--comparar',
+            help='Compara los planes actuales con los de un archivo de --guardar.'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'postgresql':
+            self.reportar_indices()
+        else:
+            self.stdout.write(self.style.WARNING(
+                'pg_stat_user_indexes solo existe en PostgreSQL: se omite el reporte de índices.'
+            ))
+
+        if not (options['planes'] or options['guardar'] or options['comparar']):
+            return
+
+        planes = {
+            nombre: indices.plan(queryset, analizar=options['analizar'])
+            for nombre, queryset in indices.consultas_frecuentes().items()
+        }
+        if not planes:
+            self.stdout.write('No hay calificaciones con que armar las consultas frecuentes.')
+            return
+
+        if options['comparar']:
+            try:
+                with open(options['comparar'], encoding='utf-8') as archivo:
+                    anteriores = json.load(archivo)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'No se pudo leer {options["comparar"]}: {e}')
+            self.comparar_planes(anteriores, planes, con_texto=options['planes'])
+        else:
+            self.mostrar_planes(planes, con_texto=options['planes'])
+
+        if options['guardar']:
+            with open(options['guardar'], 'w', encoding='utf-8') as archivo:
+                json.dump(planes, archivo, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Planes guardados en {options["guardar"]}'))
+
+    def reportar_indices(self):
+        lista = indices.leer_indices()
+        desde = indices.estadisticas_desde()
+        self.stdout.write(f'{len(lista)} índices en {len(indices.tablas_de_la_app())} tablas.')
+        self.stdout.write(f'Usos contados desde {desde:%d/%m/%Y %H:%M}.' if desde else
+                          'Usos contados desde que arrancó el servidor.')
+
+        self.stdout.write(self.style.MIGRATE_HEADING('\nSin uso (idx_scan = 0, sin contar únicos):'))
+        sin_uso = indices.sin_uso(lista)
+        for indice in sin_uso:
+            self.stdout.write(f'  {indice.tabla}.{indice.nombre} ({filesizeformat(indice.tamano)})')
+        if not sin_uso:
+            self.stdout.write('  Ninguno.')
+
+        self.stdout.write(self.style.MIGRATE_HEADING('\nDuplicados o cubiertos por otro índice:'))
+        pares = indices.duplicados(lista)
+        for sobrante, cubre in pares:
+            self.stdout.write(
+                f'  {sobrante.tabla}.{sobrante.nombre} ({filesizeformat(sobrante.tamano)}, '
+                f'{sobrante.usos} usos) lo cubre {cubre.nombre}'
+            )
+        if not pares:
+            self.stdout.write('  Ninguno.')
+
+    def mostrar_planes(self, planes, con_texto):
+        self.stdout.write(self.style.MIGRATE_HEADING('\nConsultas frecuentes:'))
+        for nombre, datos in planes.items():
+            self.stdout.write(f'  {nombre}: {self.resumen(datos)}')
+            if con_texto:
+                for linea in datos['texto'].splitlines():
+                    self.stdout.write(f'      {linea}')
+
+    def comparar_planes(self, anteriores, planes, con_texto):
+        self.stdout.write(self.style.MIGRATE_HEADING('\nConsultas frecuentes (antes -> después):'))
+        for nombre, datos in planes.items():
+            antes = anteriores.get(nombre)
+            if antes is None:
+                self.stdout.write(f'  {nombre}: (sin plan anterior) {self.resumen(datos)}')
+                continue
+            self.stdout.write(f'  {nombre}:')
+            for etiqueta, plan in (('antes:  ', antes), ('después:', datos)):
+                self.stdout.write(f'      {etiqueta} {self.resumen(plan)}')
+                if con_texto:
+                    for linea in plan['texto'].splitlines():
+                        self.stdout.write(f'          {linea}')
+
+    def resumen(self, datos):
+        partes = []
+        if datos.get('costo') is not None:
+            partes.append(f'costo {datos["costo"]:.2f}')
+        if datos.get('ms') is not None:
+            partes.append(f'{datos["ms"]:.3f} ms')
+        partes.append(f'índices: {", ".join(datos["indices"]) or "ninguno (recorre la tabla)"}')
+        return ', '.join(partes)
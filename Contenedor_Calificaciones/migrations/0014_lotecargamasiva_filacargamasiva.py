@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:37
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contenedor_Calificaciones', '0013_alter_calificaciontributaria_factor_tributario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoteCargaMasiva',
+            fields=[
+                ('lote_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ID Lote')),
+                ('archivo_nombre', models.CharField(max_length=255, verbose_name='Nombre del Archivo')),
+                ('estado', models.CharField(choices=[('validado', 'Validado'), ('guardado', 'Guardado')], default='validado', max_length=20, verbose_name='Estado del Lote')),
+                ('total_filas', models.IntegerField(default=0, verbose_name='Total de Filas')),
+                ('filas_validas', models.IntegerField(default=0, verbose_name='Filas Válidas')),
+                ('fecha_creacion', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Fecha de Creación')),
+                ('cuenta', models.ForeignKey(db_column='cuenta_id', on_delete=django.db.models.deletion.CASCADE, related_name='lotes_carga_masiva', to='Contenedor_Calificaciones.cuenta', verbose_name='Cuenta')),
+            ],
+            options={
+                'verbose_name': 'Lote de Carga Masiva',
+                'verbose_name_plural': 'Lotes de Carga Masiva',
+                'db_table': 'lote_carga_masiva',
+            },
+        ),
+        migrations.CreateModel(
+            name='FilaCargaMasiva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fila', models.IntegerField(verbose_name='Fila en el Archivo')),
+                ('rut_empresa', models.TextField(blank=True)),
+                ('nombre_empresa', models.TextField(blank=True)),
+                ('anio_tributario', models.IntegerField(blank=True, null=True)),
+                ('tipo_calificacion', models.TextField(blank=True)),
+                ('monto_tributario', models.FloatField(blank=True, null=True)),
+                ('factor_tributario', models.FloatField(blank=True, null=True)),
+                ('unidad_valor', models.TextField(blank=True)),
+                ('puntaje_calificacion', models.IntegerField(blank=True, null=True)),
+                ('categoria_calificacion', models.CharField(blank=True, max_length=10, null=True)),
+                ('nivel_riesgo', models.CharField(blank=True, max_length=10, null=True)),
+                ('justificacion_resultado', models.TextField(blank=True)),
+                ('errores', models.JSONField(blank=True, default=list)),
+                ('valido', models.BooleanField(default=False)),
+                ('lote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='filas', to='Contenedor_Calificaciones.lotecargamasiva', verbose_name='Lote')),
+            ],
+            options={
+                'verbose_name': 'Fila de Carga Masiva',
+                'verbose_name_plural': 'Filas de Carga Masiva',
+                'db_table': 'fila_carga_masiva',
+                'ordering': ['lote', 'fila'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='lotecargamasiva',
+            index=models.Index(fields=['fecha_creacion'], name='idx_lote_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='filacargamasiva',
+            index=models.Index(fields=['lote', 'fila'], name='idx_fila_lote_fila'),
+        ),
+    ]
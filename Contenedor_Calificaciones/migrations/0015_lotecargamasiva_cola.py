@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contenedor_Calificaciones', '0014_lotecargamasiva_filacargamasiva'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lotecargamasiva',
+            name='archivo_ruta',
+            field=models.CharField(blank=True, max_length=500, verbose_name='Ruta del Archivo'),
+        ),
+        migrations.AddField(
+            model_name='lotecargamasiva',
+            name='duracion_guardado',
+            field=models.FloatField(blank=True, null=True, verbose_name='Duración del Guardado (s)'),
+        ),
+        migrations.AddField(
+            model_name='lotecargamasiva',
+            name='errores_globales',
+            field=models.JSONField(blank=True, default=list, verbose_name='Errores Globales'),
+        ),
+        migrations.AddField(
+            model_name='lotecargamasiva',
+            name='estado_destino',
+            field=models.CharField(blank=True, max_length=20, verbose_name='Estado de Destino'),
+        ),
+        migrations.AddField(
+            model_name='lotecargamasiva',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización'),
+        ),
+        migrations.AddField(
+            model_name='lotecargamasiva',
+            name='filas_con_errores',
+            field=models.IntegerField(default=0, verbose_name='Filas con Errores'),
+        ),
+        migrations.AddField(
+            model_name='lotecargamasiva',
+            name='filas_guardadas',
+            field=models.IntegerField(default=0, verbose_name='Filas Guardadas'),
+        ),
+        migrations.AlterField(
+            model_name='lotecargamasiva',
+            name='estado',
+            field=models.CharField(choices=[('en_cola', 'En Cola'), ('validando', 'Validando'), ('validado', 'Validado'), ('por_guardar', 'Por Guardar'), ('guardando', 'Guardando'), ('guardado', 'Guardado'), ('error', 'Error')], default='en_cola', max_length=20, verbose_name='Estado del Lote'),
+        ),
+        migrations.AddIndex(
+            model_name='lotecargamasiva',
+            index=models.Index(fields=['estado', 'fecha_creacion'], name='idx_lote_estado_fecha'),
+        ),
+    ]
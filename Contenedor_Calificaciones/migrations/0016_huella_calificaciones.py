@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:47
+
+from django.db import migrations, models
+
+from Contenedor_Calificaciones.carga_masiva.huella import calcular_huella
+
+
+def rellenar_huellas(apps, schema_editor):
+    # Calcula la huella de las calificaciones que ya existían, por partes
+    CalificacionTributaria = apps.get_model('Contenedor_Calificaciones', 'CalificacionTributaria')
+    pendientes = []
+    for calificacion in CalificacionTributaria.objects.only(
+        'rut_empresa_id', 'anio_tributario', 'tipo_calificacion', 'monto_tributario',
+        'factor_tributario', 'unidad_valor', 'puntaje_calificacion',
+        'categoria_calificacion', 'nivel_riesgo',
+    ).iterator(chunk_size=2000):
+        calificacion.huella = calcular_huella(
+            calificacion.rut_empresa_id, calificacion.anio_tributario, calificacion.tipo_calificacion,
+            calificacion.monto_tributario, calificacion.factor_tributario, calificacion.unidad_valor,
+            calificacion.puntaje_calificacion, calificacion.categoria_calificacion, calificacion.nivel_riesgo
+        )
+        pendientes.append(calificacion)
+        if len(pendientes) >= 2000:
+            CalificacionTributaria.objects.bulk_update(pendientes, ['huella'])
+            pendientes = []
+    if pendientes:
+        CalificacionTributaria.objects.bulk_update(pendientes, ['huella'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contenedor_Calificaciones', '0015_lotecargamasiva_cola'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calificaciontributaria',
+            name='huella',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Huella'),
+        ),
+        migrations.AddField(
+            model_name='filacargamasiva',
+            name='huella',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='lotecargamasiva',
+            name='filas_duplicadas',
+            field=models.IntegerField(default=0, verbose_name='Filas ya Importadas o Repetidas'),
+        ),
+        migrations.RunPython(rellenar_huellas, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='calificaciontributaria',
+            index=models.Index(fields=['cuenta_id', 'huella'], name='idx_calificacion_huella'),
+        ),
+        migrations.AddIndex(
+            model_name='filacargamasiva',
+            index=models.Index(fields=['lote', 'huella'], name='idx_fila_lote_huella'),
+        ),
+    ]
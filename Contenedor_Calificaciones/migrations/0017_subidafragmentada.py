@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:49
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contenedor_Calificaciones', '0016_huella_calificaciones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubidaFragmentada',
+            fields=[
+                ('subida_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ID Subida')),
+                ('archivo_nombre', models.CharField(max_length=255, verbose_name='Nombre del Archivo')),
+                ('tamano_total', models.BigIntegerField(verbose_name='Tamaño Total (bytes)')),
+                ('bytes_recibidos', models.BigIntegerField(default=0, verbose_name='Bytes Recibidos')),
+                ('sha256', models.CharField(max_length=64, verbose_name='Checksum SHA-256')),
+                ('ruta', models.CharField(blank=True, max_length=500, verbose_name='Ruta del Archivo Parcial')),
+                ('estado', models.CharField(choices=[('recibiendo', 'Recibiendo'), ('completa', 'Completa'), ('error', 'Error')], default='recibiendo', max_length=20, verbose_name='Estado de la Subida')),
+                ('fecha_creacion', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Fecha de Creación')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')),
+                ('cuenta', models.ForeignKey(db_column='cuenta_id', on_delete=django.db.models.deletion.CASCADE, related_name='subidas_fragmentadas', to='Contenedor_Calificaciones.cuenta', verbose_name='Cuenta')),
+                ('lote', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='subidas', to='Contenedor_Calificaciones.lotecargamasiva', verbose_name='Lote')),
+            ],
+            options={
+                'verbose_name': 'Subida Fragmentada',
+                'verbose_name_plural': 'Subidas Fragmentadas',
+                'db_table': 'subida_fragmentada',
+                'indexes': [models.Index(fields=['fecha_creacion'], name='idx_subida_fecha')],
+            },
+        ),
+    ]
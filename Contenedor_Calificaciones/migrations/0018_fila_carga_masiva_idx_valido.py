@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contenedor_Calificaciones', '0017_subidafragmentada'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filacargamasiva',
+            index=models.Index(fields=['lote', 'valido', 'fila'], name='idx_fila_lote_valido_fila'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contenedor_Calificaciones', '0018_fila_carga_masiva_idx_valido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lotecargamasiva',
+            name='ultima_fila_guardada',
+            field=models.IntegerField(default=0, verbose_name='Última Fila Guardada'),
+        ),
+    ]
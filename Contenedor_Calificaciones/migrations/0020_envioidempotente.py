@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contenedor_Calificaciones', '0019_lotecargamasiva_ultima_fila_guardada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvioIdempotente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=255, verbose_name='Clave de Idempotencia')),
+                ('estado', models.CharField(choices=[('en_curso', 'En Curso'), ('completado', 'Completado')], default='en_curso', max_length=20, verbose_name='Estado del Envío')),
+                ('resumen', models.JSONField(blank=True, default=dict, verbose_name='Resumen del Resultado')),
+                ('fecha_creacion', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Fecha de Creación')),
+                ('cuenta', models.ForeignKey(db_column='cuenta_id', on_delete=django.db.models.deletion.CASCADE, related_name='envios_idempotentes', to='Contenedor_Calificaciones.cuenta', verbose_name='Cuenta')),
+            ],
+            options={
+                'verbose_name': 'Envío Idempotente',
+                'verbose_name_plural': 'Envíos Idempotentes',
+                'db_table': 'envio_idempotente',
+                'indexes': [models.Index(fields=['fecha_creacion'], name='idx_envio_fecha')],
+                'constraints': [models.UniqueConstraint(fields=('cuenta', 'clave'), name='uniq_envio_por_cuenta_clave')],
+            },
+        ),
+    ]
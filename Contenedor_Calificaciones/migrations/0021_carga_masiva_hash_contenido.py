@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contenedor_Calificaciones', '0020_envioidempotente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filacargamasiva',
+            name='hash_contenido',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='lotecargamasiva',
+            name='filas_reutilizadas',
+            field=models.IntegerField(default=0, verbose_name='Filas sin Cambios Reutilizadas'),
+        ),
+        migrations.AddIndex(
+            model_name='filacargamasiva',
+            index=models.Index(fields=['lote', 'hash_contenido'], name='idx_fila_lote_hash'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:06
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalizar_nombre_empresa(value):
+    # Copia congelada de validators.normalizar_nombre_empresa tal como estaba
+    # al crear esta migración: un cambio posterior de esa función no debe
+    # cambiar lo que hace la migración
+    texto = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode("ascii")
+    palabras = re.sub(r"[^a-z0-9]+", " ", texto.lower().replace(".", "")).split()
+    resultado = []
+    sigla = False
+    for palabra in palabras:
+        if len(palabra) == 1 and sigla:
+            resultado[-1] += palabra
+        else:
+            resultado.append(palabra)
+            sigla = len(palabra) == 1
+    return " ".join(resultado)
+
+
+def rellenar_nombres(apps, schema_editor):
+    # Normaliza el nombre de las empresas que ya existían
+    Empresa = apps.get_model('Contenedor_Calificaciones', 'Empresa')
+    empresas = list(Empresa.objects.only('nombre_empresa'))
+    for empresa in empresas:
+        empresa.nombre_normalizado = normalizar_nombre_empresa(empresa.nombre_empresa)
+    Empresa.objects.bulk_update(empresas, ['nombre_normalizado'], batch_size=2000)
+
+
+def crear_indice_trigramas(apps, schema_editor):
+    # Solo en PostgreSQL: en otras BD la similitud se calcula en memoria
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # GiST sirve tanto para el operador % como para ordenar por distancia (<->)
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_empresa_nombre_trgm '
+        'ON empresa USING gist (nombre_normalizado gist_trgm_ops)'
+    )
+
+
+def borrar_indice_trigramas(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS idx_empresa_nombre_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contenedor_Calificaciones', '0021_carga_masiva_hash_contenido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empresa',
+            name='nombre_normalizado',
+            field=models.CharField(blank=True, editable=False, max_length=150),
+        ),
+        migrations.RunPython(rellenar_nombres, migrations.RunPython.noop),
+        migrations.RunPython(crear_indice_trigramas, borrar_indice_trigramas),
+    ]
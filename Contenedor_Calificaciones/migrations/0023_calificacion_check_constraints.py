@@ -0,0 +1,94 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:08
+
+from django.db import migrations, models, transaction
+
+RESTRICCIONES = [
+    models.CheckConstraint(condition=models.Q(('anio_tributario__gte', 1900), ('anio_tributario__lte', 2100)), name='chk_calificacion_anio', violation_error_message='El año tributario debe estar entre 1900 y 2100.'),
+    models.CheckConstraint(condition=models.Q(('monto_tributario__gte', 0)), name='chk_calificacion_monto', violation_error_message='El monto tributario no puede ser negativo.'),
+    models.CheckConstraint(condition=models.Q(('factor_tributario__gte', 0), ('factor_tributario__lte', 1)), name='chk_calificacion_factor', violation_error_message='El factor tributario debe ser un valor entre 0 y 1.'),
+    models.CheckConstraint(condition=models.Q(('puntaje_calificacion__gte', 0), ('puntaje_calificacion__lte', 100)), name='chk_calificacion_puntaje', violation_error_message='El puntaje debe estar entre 0 y 100.'),
+    models.CheckConstraint(condition=models.Q(('categoria_calificacion__in', ['bajo', 'medio', 'alto'])), name='chk_calificacion_categoria', violation_error_message='Categoría de calificación no válida.'),
+    models.CheckConstraint(condition=models.Q(('nivel_riesgo__in', ['bajo', 'medio', 'alto', 'critico'])), name='chk_calificacion_riesgo', violation_error_message='Nivel de riesgo no válido.'),
+    models.CheckConstraint(condition=models.Q(('estado_calificacion__in', ['por_enviar', 'por_aprobar', 'aprobado', 'rechazado', 'eliminado', 'mal_ingresada'])), name='chk_calificacion_estado', violation_error_message='Estado de calificación no válido.'),
+    models.CheckConstraint(condition=models.Q(('metodo_calificacion__in', ['masiva', 'manual'])), name='chk_calificacion_metodo', violation_error_message='Método de calificación no válido.'),
+]
+
+
+def revisar_filas(apps, schema_editor):
+    # Antes de agregar las restricciones: si hay filas que no las cumplen, la
+    # migración se detiene aquí (sin haber cambiado el esquema) e indica cuáles
+    # corregir, en vez de fallar a medias en un VALIDATE
+    CalificacionTributaria = apps.get_model('Contenedor_Calificaciones', 'CalificacionTributaria')
+    problemas = []
+    for restriccion in RESTRICCIONES:
+        invalidas = CalificacionTributaria.objects.exclude(restriccion.condition).order_by('pk')
+        cantidad = invalidas.count()
+        if cantidad:
+            ids = ', '.join(str(pk) for pk in invalidas.values_list('pk', flat=True)[:10])
+            problemas.append(f'{restriccion.name}: {cantidad} filas (ids {ids}{", ..." if cantidad > 10 else ""})')
+    if problemas:
+        raise RuntimeError(
+            'Hay calificaciones que no cumplen las nuevas restricciones; corríjalas y vuelva a migrar:\n  '
+            + '\n  '.join(problemas)
+        )
+
+
+class AgregarCheck(migrations.AddConstraint):
+    # En PostgreSQL el CHECK se agrega con NOT VALID: no recorre la tabla, así
+    # que el bloqueo ACCESS EXCLUSIVE del ALTER TABLE dura solo lo que tarda
+    # su propia transacción, que se confirma enseguida. Las filas existentes
+    # se revisan después en validar_restricciones. Si la restricción ya existe
+    # (una migración interrumpida) no se vuelve a agregar. En otros motores es
+    # un AddConstraint normal.
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        with transaction.atomic(using=schema_editor.connection.alias):
+            if not _existe(schema_editor, model._meta.db_table, self.constraint.name):
+                schema_editor.execute(f'{self.constraint.create_sql(model, schema_editor)} NOT VALID', params=None)
+
+
+def _existe(schema_editor, tabla, nombre):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_constraint WHERE conname = %s AND conrelid = %s::regclass',
+            [nombre, tabla],
+        )
+        return cursor.fetchone() is not None
+
+
+def validar_restricciones(apps, schema_editor):
+    # Solo en PostgreSQL: cada VALIDATE CONSTRAINT va en su propia transacción
+    # (la migración no es atómica) y toma SHARE UPDATE EXCLUSIVE, que no
+    # bloquea lecturas ni escrituras mientras recorre la tabla. Validar una
+    # restricción que ya es válida no hace nada, así que se puede repetir
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    tabla = apps.get_model('Contenedor_Calificaciones', 'CalificacionTributaria')._meta.db_table
+    for restriccion in RESTRICCIONES:
+        schema_editor.execute(
+            f'ALTER TABLE {schema_editor.quote_name(tabla)} '
+            f'VALIDATE CONSTRAINT {schema_editor.quote_name(restriccion.name)}',
+            params=None,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contenedor_Calificaciones', '0022_empresa_nombre_normalizado'),
+    ]
+
+    # Sin transacción global: en PostgreSQL cada ADD y cada VALIDATE se confirma por separado
+    atomic = False
+
+    operations = [
+        migrations.RunPython(revisar_filas, migrations.RunPython.noop),
+        *(
+            AgregarCheck(model_name='calificaciontributaria', constraint=restriccion)
+            for restriccion in RESTRICCIONES
+        ),
+        migrations.RunPython(validar_restricciones, migrations.RunPython.noop),
+    ]
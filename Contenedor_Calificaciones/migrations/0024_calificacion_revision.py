@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:14
+
+from django.db import migrations, models
+
+from Contenedor_Calificaciones.revisiones import rellenar_revisiones
+
+
+def rellenar(apps, schema_editor):
+    # Copia la revisión de las calificaciones ya aprobadas o rechazadas a las
+    # columnas nuevas (mismo código que el comando rellenar_revisiones)
+    for _ in rellenar_revisiones(apps):
+        pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contenedor_Calificaciones', '0023_calificacion_check_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calificaciontributaria',
+            name='fecha_revision',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Fecha de Revisión'),
+        ),
+        migrations.AddField(
+            model_name='calificaciontributaria',
+            name='observacion_revision',
+            field=models.TextField(blank=True, editable=False, verbose_name='Observaciones de la Revisión'),
+        ),
+        migrations.AddField(
+            model_name='calificaciontributaria',
+            name='revisado_por',
+            field=models.CharField(blank=True, editable=False, max_length=13, verbose_name='RUT del Jefe Revisor'),
+        ),
+        migrations.RunPython(rellenar, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='calificaciontributaria',
+            index=models.Index(fields=['revisado_por', 'estado_calificacion', '-fecha_calculo', '-calificacion_id'], name='idx_calificacion_revision'),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class AgregarIndice(migrations.AddIndex):
+    # En PostgreSQL el índice se crea con CONCURRENTLY (sin bloquear las
+    # escrituras mientras recorre la tabla). En otros motores es un AddIndex normal.
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+
+class BorrarIndice(migrations.RemoveIndex):
+    # Igual que AgregarIndice, pero con DROP INDEX CONCURRENTLY
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            index = from_state.models[app_label, self.model_name_lower].get_index_by_name(self.name)
+            schema_editor.remove_index(model, index, concurrently=True)
+
+
+def crear_indice_brin(apps, schema_editor):
+    # Solo en PostgreSQL: fecha_calculo crece junto con el orden físico de la
+    # tabla (las filas se insertan en orden), así que un BRIN de pocas páginas
+    # basta para los filtros por rango de fechas (dashboard, antigüedad) en
+    # vez del btree idx_calificacion_fecha
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_calificacion_fecha_brin '
+        'ON calificacion_tributaria USING brin (fecha_calculo)'
+    )
+
+
+def borrar_indice_brin(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS idx_calificacion_fecha_brin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contenedor_Calificaciones', '0024_calificacion_revision'),
+    ]
+
+    # Sin transacción: CREATE/DROP INDEX CONCURRENTLY no se puede usar dentro de una
+    atomic = False
+
+    # Primero los índices nuevos y después se borran los que reemplazan, así
+    # las consultas no quedan sin índice entre medio
+    operations = [
+        AgregarIndice(
+            model_name='calificaciontributaria',
+            index=models.Index(fields=['cuenta_id', 'estado_calificacion', '-fecha_calculo', '-calificacion_id'], name='idx_calificacion_cuenta_estado'),
+        ),
+        AgregarIndice(
+            model_name='calificaciontributaria',
+            index=models.Index(condition=models.Q(('estado_calificacion', 'por_aprobar')), fields=['-fecha_calculo', '-calificacion_id', 'cuenta_id'], name='idx_calificacion_por_aprobar'),
+        ),
+        migrations.RunPython(crear_indice_brin, borrar_indice_brin),
+        # Prefijos de idx_calificacion_cuenta_estado, o de poca selectividad
+        BorrarIndice(
+            model_name='calificaciontributaria',
+            name='idx_calificacion_estado',
+        ),
+        BorrarIndice(
+            model_name='calificaciontributaria',
+            name='idx_calificacion_fecha',
+        ),
+        BorrarIndice(
+            model_name='calificaciontributaria',
+            name='idx_calificacion_cuenta',
+        ),
+        # Índice automático de la llave foránea: otro duplicado de cuenta_id
+        migrations.AlterField(
+            model_name='calificaciontributaria',
+            name='cuenta_id',
+            field=models.ForeignKey(db_column='cuenta_id', db_index=False, editable=False, help_text='Usuario que crea la calificación', on_delete=django.db.models.deletion.PROTECT, related_name='calificaciones', to='Contenedor_Calificaciones.cuenta', verbose_name='Cuenta'),
+        ),
+        # rut ya es unique=True, que crea su propio índice
+        BorrarIndice(
+            model_name='cuenta',
+            name='idx_cuenta_rut',
+        ),
+    ]
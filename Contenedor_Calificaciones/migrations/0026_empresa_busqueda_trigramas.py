@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:30
+
+from django.db import migrations
+
+
+def crear_indices_busqueda(apps, schema_editor):
+    # Solo en PostgreSQL: los filtros icontains de los listados compilan a
+    # UPPER(col::text) LIKE UPPER('%x%'); un GIN de trigramas sobre esa misma
+    # expresión los resuelve sin recorrer la tabla. En otros motores se usa el
+    # índice en memoria de busqueda.py
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_empresa_rut_busqueda '
+        'ON empresa USING gin (upper(empresa_rut::text) gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_empresa_nombre_busqueda '
+        'ON empresa USING gin (upper(nombre_empresa::text) gin_trgm_ops)'
+    )
+
+
+def borrar_indices_busqueda(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS idx_empresa_rut_busqueda')
+    schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS idx_empresa_nombre_busqueda')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contenedor_Calificaciones', '0025_indices_carga_de_trabajo'),
+    ]
+
+    # Sin transacción: CREATE/DROP INDEX CONCURRENTLY no se puede usar dentro de una
+    atomic = False
+
+    operations = [
+        migrations.RunPython(crear_indices_busqueda, borrar_indices_busqueda),
+    ]
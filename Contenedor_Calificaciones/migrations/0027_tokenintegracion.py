@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contenedor_Calificaciones', '0026_empresa_busqueda_trigramas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenIntegracion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, verbose_name='Nombre de la Integración')),
+                ('prefijo', models.CharField(editable=False, max_length=8, verbose_name='Prefijo')),
+                ('clave_hash', models.CharField(editable=False, max_length=64, unique=True, verbose_name='Hash de la Clave')),
+                ('activo', models.BooleanField(default=True, verbose_name='Activo')),
+                ('fecha_creacion', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Fecha de Creación')),
+                ('ultimo_uso', models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Último Uso')),
+                ('cuenta', models.ForeignKey(db_column='cuenta_id', on_delete=django.db.models.deletion.CASCADE, related_name='tokens_integracion', to='Contenedor_Calificaciones.cuenta', verbose_name='Cuenta')),
+            ],
+            options={
+                'verbose_name': 'Token de Integración',
+                'verbose_name_plural': 'Tokens de Integración',
+                'db_table': 'token_integracion',
+            },
+        ),
+    ]
@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator, EmailValidator
+import hashlib
 import re
-from .validators import validate_rut_chileno, formatear_rut
+import secrets
+import uuid
+from .validators import validate_rut_chileno, formatear_rut, normalizar_nombre_empresa
+from .carga_masiva.huella import calcular_huella
 from django.utils import timezone
 
 # Modelos para importarlos a la base de datos en Supabase
@@ -180,9 +184,6 @@ class Cuenta(models.Model):
 
 	class Meta:
 		db_table = 'cuenta'
-		indexes = [
-			models.Index(fields=["rut"], name="idx_cuenta_rut"),
-		]
 		verbose_name = 'Cuenta'
 		verbose_name_plural = 'Cuentas'
 
@@ -273,6 +274,9 @@ class Cuenta(models.Model):
 class Empresa(models.Model):
 	empresa_rut = models.CharField(primary_key=True, max_length=13, validators=[validate_rut_chileno])
 	nombre_empresa = models.CharField(max_length=150)
+	# Nombre sin tildes, puntuación ni mayúsculas; sobre él está el índice de trigramas
+	# que usa la carga masiva para sugerir la empresa más parecida
+	nombre_normalizado = models.CharField(max_length=150, blank=True, editable=False)
 	ingresado_por = models.ForeignKey(Cuenta, on_delete=models.PROTECT, db_column='ingresado_por_id', related_name='empresas')
 	ingresado_por_rut = models.CharField(max_length=13, editable=False)
 	fecha_ingreso = models.DateTimeField(auto_now_add=True)
@@ -300,6 +304,7 @@ class Empresa(models.Model):
 		# Capitalizar nombre empresa palabra por palabra
 		if self.nombre_empresa:
 			self.nombre_empresa = " ".join(p.capitalize() for p in self.nombre_empresa.strip().split())
+		self.nombre_normalizado = normalizar_nombre_empresa(self.nombre_empresa)
 		# Asegurar coincidencia de rut de la cuenta ingresada
 		if self.ingresado_por_id and self.ingresado_por:
 			self.ingresado_por_rut = self.ingresado_por.rut
@@ -353,7 +358,8 @@ class CalificacionTributaria(models.Model):
         related_name='calificaciones',
         verbose_name='Cuenta',
         help_text='Usuario que crea la calificación',
-        editable=False  
+        editable=False,
+        db_index=False  # Lo cubren idx_calificacion_cuenta_estado e idx_calificacion_huella
     )
     
     metodo_calificacion = models.CharField(
@@ -463,6 +469,39 @@ class CalificacionTributaria(models.Model):
         null=True
     )
     
+    # Huella del contenido (ver carga_masiva/huella.py); la carga masiva la usa
+    # para no volver a importar calificaciones que la cuenta ya tiene
+    huella = models.CharField(
+        max_length=64,
+        blank=True,
+        verbose_name='Huella',
+        editable=False  # Dato fantasma
+    )
+    
+    # ==================== REVISIÓN DEL JEFE (desnormalizada) ====================
+    # Copia de la última aprobación o rechazo (CalificacionAprovada /
+    # CalificacionRechazada) para leer el historial sin joins; la escribe
+    # registrar_revision() en la misma transacción que el registro de revisión
+    revisado_por = models.CharField(
+        max_length=13,
+        blank=True,
+        verbose_name='RUT del Jefe Revisor',
+        editable=False  # Dato fantasma
+    )
+    
+    fecha_revision = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Fecha de Revisión',
+        editable=False  # Dato fantasma
+    )
+    
+    observacion_revision = models.TextField(
+        blank=True,
+        verbose_name='Observaciones de la Revisión',
+        editable=False  # Dato fantasma
+    )
+    
     # ==================== METADATA ====================
     class Meta:
         db_table = 'calificacion_tributaria'
@@ -471,9 +510,75 @@ class CalificacionTributaria(models.Model):
         ordering = ['-fecha_calculo']
         indexes = [
             models.Index(fields=['anio_tributario'], name='idx_calificacion_anio'),
-            models.Index(fields=['estado_calificacion'], name='idx_calificacion_estado'),
-            models.Index(fields=['-fecha_calculo'], name='idx_calificacion_fecha'),
-            models.Index(fields=['cuenta_id'], name='idx_calificacion_cuenta'),
+            # Listados de una cuenta por estado, de más reciente a más antigua
+            # (tus calificaciones, por enviar, conteos del dashboard); también
+            # sirve para buscar por cuenta_id sola
+            models.Index(
+                fields=['cuenta_id', 'estado_calificacion', '-fecha_calculo', '-calificacion_id'],
+                name='idx_calificacion_cuenta_estado',
+            ),
+            # Cola de pendientes de los jefes: solo las filas por aprobar, que
+            # son pocas comparadas con la tabla completa
+            models.Index(
+                fields=['-fecha_calculo', '-calificacion_id', 'cuenta_id'],
+                name='idx_calificacion_por_aprobar',
+                condition=models.Q(estado_calificacion='por_aprobar'),
+            ),
+            models.Index(fields=['cuenta_id', 'huella'], name='idx_calificacion_huella'),
+            # El BRIN de fecha_calculo (solo PostgreSQL) se crea en la migración 0025
+            # Historial de revisiones de un jefe, en el orden de sus listados
+            models.Index(
+                fields=['revisado_por', 'estado_calificacion', '-fecha_calculo', '-calificacion_id'],
+                name='idx_calificacion_revision',
+            ),
+        ]
+        # Las mismas reglas de los validadores, pero en la BD: también las
+        # cumplen las filas que la carga masiva escribe con COPY/INSERT sin
+        # pasar por full_clean(). Que el año no sea futuro queda en clean().
+        # Los valores permitidos son los de los *_CHOICES de arriba.
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(anio_tributario__gte=1900, anio_tributario__lte=2100),
+                name='chk_calificacion_anio',
+                violation_error_message='El año tributario debe estar entre 1900 y 2100.',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(monto_tributario__gte=0),
+                name='chk_calificacion_monto',
+                violation_error_message='El monto tributario no puede ser negativo.',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(factor_tributario__gte=0, factor_tributario__lte=1),
+                name='chk_calificacion_factor',
+                violation_error_message='El factor tributario debe ser un valor entre 0 y 1.',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(puntaje_calificacion__gte=0, puntaje_calificacion__lte=100),
+                name='chk_calificacion_puntaje',
+                violation_error_message='El puntaje debe estar entre 0 y 100.',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(categoria_calificacion__in=['bajo', 'medio', 'alto']),
+                name='chk_calificacion_categoria',
+                violation_error_message='Categoría de calificación no válida.',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(nivel_riesgo__in=['bajo', 'medio', 'alto', 'critico']),
+                name='chk_calificacion_riesgo',
+                violation_error_message='Nivel de riesgo no válido.',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(estado_calificacion__in=[
+                    'por_enviar', 'por_aprobar', 'aprobado', 'rechazado', 'eliminado', 'mal_ingresada',
+                ]),
+                name='chk_calificacion_estado',
+                violation_error_message='Estado de calificación no válido.',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(metodo_calificacion__in=['masiva', 'manual']),
+                name='chk_calificacion_metodo',
+                violation_error_message='Método de calificación no válido.',
+            ),
         ]
     
     def __str__(self):
@@ -500,11 +605,34 @@ class CalificacionTributaria(models.Model):
         # Ejecutar validaciones
         self.full_clean()
         
+        # Recalcular la huella con los datos actuales
+        self.huella = calcular_huella(
+            self.rut_empresa_id, self.anio_tributario, self.tipo_calificacion,
+            self.monto_tributario, self.factor_tributario, self.unidad_valor,
+            self.puntaje_calificacion, self.categoria_calificacion, self.nivel_riesgo
+        )
+        
         # Si es un nuevo registro, actualizar fecha_calculo
         if not self.pk:
             self.fecha_calculo = timezone.now()
         
         super().save(*args, **kwargs)
+    
+    def registrar_revision(self, jefe, estado, observaciones=''):
+        """
+        Aprueba (estado='aprobado') o rechaza (estado='rechazado') la
+        calificación: crea el registro de revisión y deja el estado y las
+        columnas de revisión en la misma transacción.
+        """
+        modelo = CalificacionAprovada if estado == 'aprobado' else CalificacionRechazada
+        with transaction.atomic():
+            revision = modelo.objects.create(calificacion=self, jefe=jefe, observaciones=observaciones)
+            self.estado_calificacion = estado
+            self.revisado_por = revision.jefe_rut
+            self.fecha_revision = revision.fecha_aprovacion if estado == 'aprobado' else revision.fecha_rechazo
+            self.observacion_revision = revision.observaciones
+            self.save()
+        return revision
 
 
 # Modelos dependientes para aprobación y rechazo de calificaciones
@@ -601,4 +729,280 @@ class CalificacionRechazada(models.Model):
 		if self.jefe and hasattr(self.jefe, 'rut'):
 			self.jefe_rut = self.jefe.rut
 		self.full_clean()
-		super().save(*args, **kwargs)
\ No newline at end of file
+		super().save(*args, **kwargs)
+
+# Modelos de staging para la carga masiva: cada archivo subido genera un lote
+# con sus filas ya validadas, y el guardado definitivo solo referencia el lote
+# El lote es además el trabajo de la cola: pasa por en_cola -> validando ->
+# validado y, al confirmarlo, por por_guardar -> guardando -> guardado
+class LoteCargaMasiva(models.Model):
+    ESTADO_CHOICES = [
+        ('en_cola', 'En Cola'),
+        ('validando', 'Validando'),
+        ('validado', 'Validado'),
+        ('por_guardar', 'Por Guardar'),
+        ('guardando', 'Guardando'),
+        ('guardado', 'Guardado'),
+        ('error', 'Error'),
+    ]
+    
+    lote_id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+        verbose_name='ID Lote'
+    )
+    
+    cuenta = models.ForeignKey(
+        'Contenedor_Calificaciones.Cuenta',
+        on_delete=models.CASCADE,
+        db_column='cuenta_id',
+        related_name='lotes_carga_masiva',
+        verbose_name='Cuenta'
+    )
+    
+    archivo_nombre = models.CharField(max_length=255, verbose_name='Nombre del Archivo')
+    
+    # Copia del archivo subido mientras espera ser validado
+    archivo_ruta = models.CharField(max_length=500, blank=True, verbose_name='Ruta del Archivo')
+    
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADO_CHOICES,
+        default='en_cola',
+        verbose_name='Estado del Lote'
+    )
+    
+    # Estado con que se guardarán las calificaciones (por_enviar / por_aprobar)
+    estado_destino = models.CharField(max_length=20, blank=True, verbose_name='Estado de Destino')
+    
+    # Progreso que consulta la vista previa
+    total_filas = models.IntegerField(default=0, verbose_name='Total de Filas')
+    filas_validas = models.IntegerField(default=0, verbose_name='Filas Válidas')
+    filas_con_errores = models.IntegerField(default=0, verbose_name='Filas con Errores')
+    filas_guardadas = models.IntegerField(default=0, verbose_name='Filas Guardadas')
+    # Guardado por partes: última fila del archivo ya confirmada en la BD, para
+    # continuar desde ahí si el guardado se interrumpe
+    ultima_fila_guardada = models.IntegerField(default=0, verbose_name='Última Fila Guardada')
+    filas_duplicadas = models.IntegerField(default=0, verbose_name='Filas ya Importadas o Repetidas')
+    filas_reutilizadas = models.IntegerField(default=0, verbose_name='Filas sin Cambios Reutilizadas')
+    duracion_guardado = models.FloatField(null=True, blank=True, verbose_name='Duración del Guardado (s)')
+    
+    # Advertencias del archivo completo (columnas faltantes, máximo de filas, etc.)
+    errores_globales = models.JSONField(default=list, blank=True, verbose_name='Errores Globales')
+    
+    fecha_creacion = models.DateTimeField(default=timezone.now, editable=False, verbose_name='Fecha de Creación')
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')
+    
+    class Meta:
+        db_table = 'lote_carga_masiva'
+        verbose_name = 'Lote de Carga Masiva'
+        verbose_name_plural = 'Lotes de Carga Masiva'
+        indexes = [
+            models.Index(fields=['fecha_creacion'], name='idx_lote_fecha'),
+            models.Index(fields=['estado', 'fecha_creacion'], name='idx_lote_estado_fecha'),
+        ]
+    
+    def __str__(self):
+        return f"Lote {self.lote_id} ({self.archivo_nombre})"
+
+
+class FilaCargaMasiva(models.Model):
+    # Los campos de texto son libres: las filas con errores se guardan tal como
+    # venían en el archivo para poder mostrarlas y reportarlas después
+    lote = models.ForeignKey(
+        'LoteCargaMasiva',
+        on_delete=models.CASCADE,
+        related_name='filas',
+        verbose_name='Lote'
+    )
+    
+    fila = models.IntegerField(verbose_name='Fila en el Archivo')
+    rut_empresa = models.TextField(blank=True)
+    nombre_empresa = models.TextField(blank=True)
+    anio_tributario = models.IntegerField(null=True, blank=True)
+    tipo_calificacion = models.TextField(blank=True)
+    monto_tributario = models.FloatField(null=True, blank=True)
+    factor_tributario = models.FloatField(null=True, blank=True)
+    unidad_valor = models.TextField(blank=True)
+    puntaje_calificacion = models.IntegerField(null=True, blank=True)
+    categoria_calificacion = models.CharField(max_length=10, null=True, blank=True)
+    nivel_riesgo = models.CharField(max_length=10, null=True, blank=True)
+    justificacion_resultado = models.TextField(blank=True)
+    errores = models.JSONField(default=list, blank=True)
+    valido = models.BooleanField(default=False)
+    # Huella de las filas válidas (las repetidas en el archivo se detectan con ella)
+    huella = models.CharField(max_length=64, blank=True)
+    # Hash del contenido crudo de la fila: si se vuelve a subir sin cambios, se
+    # reutiliza su validación
+    hash_contenido = models.CharField(max_length=32, blank=True)
+    
+    class Meta:
+        db_table = 'fila_carga_masiva'
+        verbose_name = 'Fila de Carga Masiva'
+        verbose_name_plural = 'Filas de Carga Masiva'
+        ordering = ['lote', 'fila']
+        indexes = [
+            models.Index(fields=['lote', 'fila'], name='idx_fila_lote_fila'),
+            models.Index(fields=['lote', 'huella'], name='idx_fila_lote_huella'),
+            # Vista previa paginada filtrando por válidas / con errores
+            models.Index(fields=['lote', 'valido', 'fila'], name='idx_fila_lote_valido_fila'),
+            models.Index(fields=['lote', 'hash_contenido'], name='idx_fila_lote_hash'),
+        ]
+    
+    def __str__(self):
+        return f"Fila {self.fila} del lote {self.lote_id}"
+
+
+# Subida de un archivo de carga masiva por partes (reanudable). Al recibir la
+# última parte y verificar el checksum se crea el LoteCargaMasiva
+class SubidaFragmentada(models.Model):
+    ESTADO_CHOICES = [
+        ('recibiendo', 'Recibiendo'),
+        ('completa', 'Completa'),
+        ('error', 'Error'),
+    ]
+    
+    subida_id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+        verbose_name='ID Subida'
+    )
+    
+    cuenta = models.ForeignKey(
+        'Contenedor_Calificaciones.Cuenta',
+        on_delete=models.CASCADE,
+        db_column='cuenta_id',
+        related_name='subidas_fragmentadas',
+        verbose_name='Cuenta'
+    )
+    
+    archivo_nombre = models.CharField(max_length=255, verbose_name='Nombre del Archivo')
+    tamano_total = models.BigIntegerField(verbose_name='Tamaño Total (bytes)')
+    bytes_recibidos = models.BigIntegerField(default=0, verbose_name='Bytes Recibidos')
+    sha256 = models.CharField(max_length=64, verbose_name='Checksum SHA-256')
+    
+    # Archivo parcial en disco mientras se reciben las partes
+    ruta = models.CharField(max_length=500, blank=True, verbose_name='Ruta del Archivo Parcial')
+    
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADO_CHOICES,
+        default='recibiendo',
+        verbose_name='Estado de la Subida'
+    )
+    
+    lote = models.ForeignKey(
+        'LoteCargaMasiva',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='subidas',
+        verbose_name='Lote'
+    )
+    
+    fecha_creacion = models.DateTimeField(default=timezone.now, editable=False, verbose_name='Fecha de Creación')
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')
+    
+    class Meta:
+        db_table = 'subida_fragmentada'
+        verbose_name = 'Subida Fragmentada'
+        verbose_name_plural = 'Subidas Fragmentadas'
+        indexes = [
+            models.Index(fields=['fecha_creacion'], name='idx_subida_fecha'),
+        ]
+    
+    def __str__(self):
+        return f"Subida {self.subida_id} ({self.archivo_nombre})"
+
+
+# Envío idempotente de la carga masiva por API: la clave (cabecera
+# Idempotency-Key) identifica el envío y un reintento con la misma clave
+# recibe el resultado original en vez de procesarse de nuevo
+class EnvioIdempotente(models.Model):
+    ESTADO_CHOICES = [
+        ('en_curso', 'En Curso'),
+        ('completado', 'Completado'),
+    ]
+    
+    cuenta = models.ForeignKey(
+        'Contenedor_Calificaciones.Cuenta',
+        on_delete=models.CASCADE,
+        db_column='cuenta_id',
+        related_name='envios_idempotentes',
+        verbose_name='Cuenta'
+    )
+    
+    clave = models.CharField(max_length=255, verbose_name='Clave de Idempotencia')
+    
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADO_CHOICES,
+        default='en_curso',
+        verbose_name='Estado del Envío'
+    )
+    
+    resumen = models.JSONField(default=dict, blank=True, verbose_name='Resumen del Resultado')
+    
+    fecha_creacion = models.DateTimeField(default=timezone.now, editable=False, verbose_name='Fecha de Creación')
+    
+    class Meta:
+        db_table = 'envio_idempotente'
+        verbose_name = 'Envío Idempotente'
+        verbose_name_plural = 'Envíos Idempotentes'
+        constraints = [
+            models.UniqueConstraint(fields=['cuenta', 'clave'], name='uniq_envio_por_cuenta_clave'),
+        ]
+        indexes = [
+            models.Index(fields=['fecha_creacion'], name='idx_envio_fecha'),
+        ]
+    
+    def __str__(self):
+        return f"Envío {self.clave} de la cuenta {self.cuenta_id}"
+
+
+# Token de integración: credencial por cabecera (Authorization: Token <clave>)
+# para que los sistemas de un calificador usen la API de ingesta sin sesión ni
+# CSRF. Solo se guarda el SHA-256 de la clave; la clave se muestra una vez al crearla.
+class TokenIntegracion(models.Model):
+    cuenta = models.ForeignKey(
+        'Contenedor_Calificaciones.Cuenta',
+        on_delete=models.CASCADE,
+        db_column='cuenta_id',
+        related_name='tokens_integracion',
+        verbose_name='Cuenta'
+    )
+    
+    nombre = models.CharField(max_length=100, verbose_name='Nombre de la Integración')
+    
+    # Primeros caracteres de la clave, para reconocerla sin guardarla
+    prefijo = models.CharField(max_length=8, editable=False, verbose_name='Prefijo')
+    
+    clave_hash = models.CharField(max_length=64, unique=True, editable=False, verbose_name='Hash de la Clave')
+    
+    activo = models.BooleanField(default=True, verbose_name='Activo')
+    
+    fecha_creacion = models.DateTimeField(default=timezone.now, editable=False, verbose_name='Fecha de Creación')
+    ultimo_uso = models.DateTimeField(null=True, blank=True, editable=False, verbose_name='Último Uso')
+    
+    class Meta:
+        db_table = 'token_integracion'
+        verbose_name = 'Token de Integración'
+        verbose_name_plural = 'Tokens de Integración'
+    
+    def __str__(self):
+        return f"{self.nombre} ({self.prefijo}...) de la cuenta {self.cuenta_id}"
+    
+    @staticmethod
+    def hash_clave(clave):
+        return hashlib.sha256(clave.encode()).hexdigest()
+    
+    @classmethod
+    def crear(cls, cuenta, nombre):
+        """Crea un token para la cuenta y devuelve (token, clave en claro)."""
+        clave = secrets.token_urlsafe(32)
+        token = cls.objects.create(
+            cuenta=cuenta, nombre=nombre, prefijo=clave[:8], clave_hash=cls.hash_clave(clave)
+        )
+        return token, clave
@@ -0,0 +1,175 @@
+import base64
+import binascii
+import json
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .conteo import contar
+
+# Paginación por llave (keyset / seek) para los listados de calificaciones:
+# en vez de OFFSET, cada página se pide "después de" (o "antes de") la llave
+# de la última fila vista, así la página N cuesta lo mismo que la primera y no
+# se necesita un COUNT(*) para avanzar o retroceder.
+
+CAMPOS_LLAVE = ('fecha_calculo', 'calificacion_id')
+
+
+def _a_json(valor):
+    # Fechas con microsegundos completos: la llave tiene que ser exacta
+    return valor.isoformat() if hasattr(valor, 'isoformat') else valor
+
+
+def _codificar(datos):
+    texto = json.dumps(datos, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(texto).rstrip(b'=').decode('ascii')
+
+
+def _decodificar(cursor):
+    try:
+        texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return json.loads(texto)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+class PaginaKeyset:
+    """
+    Una página del PaginadorKeyset. Se usa en las plantillas como el Page de
+    Django (iterable, has_next, has_previous, number, start_index, end_index),
+    pero en vez de números de página entrega cursores opacos para los enlaces.
+    """
+
+    def __init__(self, object_list, number, tamano, cursor_anterior='', cursor_siguiente=''):
+        self.object_list = object_list
+        self.number = number
+        self.tamano = tamano
+        self.cursor_anterior = cursor_anterior
+        self.cursor_siguiente = cursor_siguiente
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_previous(self):
+        return bool(self.cursor_anterior)
+
+    def has_next(self):
+        return bool(self.cursor_siguiente)
+
+    def start_index(self):
+        return (self.number - 1) * self.tamano + 1 if self.object_list else 0
+
+    def end_index(self):
+        return (self.number - 1) * self.tamano + len(self.object_list)
+
+
+class PaginadorKeyset:
+    """
+    Pagina un queryset de más reciente a más antiguo por (fecha_calculo,
+    calificacion_id), de a `tamano` filas. `pagina(cursor)` retorna la página
+    que indica el cursor (o la primera si no hay cursor o no es válido); cada
+    página trae `tamano` + 1 filas para saber si hay más, sin contar.
+    """
+
+    def __init__(self, queryset, tamano, campos=CAMPOS_LLAVE):
+        self.queryset = queryset
+        self.tamano = tamano
+        self.campos = campos
+        self._modelo = queryset.model
+
+    def _llave(self, objeto):
+        return [_a_json(getattr(objeto, campo)) for campo in self.campos]
+
+    def _cursor(self, direccion, numero, objeto):
+        return _codificar([direccion, numero, self._llave(objeto)])
+
+    def _leer_cursor(self, cursor):
+        # (direccion, numero, valores) o None si el cursor no es válido
+        datos = _decodificar(cursor) if cursor else None
+        if not isinstance(datos, list) or len(datos) != 3:
+            return None
+        direccion, numero, valores = datos
+        if direccion not in ('s', 'a') or not isinstance(numero, int) or numero < 1:
+            return None
+        if not isinstance(valores, list) or len(valores) != len(self.campos):
+            return None
+        try:
+            valores = [
+                self._modelo._meta.get_field(campo).to_python(valor)
+                for campo, valor in zip(self.campos, valores)
+            ]
+        except Exception:
+            return None
+        return direccion, numero, valores
+
+    def _comparar(self, valores, operador):
+        # (c1, c2, ...) <op> (v1, v2, ...) comparando campo a campo en orden
+        condicion = Q()
+        for i, campo in enumerate(self.campos):
+            iguales = {c: v for c, v in zip(self.campos[:i], valores[:i])}
+            condicion |= Q(**iguales, **{f'{campo}__{operador}': valores[i]})
+        return condicion
+
+    def _primera(self):
+        filas = list(self.queryset.order_by(*(f'-{campo}' for campo in self.campos))[:self.tamano + 1])
+        return self._armar(filas, 1, hay_anterior=False)
+
+    def _armar(self, filas, numero, hay_anterior):
+        hay_siguiente = len(filas) > self.tamano
+        filas = filas[:self.tamano]
+        return PaginaKeyset(
+            filas, numero, self.tamano,
+            cursor_anterior=self._cursor('a', numero - 1, filas[0]) if hay_anterior and filas else '',
+            cursor_siguiente=self._cursor('s', numero + 1, filas[-1]) if hay_siguiente else '',
+        )
+
+    def pagina(self, cursor=None):
+        datos = self._leer_cursor(cursor)
+        if datos is None:
+            return self._primera()
+        direccion, numero, valores = datos
+
+        if direccion == 's':
+            filas = list(
+                self.queryset.filter(self._comparar(valores, 'lt'))
+                .order_by(*(f'-{campo}' for campo in self.campos))[:self.tamano + 1]
+            )
+            if not filas:
+                return self._primera()
+            return self._armar(filas, numero, hay_anterior=True)
+
+        # Hacia atrás se lee en orden ascendente y se invierte
+        filas = list(
+            self.queryset.filter(self._comparar(valores, 'gt'))
+            .order_by(*self.campos)[:self.tamano + 1]
+        )
+        hay_anterior = len(filas) > self.tamano
+        filas = filas[:self.tamano][::-1]
+        if not filas or not hay_anterior:
+            # Se llegó al comienzo: la primera página completa
+            return self._primera()
+        return PaginaKeyset(
+            filas, numero, self.tamano,
+            cursor_anterior=self._cursor('a', numero - 1, filas[0]),
+            cursor_siguiente=self._cursor('s', numero + 1, filas[-1]),
+        )
+
+
+class PaginadorConConteo(Paginator):
+    """
+    Paginator de Django cuyo total sale de conteo.contar (acotado, en caché o
+    estimado) en vez de un COUNT(*) en cada request. `conteo` es el Conteo para
+    mostrar; si es aproximado, la última página puede quedar corta o vacía.
+    """
+
+    @cached_property
+    def conteo(self):
+        return contar(self.object_list)
+
+    @cached_property
+    def count(self):
+        return self.conteo.valor
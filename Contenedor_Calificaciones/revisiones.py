@@ -0,0 +1,63 @@
+from django.db import transaction
+
+# Relleno de las columnas de revisión (revisado_por, fecha_revision,
+# observacion_revision) de las calificaciones aprobadas o rechazadas antes de
+# que existieran. Recibe el registro de modelos para poder usarse tanto desde
+# la migración 0024 (modelos históricos) como desde el comando rellenar_revisiones.
+
+# (estado, modelo de la revisión, campo de fecha del modelo)
+REVISIONES = (
+    ('aprobado', 'CalificacionAprovada', 'fecha_aprovacion'),
+    ('rechazado', 'CalificacionRechazada', 'fecha_rechazo'),
+)
+
+CAMPOS_REVISION = ['revisado_por', 'fecha_revision', 'observacion_revision']
+
+
+def rellenar_revisiones(apps, tamano=2000):
+    """
+    Copia la revisión de cada calificación aprobada o rechazada que aún
+    no tiene fecha_revision. Las que no tienen registro de revisión quedan con
+    la fecha de cálculo y sin revisor, para no volver a recorrerlas.
+    Genera (estado, calificaciones actualizadas, último id) por cada lote.
+    """
+    CalificacionTributaria = apps.get_model('Contenedor_Calificaciones', 'CalificacionTributaria')
+
+    for estado, nombre_modelo, campo_fecha in REVISIONES:
+        modelo = apps.get_model('Contenedor_Calificaciones', nombre_modelo)
+        ultimo = 0
+        while True:
+            # Avanza por llave primaria: cada lote es una consulta por índice
+            fechas_calculo = dict(
+                CalificacionTributaria.objects
+                .filter(estado_calificacion=estado, fecha_revision__isnull=True, pk__gt=ultimo)
+                .order_by('pk')
+                .values_list('pk', 'fecha_calculo')[:tamano]
+            )
+            if not fechas_calculo:
+                break
+            ultimo = max(fechas_calculo)
+
+            # Sin registro de revisión: no se sabe quién la revisó
+            revisiones = {
+                calificacion_id: ('', fecha, '') for calificacion_id, fecha in fechas_calculo.items()
+            }
+            for calificacion_id, jefe_rut, fecha, observaciones in (
+                modelo.objects
+                .filter(calificacion_id__in=list(fechas_calculo))
+                .values_list('calificacion_id', 'jefe_rut', campo_fecha, 'observaciones')
+            ):
+                revisiones[calificacion_id] = (jefe_rut, fecha, observaciones)
+
+            calificaciones = [
+                CalificacionTributaria(
+                    pk=calificacion_id,
+                    revisado_por=jefe_rut,
+                    fecha_revision=fecha,
+                    observacion_revision=observaciones,
+                )
+                for calificacion_id, (jefe_rut, fecha, observaciones) in revisiones.items()
+            ]
+            with transaction.atomic():
+                CalificacionTributaria.objects.bulk_update(calificaciones, CAMPOS_REVISION)
+            yield estado, len(calificaciones), ultimo
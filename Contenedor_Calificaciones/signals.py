@@ -1,6 +1,7 @@
 from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import EquipoCalificador, Cuenta, EquipoDeTrabajo
+from .models import EquipoCalificador, Cuenta, EquipoDeTrabajo, Empresa
+from . import busqueda
 
 # Guardar el jefe anterior para actualizar su cuenta si se cambia
 @receiver(pre_save, sender=EquipoDeTrabajo)
@@ -33,3 +34,9 @@ def calificador_post_save(sender, instance, created, **kwargs):
 def calificador_post_delete(sender, instance, **kwargs):
     # Quitar equipo de la cuenta del calificador al removerlo
     Cuenta.objects.filter(rut=instance.calificador.rut).update(equipo_trabajo=None)
+
+@receiver(post_save, sender=Empresa)
+@receiver(post_delete, sender=Empresa)
+def empresa_cambiada(sender, instance, **kwargs):
+    # Los índices en memoria de la búsqueda por empresa se rearman con el siguiente filtro
+    busqueda.invalidar()
@@ -1,3 +1,1444 @@
-from django.test import TestCase
+import hashlib
+import importlib
+import importlib.util
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import uuid
+import zipfile
+from datetime import date, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pandas as pd
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.formats import number_format
+from openpyxl import Workbook, load_workbook
+
+from . import busqueda, conteo, indices
+from .carga_masiva import benchmark, bloqueos, empresas, guardado, ingesta, lectores, lotes, paralelo, reporte, tareas
+from .carga_masiva.filas import FilaCalificacion
+from .carga_masiva.guardado import guardar_calificaciones
+from .carga_masiva.huella import calcular_huella
+from .carga_masiva.lectores import COLUMNAS_PLANTILLA
+from .carga_masiva.similitud import similitud, trigramas
+from .carga_masiva.validacion import completar_validacion, validar_bloque, validar_columnas
+from .checks import revisar_directorio_carga_masiva
+from .models import (
+    CalificacionRechazada, CalificacionTributaria, CalificadorTributario, Cuenta, Empresa, EnvioIdempotente,
+    EquipoCalificador, EquipoDeTrabajo, JefeEquipo, LoteCargaMasiva, SubidaFragmentada, TokenIntegracion,
+)
+from .paginacion import PaginadorConConteo, PaginadorKeyset
+from .validators import normalizar_nombre_empresa, rut_con_digito, validate_rut_chileno
+
+ENCABEZADOS = [nombres[0] for nombres in COLUMNAS_PLANTILLA.values()]
+
+
+def fila_excel(i, **cambios):
+    # Una fila de la plantilla (en el orden de COLUMNAS_PLANTILLA)
+    datos = {
+        'rut_empresa': rut_con_digito(76000000 + i % 5), 'nombre_empresa': f'Empresa {i % 5} S.A.',
+        'anio_tributario': 2023, 'tipo_calificacion': 'Anual', 'monto_tributario': 1000 + i,
+        'factor_tributario': 0.5, 'unidad_valor': 'CLP', 'puntaje_calificacion': 80,
+        'categoria_calificacion': 'A', 'nivel_riesgo': 'Bajo', 'justificacion_resultado': 'ok',
+    }
+    datos.update(cambios)
+    return datos
+
+
+def archivo_xlsx(filas, nombre='carga.xlsx'):
+    libro = Workbook()
+    hoja = libro.active
+    hoja.append(ENCABEZADOS)
+    for datos in filas:
+        hoja.append([datos[clave] for clave in COLUMNAS_PLANTILLA])
+    contenido = io.BytesIO()
+    libro.save(contenido)
+    return SimpleUploadedFile(nombre, contenido.getvalue())
+
+
+def bloque_excel(*filas):
+    # Bloque como los de los lectores: columna 'fila' y las claves de la plantilla
+    return pd.DataFrame([{'fila': numero, **datos} for numero, datos in enumerate(filas, start=2)], dtype=object)
+
+
+def fila_calificacion(i, **cambios):
+    # Fila ya validada, como las que llegan al guardado
+    fila = FilaCalificacion(
+        i, rut_con_digito(76000000 + i % 5), f'Empresa {i % 5} S.A.', 2023, 'Anual', 100.0 + i, 0.5, 'CLP', 50,
+        'alto', 'bajo', '',
+    )
+    for campo, valor in cambios.items():
+        setattr(fila, campo, valor)
+    return fila
+
+
+class CalificadorMixin:
+    """Cuenta de Calificador Tributario con sesión iniciada y 5 empresas."""
+
+    def setUp(self):
+        super().setUp()
+        CalificadorTributario.objects.create(rut=rut_con_digito(22025650), fecha_ingreso=date(2020, 1, 1))
+        self.cuenta = Cuenta(
+            rut=rut_con_digito(22025650), nombre='Ana', apellido='Pérez', correo='ana@nuam.cl', edad=30, contrasena='Abcdef1!'
+        )
+        self.cuenta.save()
+        for i in range(5):
+            Empresa(
+                empresa_rut=rut_con_digito(76000000 + i), nombre_empresa=f'Empresa {i} S.A.', ingresado_por=self.cuenta,
+                pais='Chile', tipo_de_empresa='SA',
+            ).save()
+        sesion = self.client.session
+        sesion['cuenta_id'] = self.cuenta.pk
+        sesion['rol'] = self.cuenta.rol
+        sesion.save()
+
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        ajustes = override_settings(CARGA_MASIVA_EJECUCION='sincrono', CARGA_MASIVA_DIRECTORIO=self.directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+
+class ValidacionColumnasTests(SimpleTestCase):
+
+    def validar(self, *filas):
+        bloque = pd.DataFrame(
+            [{'fila': numero, **datos} for numero, datos in enumerate(filas, start=1)], dtype=object
+        )
+        return validar_columnas(bloque, anio_actual=2025)
+
+    def test_fila_correcta_sin_errores(self):
+        resultado, errores = self.validar(fila_excel(1))
+        self.assertTrue(errores.isna().all(axis=None))
+        self.assertEqual(resultado.loc[0, 'categoria_calificacion'], 'alto')
+        self.assertEqual(resultado.loc[0, 'nivel_riesgo'], 'bajo')
+
+    def test_mascaras_marcan_solo_las_filas_invalidas(self):
+        _, errores = self.validar(
+            fila_excel(1, rut_empresa='123'),
+            fila_excel(2, anio_tributario=1800),
+            fila_excel(3, factor_tributario=1.5),
+            fila_excel(4, puntaje_calificacion='x'),
+            fila_excel(5, categoria_calificacion='Z'),
+            fila_excel(6),
+        )
+        esperados = {
+            0: 'rut_empresa', 1: 'anio_tributario', 2: 'factor_tributario',
+            3: 'puntaje_calificacion', 4: 'categoria_calificacion',
+        }
+        for posicion, columna in esperados.items():
+            self.assertEqual(list(errores.columns[errores.loc[posicion].notna()]), [columna])
+        self.assertTrue(errores.loc[5].isna().all())
+
+    def test_largos_maximos(self):
+        _, errores = self.validar(
+            fila_excel(1, tipo_calificacion='T' * 100, unidad_valor='U' * 50),
+            fila_excel(2, tipo_calificacion='T' * 101, unidad_valor='U' * 51),
+        )
+        self.assertTrue(errores.loc[0].isna().all())
+        self.assertEqual(errores.loc[1, 'tipo_calificacion'], 'Tipo de calificación no puede tener más de 100 caracteres')
+        self.assertEqual(errores.loc[1, 'unidad_valor'], 'Unidad de valor no puede tener más de 50 caracteres')
+
+    def test_ruts_igual_que_el_validador(self):
+        cuerpos = [1, 9, 10000013, 12345678, 59999999, 76000000, 99999999]
+        ruts = [rut_con_digito(c) for c in cuerpos]
+        # Sin puntos, sin guion y con la K en minúscula
+        crudos = [r.replace('.', '') for r in ruts[:3]]
+        crudos += [r.replace('.', '').replace('-', '').lower() for r in ruts[3:]]
+        resultado, errores = self.validar(*[fila_excel(1, rut_empresa=rut) for rut in crudos])
+        self.assertEqual(resultado['rut_empresa'].tolist(), ruts)
+        self.assertTrue(resultado['rut_valido'].all())
+        self.assertTrue(errores['rut_empresa'].isna().all())
+
+        # Dígito verificador distinto, dígitos no ASCII y RUT vacío
+        otro_dv = ruts[3][:-1] + ('0' if ruts[3][-1] != '0' else '1')
+        resultado, errores = self.validar(
+            fila_excel(1, rut_empresa=otro_dv),
+            fila_excel(2, rut_empresa='７６０００００-３'),
+            fila_excel(3, rut_empresa=''),
+        )
+        self.assertFalse(resultado['rut_valido'].any())
+        self.assertEqual(errores.loc[0, 'rut_empresa'], f'RUT inválido: {otro_dv}')
+
+    def test_mensajes_y_valores_normalizados(self):
+        resultado, errores = self.validar(
+            fila_excel(
+                1, anio_tributario='abc', monto_tributario=-1, categoria_calificacion='b', nivel_riesgo='Crítico'
+            ),
+            fila_excel(2, anio_tributario=2026.7, monto_tributario='1e3', puntaje_calificacion=101),
+        )
+        self.assertEqual(errores.loc[0, 'anio_tributario'], 'Año tributario inválido: abc')
+        self.assertEqual(errores.loc[0, 'monto_tributario'], 'Monto tributario no puede ser negativo')
+        self.assertEqual(errores.loc[1, 'anio_tributario'], 'Año tributario 2026 fuera de rango (1900-2025)')
+        self.assertEqual(errores.loc[1, 'puntaje_calificacion'], 'Puntaje debe estar entre 0 y 100')
+        self.assertEqual(resultado.loc[1, 'monto_tributario'], 1000.0)
+        self.assertEqual(
+            resultado.loc[0, ['categoria_calificacion', 'nivel_riesgo']].tolist(), ['medio', 'critico']
+        )
+
+    def test_empresas_no_registradas_o_con_otro_nombre(self):
+        resultado, errores = self.validar(
+            fila_excel(0, nombre_empresa='EMPRESA 0 SA'),
+            fila_excel(1, nombre_empresa='Otra Empresa'),
+            fila_excel(2),
+        )
+        registradas = {rut_con_digito(76000000): 'Empresa 0 S.A.', rut_con_digito(76000001): 'Empresa 1 S.A.'}
+        consultados = []
+
+        def resolver(ruts):
+            consultados.extend(ruts)
+            return {rut: registradas[rut] for rut in ruts if rut in registradas}
+
+        datos = completar_validacion(resultado, errores, resolver)
+        self.assertEqual(sorted(consultados), sorted([rut_con_digito(76000000 + i) for i in range(3)]))
+        self.assertEqual([dato.valido for dato in datos], [True, False, False])
+        self.assertTrue(datos[1].errores[0].startswith(
+            f'El nombre "Otra Empresa" no coincide con la empresa registrada para el RUT {rut_con_digito(76000001)}'
+        ))
+        self.assertEqual(datos[2].errores, (f'Empresa con RUT {rut_con_digito(76000002)} no está registrada.',))
+
+
+def contenido_csv(filas, separador=','):
+    lineas = [separador.join(ENCABEZADOS)]
+    lineas += [separador.join(str(datos[clave]) for clave in COLUMNAS_PLANTILLA) for datos in filas]
+    return '\n'.join(lineas) + '\n'
+
+
+def leer_todo(nombre, contenido):
+    # Como en tareas.validar_lote, el archivo se lee desde su ruta en disco
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = f'{directorio}/{nombre}'
+        with open(ruta, 'wb') as archivo:
+            archivo.write(contenido)
+        lector = lectores.abrir_archivo(ruta)
+        try:
+            return lector, pd.concat(list(lector.bloques(1000)), ignore_index=True)
+        finally:
+            lector.cerrar()
+
+
+def xlsx_con_dimension(contenido, dimension):
+    # Reescribe la dimensión guardada en la hoja, como hacen algunas planillas
+    # exportadas por otros programas
+    entrada, salida = zipfile.ZipFile(io.BytesIO(contenido)), io.BytesIO()
+    with zipfile.ZipFile(salida, 'w') as libro:
+        for info in entrada.infolist():
+            datos = entrada.read(info)
+            if info.filename == 'xl/worksheets/sheet1.xml':
+                datos = re.sub(rb'<dimension ref="[^"]*"', f'<dimension ref="{dimension}"'.encode(), datos)
+            libro.writestr(info, datos)
+    return salida.getvalue()
+
+
+class LectorExcelTests(SimpleTestCase):
+
+    def test_lee_todas_las_filas_por_bloques(self):
+        filas = [fila_excel(i) for i in range(25)]
+        filas[4] = fila_excel(4, rut_empresa=None)
+        lector, leidas = leer_todo('carga.xlsx', archivo_xlsx(filas).read())
+        self.assertFalse(lector.vacio)
+        self.assertEqual(lector.columnas_faltantes, [])
+        # La fila 6 del Excel (sin RUT) se omite; el resto conserva su número
+        self.assertEqual(list(leidas['fila']), [n for n in range(2, 27) if n != 6])
+        self.assertEqual(leidas.loc[0, 'monto_tributario'], 1000)
+
+        lector = lectores.abrir_archivo(archivo_xlsx(filas))
+        self.assertEqual([len(bloque) for bloque in lector.bloques(10)], [10, 10, 4])
+        lector.cerrar()
+
+    def test_dimension_guardada_incorrecta(self):
+        contenido = xlsx_con_dimension(archivo_xlsx([fila_excel(i) for i in range(30)]).read(), 'A1:A1')
+        _, leidas = leer_todo('carga.xlsx', contenido)
+        self.assertEqual(len(leidas), 30)
+
+    def test_columnas_faltantes_y_archivo_vacio(self):
+        libro = Workbook()
+        libro.active.append(ENCABEZADOS[:-2])
+        contenido = io.BytesIO()
+        libro.save(contenido)
+        lector = lectores.abrir_archivo(SimpleUploadedFile('carga.xlsx', contenido.getvalue()))
+        self.assertEqual(lector.columnas_faltantes, ENCABEZADOS[-2:])
+
+        contenido = io.BytesIO()
+        Workbook().save(contenido)
+        self.assertTrue(lectores.abrir_archivo(SimpleUploadedFile('carga.xlsx', contenido.getvalue())).vacio)
+
+
+class LectoresTests(SimpleTestCase):
+
+    def test_csv_utf8_con_caracter_cortado_en_la_muestra(self):
+        # La muestra de 64 KB termina a mitad de la Ñ (2 bytes en UTF-8)
+        contenido = contenido_csv([fila_excel(i) for i in range(600)]).encode()
+        relleno = 64 * 1024 - 1 - len(contenido) - len(rut_con_digito(76000001) + ',')
+        fila = contenido_csv([fila_excel(1, nombre_empresa='X' * relleno + 'Ñuñoa')])[len(contenido_csv([])):]
+        contenido += fila.encode()
+        self.assertEqual(contenido[64 * 1024 - 1:64 * 1024 + 1], 'Ñ'.encode())
+
+        lector, filas = leer_todo('carga.csv', contenido)
+        self.assertEqual(lector._codificacion, 'utf-8-sig')
+        self.assertEqual(len(filas), 601)
+        self.assertTrue(filas.iloc[-1]['nombre_empresa'].endswith('Ñuñoa'))
+
+    def test_csv_latin1_con_punto_y_coma(self):
+        contenido = contenido_csv([fila_excel(1, nombre_empresa='Ñuñoa S.A.')], separador=';').encode('latin-1')
+        lector, filas = leer_todo('carga.csv', contenido)
+        self.assertEqual((lector._codificacion, lector._separador), ('latin-1', ';'))
+        self.assertEqual(lector.columnas_faltantes, [])
+        self.assertEqual(filas.loc[0, 'nombre_empresa'], 'Ñuñoa S.A.')
+        self.assertEqual(filas.loc[0, 'fila'], 2)
+
+    @override_settings(CARGA_MASIVA_MAX_ODS_MB=1)
+    def test_ods_sobre_el_maximo(self):
+        with self.assertRaisesMessage(ValueError, 'máximo 1 MB'):
+            lectores.abrir_archivo(SimpleUploadedFile('carga.ods', b'0' * (1024 * 1024 + 1)))
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), 'requiere pyarrow')
+    def test_parquet_lee_solo_las_columnas_de_la_plantilla(self):
+        tabla = pd.DataFrame([fila_excel(i) for i in range(3)])
+        tabla.columns = ENCABEZADOS
+        tabla.insert(0, 'Otra', 'x')
+        contenido = io.BytesIO()
+        tabla.to_parquet(contenido)
+        _, filas = leer_todo('carga.parquet', contenido.getvalue())
+        self.assertEqual(list(filas['fila']), [2, 3, 4])
+        self.assertEqual(list(filas['monto_tributario']), [1000, 1001, 1002])
+
+    @skipUnless(importlib.util.find_spec('odf'), 'requiere odfpy')
+    def test_ods(self):
+        tabla = pd.DataFrame([fila_excel(i) for i in range(3)])
+        tabla.columns = ENCABEZADOS
+        contenido = io.BytesIO()
+        tabla.to_excel(contenido, engine='odf', index=False)
+        _, filas = leer_todo('carga.ods', contenido.getvalue())
+        self.assertEqual(len(filas), 3)
+        self.assertEqual(filas.loc[2, 'nombre_empresa'], 'Empresa 2 S.A.')
+
+
+class ConfiguracionTests(SimpleTestCase):
+
+    def test_worker_requiere_directorio_compartido(self):
+        temporal = f'{tempfile.gettempdir()}/nuam_carga_masiva'
+        casos = (
+            ('worker', temporal, ['Contenedor_Calificaciones.E001']),
+            ('worker', '/srv/compartido/carga_masiva', []),
+            ('hilo', temporal, []),
+        )
+        for ejecucion, directorio, esperados in casos:
+            with self.subTest(ejecucion=ejecucion, directorio=directorio), override_settings(
+                CARGA_MASIVA_EJECUCION=ejecucion, CARGA_MASIVA_DIRECTORIO=directorio
+            ):
+                self.assertEqual([e.id for e in revisar_directorio_carga_masiva(None)], esperados)
+
+
+class ValidacionParalelaTests(SimpleTestCase):
+
+    def bloques(self):
+        filas = [fila_excel(i, factor_tributario=2 if i % 7 == 0 else 0.5) for i in range(40)]
+        return [bloque_excel(*filas[inicio:inicio + 10]) for inicio in range(0, 40, 10)]
+
+    def test_archivo_chico_se_valida_en_el_mismo_proceso(self):
+        with mock.patch.object(paralelo, 'ProcessPoolExecutor') as pool:
+            validados = list(paralelo.validar_por_bloques(self.bloques(), procesos=4, umbral=100))
+        pool.assert_not_called()
+        self.assertEqual(len(validados), 4)
+
+    def test_en_paralelo_igual_que_en_serie(self):
+        en_serie = list(paralelo.validar_por_bloques(self.bloques(), procesos=1, umbral=0))
+        en_paralelo = list(paralelo.validar_por_bloques(self.bloques(), procesos=2, umbral=15))
+        self.assertEqual(len(en_paralelo), 4)
+        # Mismo orden de bloques y mismos resultados
+        for (resultado, errores), (resultado_paralelo, errores_paralelo) in zip(en_serie, en_paralelo):
+            pd.testing.assert_frame_equal(resultado, resultado_paralelo)
+            pd.testing.assert_frame_equal(errores, errores_paralelo)
+        self.assertEqual(
+            [fila for resultado, _ in en_paralelo for fila in resultado['fila']],
+            [fila for bloque in self.bloques() for fila in bloque['fila']],
+        )
+
+
+class CargaMasivaTests(CalificadorMixin, TestCase):
+
+    def subir(self, filas):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post(reverse('carga_masiva'), {'archivo_excel': archivo_xlsx(filas)})
+        self.assertEqual(respuesta.status_code, 302)
+        return LoteCargaMasiva.objects.filter(cuenta=self.cuenta).latest('fecha_creacion')
+
+    def confirmar(self, lote, accion='enviar'):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('guardar_calificaciones_masivas'), {'lote_id': lote.pk, 'accion': accion})
+        lote.refresh_from_db()
+
+    def test_subida_vista_previa_y_guardado(self):
+        filas = [fila_excel(i) for i in range(10)]
+        filas[3] = fila_excel(3, factor_tributario=2)
+        filas[7] = fila_excel(7, nivel_riesgo='nulo')
+        lote = self.subir(filas)
+        self.assertEqual(lote.estado, 'validado')
+        self.assertEqual((lote.total_filas, lote.filas_validas, lote.filas_con_errores), (10, 8, 2))
+
+        # `fila` es la fila del Excel (la 1 es el encabezado)
+        respuesta = self.client.get(reverse('filas_carga_masiva', args=[lote.pk]), {'filtro': 'errores'})
+        self.assertEqual([fila['fila'] for fila in respuesta.json()['filas']], [5, 9])
+
+        self.confirmar(lote)
+        self.assertEqual(lote.estado, 'guardado')
+        self.assertEqual(lote.filas_guardadas, 8)
+        self.assertEqual(
+            CalificacionTributaria.objects.filter(cuenta_id=self.cuenta, estado_calificacion='por_aprobar').count(), 8
+        )
+
+        # Confirmar de nuevo no vuelve a guardar
+        self.confirmar(lote)
+        self.assertEqual(CalificacionTributaria.objects.count(), 8)
+
+    @override_settings(CARGA_MASIVA_MODO_GUARDADO='partes', CARGA_MASIVA_TAMANO_GUARDADO=4)
+    def test_reanuda_despues_de_una_parte_fallida(self):
+        lote = self.subir([fila_excel(i) for i in range(10)])
+        original = guardado.guardar_calificaciones
+        llamadas = []
+
+        def falla_la_segunda_parte(*args, **kwargs):
+            llamadas.append(1)
+            if len(llamadas) == 2:
+                raise OperationalError('conexión perdida')
+            return original(*args, **kwargs)
+
+        with mock.patch.object(guardado, 'guardar_calificaciones', falla_la_segunda_parte):
+            self.confirmar(lote)
+        self.assertEqual(lote.estado, 'validado')
+        self.assertEqual((lote.filas_guardadas, lote.ultima_fila_guardada), (4, 5))
+        self.assertIn('Error al guardar: conexión perdida', lote.errores_globales)
+        self.assertEqual(CalificacionTributaria.objects.count(), 4)
+
+        self.confirmar(lote)
+        self.assertEqual(lote.estado, 'guardado')
+        self.assertEqual(lote.filas_guardadas, 10)
+        self.assertEqual(CalificacionTributaria.objects.count(), 10)
+
+    @override_settings(CARGA_MASIVA_MODO_GUARDADO='partes', CARGA_MASIVA_TAMANO_GUARDADO=4)
+    def test_pagina_del_lote_reanuda_un_guardado_detenido(self):
+        lote = self.subir([fila_excel(i) for i in range(10)])
+        # Se guardó la primera parte y el proceso se detuvo en la segunda
+        with transaction.atomic():
+            guardadas, _ = guardado.guardar_calificaciones(
+                lotes.parte_filas_validas(lote, 0, 4), self.cuenta.pk, 'por_aprobar'
+            )
+        lotes.actualizar_lote(
+            lote, estado='guardando', estado_destino='por_aprobar', filas_guardadas=guardadas, ultima_fila_guardada=5
+        )
+        url = f"{reverse('carga_masiva')}?lote={lote.pk}"
+
+        # Con avance reciente se deja en paz
+        self.client.get(url)
+        lote.refresh_from_db()
+        self.assertEqual(lote.estado, 'guardando')
+
+        LoteCargaMasiva.objects.filter(pk=lote.pk).update(fecha_actualizacion=timezone.now() - timedelta(hours=1))
+        with self.captureOnCommitCallbacks(execute=True), self.assertLogs(tareas.logger, 'WARNING'):
+            self.client.get(url)
+        lote.refresh_from_db()
+        self.assertEqual((lote.estado, lote.filas_guardadas, lote.ultima_fila_guardada), ('guardado', 10, 11))
+        self.assertEqual(CalificacionTributaria.objects.count(), 10)
+
+    @override_settings(CARGA_MASIVA_MODO_GUARDADO='partes', CARGA_MASIVA_TAMANO_GUARDADO=4)
+    def test_pagina_del_lote_informa_el_avance(self):
+        lote = self.subir([fila_excel(i) for i in range(10)])
+        lotes.actualizar_lote(lote, filas_guardadas=4, ultima_fila_guardada=5)
+        respuesta = self.client.get(reverse('carga_masiva'), {'lote': lote.pk})
+        self.assertContains(respuesta, 'Ya se guardaron 4 calificaciones (hasta la fila 5)')
+
+    def test_vista_previa_paginada(self):
+        filas = [fila_excel(i, nivel_riesgo='nulo' if i in (2, 7, 9) else 'Bajo') for i in range(12)]
+        lote = self.subir(filas)
+        url = reverse('filas_carga_masiva', args=[lote.pk])
+        respuesta = self.client.get(reverse('carga_masiva'), {'lote': lote.pk})
+        self.assertEqual(respuesta.status_code, 200)
+
+        paginas, despues = [], 0
+        while despues is not None:
+            datos = self.client.get(url, {'despues': despues, 'tamano': 5}).json()
+            paginas.append([fila['fila'] for fila in datos['filas']])
+            despues = datos['siguiente']
+        self.assertEqual(paginas, [[2, 3, 4, 5, 6], [7, 8, 9, 10, 11], [12, 13]])
+
+        validas = self.client.get(url, {'filtro': 'validas', 'tamano': 200}).json()
+        self.assertEqual(len(validas['filas']), 9)
+        self.assertIsNone(validas['siguiente'])
+        self.assertTrue(all(fila['valido'] for fila in validas['filas']))
+
+        self.assertEqual(self.client.get(url, {'filtro': 'otro'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'despues': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('filas_carga_masiva', args=[uuid.uuid4()])).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_reporte_de_errores(self):
+        filas = [fila_excel(i) for i in range(5)]
+        filas[1] = fila_excel(1, tipo_calificacion='@SUMA(A1)', factor_tributario=2)
+        filas[3] = fila_excel(3, tipo_calificacion='Anual <b>&', nivel_riesgo='nulo')
+        lote = self.subir(filas)
+        url = reverse('reporte_errores_carga_masiva', args=[lote.pk])
+
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta['Content-Disposition'], 'attachment; filename="errores_carga.xlsx"')
+        libro = load_workbook(io.BytesIO(b''.join(respuesta.streaming_content)), read_only=True)
+        encabezado, *errores = libro['Errores'].iter_rows(values_only=True)
+        self.assertEqual(list(encabezado), reporte.ENCABEZADOS_REPORTE)
+        self.assertEqual([fila[0] for fila in errores], [3, 5])
+        # Las fórmulas se neutralizan
+        self.assertEqual(errores[0][4], "'@SUMA(A1)")
+        self.assertEqual(errores[1][4], 'Anual <b>&')
+        self.assertEqual(errores[1][3], 2023)
+
+        respuesta = self.client.get(url, {'formato': 'csv'})
+        lineas = b''.join(respuesta.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lineas[0].split(','), reporte.ENCABEZADOS_REPORTE)
+        self.assertEqual([linea.split(',')[0] for linea in lineas[1:]], ['3', '5'])
+
+    def test_reporte_xlsx_por_partes(self):
+        lote = self.subir([fila_excel(i, nivel_riesgo='nulo') for i in range(30)])
+        partes = list(reporte.reporte_xlsx(lote, filas_por_envio=10))
+        self.assertGreater(len(partes), 3)
+        hoja = load_workbook(io.BytesIO(b''.join(partes)), read_only=True)['Errores']
+        self.assertEqual(len(list(hoja.iter_rows(values_only=True))), 31)
+
+    @override_settings(CARGA_MASIVA_MAX_FILAS=12, CARGA_MASIVA_TAMANO_BLOQUE=5)
+    def test_maximo_de_filas_por_archivo(self):
+        lote = self.subir([fila_excel(i) for i in range(20)])
+        self.assertEqual((lote.estado, lote.total_filas, lote.filas_validas), ('validado', 12, 12))
+        self.assertIn('Se permiten máximo 12 calificaciones por archivo', lote.errores_globales[0])
+
+    def test_huella_ignora_el_formato(self):
+        base = ('76.000.001-K', 2023, 'Anual', 1000, 0.5, 'CLP', 80, 'alto', 'bajo')
+        self.assertEqual(
+            calcular_huella(*base),
+            calcular_huella(' 76.000.001-k ', 2023.0, 'ANUAL', '1000.0', 0.50, 'clp', 80, 'Alto', ' bajo'),
+        )
+        self.assertNotEqual(calcular_huella(*base), calcular_huella(*base[:3], 1001, *base[4:]))
+
+    def test_omite_filas_repetidas_y_ya_importadas(self):
+        filas = [fila_excel(i) for i in range(6)]
+        filas.append(fila_excel(2, justificacion_resultado='otra'))
+        lote = self.subir(filas)
+        self.assertEqual((lote.filas_validas, lote.filas_duplicadas), (6, 1))
+        repetida = lote.filas.get(fila=8)
+        self.assertEqual(repetida.errores, ['Fila repetida: es igual a la fila 4 del archivo.'])
+        self.confirmar(lote)
+        self.assertEqual(CalificacionTributaria.objects.count(), 6)
+        self.assertEqual(
+            set(CalificacionTributaria.objects.values_list('huella', flat=True)),
+            set(lote.filas.filter(valido=True).values_list('huella', flat=True)),
+        )
+
+        # Al subir de nuevo el archivo, lo ya importado se omite salvo lo eliminado
+        CalificacionTributaria.objects.filter(monto_tributario=1000).update(estado_calificacion='eliminado')
+        lote = self.subir(filas[:6])
+        self.assertEqual((lote.filas_validas, lote.filas_duplicadas), (1, 5))
+        self.assertEqual(lote.filas.get(fila=2).errores, [])
+        self.assertEqual(lote.filas.get(fila=4).errores, ['Esta calificación ya fue importada anteriormente.'])
+
+    def test_reutiliza_filas_sin_cambios_y_revisa_sus_empresas(self):
+        filas = [fila_excel(i) for i in range(10)]
+        self.subir(filas)
+        filas[0] = fila_excel(0, monto_tributario=5)
+        lote = self.subir(filas)
+        self.assertEqual((lote.filas_reutilizadas, lote.filas_validas), (9, 10))
+
+        # Las empresas de las filas reutilizadas se consultan de nuevo: una
+        # cambió de nombre y otra se eliminó desde la carga anterior
+        Empresa.objects.filter(empresa_rut=rut_con_digito(76000001)).update(
+            nombre_empresa='Otra Empresa', nombre_normalizado=normalizar_nombre_empresa('Otra Empresa')
+        )
+        Empresa.objects.filter(empresa_rut=rut_con_digito(76000002)).delete()
+        lote = self.subir(filas)
+        self.assertEqual((lote.filas_reutilizadas, lote.filas_validas, lote.filas_con_errores), (10, 6, 4))
+        errores = {fila.fila: fila.errores[0] for fila in lote.filas.filter(valido=False)}
+        self.assertEqual(sorted(errores), [3, 4, 8, 9])
+        self.assertIn('no coincide con la empresa registrada', errores[3])
+        self.assertIn('no está registrada', errores[4])
+
+    def test_limpieza_conserva_los_lotes_en_proceso(self):
+        hace_dos_dias = timezone.now() - timedelta(days=2)
+        archivos = {}
+        for estado in ('en_cola', 'validando', 'por_guardar', 'guardando', 'validado', 'guardado', 'error'):
+            ruta = f'{self.directorio}/{estado}.xlsx'
+            with open(ruta, 'wb') as archivo:
+                archivo.write(b'x')
+            archivos[estado] = ruta
+            LoteCargaMasiva.objects.create(
+                cuenta=self.cuenta, archivo_nombre=f'{estado}.xlsx', archivo_ruta=ruta, estado=estado,
+                fecha_creacion=hace_dos_dias,
+            )
+        lotes.limpiar_lotes_vencidos()
+        conservados = set(LoteCargaMasiva.objects.values_list('estado', flat=True))
+        self.assertEqual(conservados, set(tareas.ESTADOS_EN_PROCESO))
+        for estado, ruta in archivos.items():
+            self.assertEqual(os.path.exists(ruta), estado in conservados, estado)
+
+    def test_lote_validando_detenido_vuelve_a_la_cola(self):
+        with override_settings(CARGA_MASIVA_EJECUCION='worker'):
+            lote = self.subir([fila_excel(i) for i in range(3)])
+        lotes.tomar_lote(lote.pk, 'en_cola', 'validando')
+        LoteCargaMasiva.objects.filter(pk=lote.pk).update(fecha_actualizacion=timezone.now() - timedelta(hours=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tareas.reanudar_interrumpidos()
+        lote.refresh_from_db()
+        self.assertEqual((lote.estado, lote.total_filas), ('validado', 3))
+
+
+class SubidaFragmentadaTests(CalificadorMixin, TestCase):
+    TAMANO_PARTE = 1024
+
+    def setUp(self):
+        super().setUp()
+        ajustes = override_settings(CARGA_MASIVA_TAMANO_PARTE=self.TAMANO_PARTE)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.contenido = archivo_xlsx([fila_excel(i) for i in range(20)]).read()
+        self.partes = [
+            (inicio, self.contenido[inicio:inicio + self.TAMANO_PARTE])
+            for inicio in range(0, len(self.contenido), self.TAMANO_PARTE)
+        ]
+
+    def iniciar(self, sha256=None):
+        respuesta = self.client.post(reverse('iniciar_subida_masiva'), {
+            'nombre': 'carga.xlsx', 'tamano': len(self.contenido),
+            'sha256': sha256 or hashlib.sha256(self.contenido).hexdigest(),
+        })
+        self.assertEqual(respuesta.status_code, 201)
+        return respuesta.json()['subida_id']
+
+    def enviar(self, subida_id, inicio, datos):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.put(
+                reverse('parte_subida_masiva', args=[subida_id]), data=datos,
+                content_type='application/octet-stream',
+                HTTP_CONTENT_RANGE=f'bytes {inicio}-{inicio + len(datos) - 1}/{len(self.contenido)}',
+            )
+
+    def test_parte_fuera_de_orden(self):
+        subida_id = self.iniciar()
+        respuesta = self.enviar(subida_id, *self.partes[1])
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()['bytes_recibidos'], 0)
+
+        # Se continúa desde bytes_recibidos
+        for inicio, datos in self.partes:
+            self.assertEqual(self.enviar(subida_id, inicio, datos).status_code, 200)
+        subida = SubidaFragmentada.objects.get(pk=subida_id)
+        self.assertEqual(subida.estado, 'completa')
+        self.assertEqual(subida.lote.estado, 'validado')
+        self.assertEqual(subida.lote.filas_validas, 20)
+
+    def test_checksum_distinto(self):
+        subida_id = self.iniciar(sha256='0' * 64)
+        for inicio, datos in self.partes[:-1]:
+            self.enviar(subida_id, inicio, datos)
+        respuesta = self.enviar(subida_id, *self.partes[-1])
+        self.assertEqual(respuesta.status_code, 422)
+        self.assertEqual(respuesta.json()['estado'], 'error')
+        self.assertFalse(LoteCargaMasiva.objects.exists())
+
+        # Una subida con error no acepta más partes
+        self.assertEqual(self.enviar(subida_id, *self.partes[0]).status_code, 409)
+
+    def test_completar_dos_veces_crea_un_solo_lote(self):
+        subida_id = self.iniciar()
+        for inicio, datos in self.partes:
+            self.enviar(subida_id, inicio, datos)
+        respuesta = self.enviar(subida_id, *self.partes[-1])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['estado'], 'completa')
+        self.assertEqual(LoteCargaMasiva.objects.count(), 1)
+        self.assertEqual(respuesta.json()['lote_id'], str(LoteCargaMasiva.objects.get().pk))
+
+    def test_iniciar_revisa_los_datos(self):
+        sha256 = hashlib.sha256(self.contenido).hexdigest()
+        casos = [
+            ({'nombre': 'carga.pdf', 'tamano': 10, 'sha256': sha256}, 400),
+            ({'nombre': 'carga.xlsx', 'tamano': 'x', 'sha256': sha256}, 400),
+            ({'nombre': 'carga.xlsx', 'tamano': 0, 'sha256': sha256}, 400),
+            ({'nombre': 'carga.xlsx', 'tamano': 2 * 1024 * 1024, 'sha256': sha256}, 413),
+            ({'nombre': 'carga.xlsx', 'tamano': 10, 'sha256': 'abc'}, 400),
+        ]
+        with override_settings(CARGA_MASIVA_MAX_ARCHIVO_MB=1):
+            for datos, estado_http in casos:
+                with self.subTest(datos=datos):
+                    respuesta = self.client.post(reverse('iniciar_subida_masiva'), datos)
+                    self.assertEqual(respuesta.status_code, estado_http)
+        self.assertFalse(SubidaFragmentada.objects.exists())
+
+    def test_reanudar_desde_bytes_recibidos(self):
+        subida_id = self.iniciar()
+        self.enviar(subida_id, *self.partes[0])
+        estado = self.client.get(reverse('estado_subida_masiva', args=[subida_id])).json()
+        self.assertEqual(
+            (estado['estado'], estado['bytes_recibidos'], estado['tamano_parte']),
+            ('recibiendo', self.TAMANO_PARTE, self.TAMANO_PARTE),
+        )
+
+        # Reenviar una parte ya recibida no la vuelve a escribir
+        respuesta = self.enviar(subida_id, *self.partes[0])
+        self.assertEqual((respuesta.status_code, respuesta.json()['bytes_recibidos']), (200, self.TAMANO_PARTE))
+
+        # Content-Range de otro archivo, o parte sobre el tamaño máximo
+        url = reverse('parte_subida_masiva', args=[subida_id])
+        inicio, datos = self.partes[1]
+        for rango, estado_http in (
+            (f'bytes {inicio}-{inicio + len(datos) - 1}/{len(self.contenido) + 1}', 400),
+            (f'bytes {inicio}-{inicio + self.TAMANO_PARTE}/{len(self.contenido)}', 413),
+            ('', 400),
+        ):
+            with self.subTest(rango=rango):
+                respuesta = self.client.put(
+                    url, data=datos, content_type='application/octet-stream', HTTP_CONTENT_RANGE=rango
+                )
+                self.assertEqual(respuesta.status_code, estado_http)
+                self.assertEqual(respuesta.json()['bytes_recibidos'], self.TAMANO_PARTE)
+
+        for inicio, datos in self.partes[1:]:
+            self.enviar(subida_id, inicio, datos)
+        lote = SubidaFragmentada.objects.get(pk=subida_id).lote
+        self.assertEqual((lote.estado, lote.total_filas, lote.filas_validas), ('validado', 20, 20))
+
+    def test_subida_de_otra_cuenta(self):
+        subida_id = self.iniciar()
+        CalificadorTributario.objects.create(rut=rut_con_digito(22025651), fecha_ingreso=date(2020, 1, 1))
+        otra = Cuenta(
+            rut=rut_con_digito(22025651), nombre='Otra', apellido='Cuenta', correo='otra@nuam.cl', edad=30,
+            contrasena='Abcdef1!',
+        )
+        otra.save()
+        SubidaFragmentada.objects.filter(pk=subida_id).update(cuenta=otra)
+        self.assertEqual(self.client.get(reverse('estado_subida_masiva', args=[subida_id])).status_code, 404)
+        self.assertEqual(self.enviar(subida_id, *self.partes[0]).status_code, 404)
+
+
+class IngestaTests(CalificadorMixin, TestCase):
+    url = '/api/calificaciones/ingesta/'
+
+    def ingerir(self, registros, **cabeceras):
+        cuerpo = '\n'.join(json.dumps(registro) for registro in registros).encode()
+        respuesta = self.client.post(self.url, data=cuerpo, content_type='application/x-ndjson', **cabeceras)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta, [json.loads(linea) for linea in b''.join(respuesta.streaming_content).splitlines()]
+
+    def test_requiere_credenciales(self):
+        self.client.logout()
+        respuesta = self.client.post(self.url, data=b'{}', content_type='application/x-ndjson')
+        self.assertEqual(respuesta.status_code, 401)
+
+    def test_token_de_integracion(self):
+        self.client.logout()
+        _, clave = TokenIntegracion.crear(self.cuenta, 'ERP')
+        _, lineas = self.ingerir([fila_excel(1)], HTTP_AUTHORIZATION=f'Token {clave}')
+        self.assertEqual(lineas[-1]['resumen']['creadas'], 1)
+        self.assertEqual(CalificacionTributaria.objects.get().cuenta_id_id, self.cuenta.pk)
+        self.assertIsNotNone(TokenIntegracion.objects.get().ultimo_uso)
+
+        for cabecera in ('Token otra-clave', f'Token {clave} extra'):
+            with self.subTest(cabecera=cabecera):
+                respuesta = self.client.post(
+                    self.url, data=b'{}', content_type='application/x-ndjson', HTTP_AUTHORIZATION=cabecera
+                )
+                self.assertEqual(respuesta.status_code, 401)
+
+        # Un token revocado deja de servir
+        call_command('crear_token_integracion', self.cuenta.rut, '--revocar', stdout=io.StringIO())
+        respuesta = self.client.post(
+            self.url, data=b'{}', content_type='application/x-ndjson', HTTP_AUTHORIZATION=f'Token {clave}'
+        )
+        self.assertEqual(respuesta.status_code, 401)
+
+    def test_comando_crea_token(self):
+        salida = io.StringIO()
+        call_command('crear_token_integracion', self.cuenta.rut, '--nombre', 'ERP', stdout=salida)
+        clave = salida.getvalue().splitlines()[-1]
+        token = TokenIntegracion.objects.get()
+        self.assertEqual((token.nombre, token.prefijo), ('ERP', clave[:8]))
+        self.assertEqual(token.clave_hash, TokenIntegracion.hash_clave(clave))
+
+    def test_reintento_con_la_misma_clave(self):
+        registros = [fila_excel(i) for i in range(5)]
+        _, lineas = self.ingerir(registros, HTTP_IDEMPOTENCY_KEY='envio-1')
+        resumen = {'creadas': 5, 'duplicadas': 0, 'con_errores': 0}
+        self.assertEqual(lineas[-1], {'resumen': resumen})
+
+        respuesta, lineas = self.ingerir(registros, HTTP_IDEMPOTENCY_KEY='envio-1')
+        self.assertEqual(respuesta['Idempotent-Replayed'], 'true')
+        self.assertEqual(lineas, [{'resumen': resumen, 'repetido': True}])
+        self.assertEqual(CalificacionTributaria.objects.count(), 5)
+        self.assertEqual(EnvioIdempotente.objects.get().estado, 'completado')
+
+        # Otra clave se procesa: las filas ya importadas quedan como duplicadas
+        _, lineas = self.ingerir(registros, HTTP_IDEMPOTENCY_KEY='envio-2')
+        self.assertEqual(lineas[-1]['resumen']['duplicadas'], 5)
+        self.assertEqual(CalificacionTributaria.objects.count(), 5)
+
+
+class BloqueosTests(CalificadorMixin, TestCase):
+
+    def conexion_postgresql(self, libre):
+        cursor = mock.MagicMock()
+        cursor.fetchone.return_value = (libre,)
+        conexion = mock.MagicMock(vendor='postgresql')
+        conexion.cursor.return_value.__enter__.return_value = cursor
+        return mock.patch.object(bloqueos, 'connection', conexion), cursor
+
+    def consultas(self, cursor):
+        return [llamada.args[0].split('(')[0] for llamada in cursor.execute.call_args_list]
+
+    def test_advisory_lock_en_postgresql(self):
+        parche, cursor = self.conexion_postgresql(libre=True)
+        with parche:
+            with bloqueos.bloqueo_cuenta(7, esperar=False):
+                self.assertEqual(self.consultas(cursor), ['SELECT pg_try_advisory_lock'])
+            self.assertFalse(bloqueos.cuenta_ocupada(7))
+        self.assertEqual(self.consultas(cursor), ['SELECT pg_try_advisory_lock', 'SELECT pg_advisory_unlock'] * 2)
+        self.assertEqual(cursor.execute.call_args.args[1], [bloqueos.ESPACIO_CARGA_MASIVA, 7])
+
+        parche, cursor = self.conexion_postgresql(libre=False)
+        with parche:
+            with self.assertRaises(bloqueos.CuentaOcupada):
+                with bloqueos.bloqueo_cuenta(7, esperar=False):
+                    self.fail('No debió entrar al bloque')
+            self.assertTrue(bloqueos.cuenta_ocupada(7))
+        # Sin el bloqueo no hay nada que liberar
+        self.assertEqual(self.consultas(cursor), ['SELECT pg_try_advisory_lock'] * 2)
+
+    def test_sin_postgresql_no_bloquea(self):
+        with self.assertNumQueries(0):
+            with bloqueos.bloqueo_cuenta(self.cuenta.pk, esperar=False):
+                pass
+            self.assertFalse(bloqueos.cuenta_ocupada(self.cuenta.pk))
+
+    def test_ingesta_con_la_cuenta_ocupada(self):
+        ocupada = bloqueos.CuentaOcupada('Hay otra carga masiva de esta cuenta guardándose en este momento.')
+        cuerpo = json.dumps(fila_excel(1)).encode()
+        with mock.patch.object(ingesta, 'bloqueo_cuenta', side_effect=ocupada):
+            respuesta = self.client.post(
+                IngestaTests.url, data=cuerpo, content_type='application/x-ndjson', HTTP_IDEMPOTENCY_KEY='envio-1'
+            )
+            lineas = [json.loads(linea) for linea in b''.join(respuesta.streaming_content).splitlines()]
+        self.assertEqual(lineas, [{'error': str(ocupada)}])
+        self.assertFalse(CalificacionTributaria.objects.exists())
+        # La clave se libera para poder reintentar
+        self.assertFalse(EnvioIdempotente.objects.exists())
+
+    def test_no_reanuda_un_guardado_con_la_cuenta_ocupada(self):
+        lote = LoteCargaMasiva.objects.create(
+            cuenta=self.cuenta, archivo_nombre='x.xlsx', estado='guardando', estado_destino='por_enviar'
+        )
+        lotes.agregar_filas(lote, [fila_calificacion(i) for i in range(1, 4)])
+        lotes.actualizar_lote(lote, total_filas=3, filas_validas=3)
+        LoteCargaMasiva.objects.filter(pk=lote.pk).update(fecha_actualizacion=timezone.now() - timedelta(hours=1))
+
+        with mock.patch.object(tareas, 'cuenta_ocupada', return_value=True):
+            tareas.reanudar_interrumpidos()
+        lote.refresh_from_db()
+        self.assertEqual(lote.estado, 'guardando')
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertLogs(tareas.logger, 'WARNING'):
+            tareas.reanudar_interrumpidos()
+        lote.refresh_from_db()
+        self.assertEqual(lote.estado, 'guardado')
+        self.assertEqual(CalificacionTributaria.objects.count(), 3)
+
+
+class PaginadorKeysetTests(CalificadorMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        filas = [
+            FilaCalificacion(i, rut_con_digito(76000000), 'Empresa 0 S.A.', 2023, 'Anual', 100.0 + i, 0.5, 'CLP', 50, 'alto', 'bajo', '')
+            for i in range(25)
+        ]
+        guardar_calificaciones(filas, self.cuenta.pk, 'por_enviar')
+        # Varias filas con la misma fecha: el desempate es calificacion_id
+        ahora = timezone.now()
+        ids = list(CalificacionTributaria.objects.order_by('pk').values_list('pk', flat=True))
+        CalificacionTributaria.objects.filter(pk__in=ids[5:15]).update(fecha_calculo=ahora)
+        self.queryset = CalificacionTributaria.objects.filter(cuenta_id=self.cuenta)
+        self.orden = list(self.queryset.order_by('-fecha_calculo', '-calificacion_id').values_list('pk', flat=True))
+
+    def recorrer(self, paginador):
+        paginas = [paginador.pagina()]
+        while paginas[-1].has_next():
+            paginas.append(paginador.pagina(paginas[-1].cursor_siguiente))
+        return paginas
+
+    def test_recorre_todas_las_filas_en_orden(self):
+        paginas = self.recorrer(PaginadorKeyset(self.queryset, 10))
+        self.assertEqual([len(pagina) for pagina in paginas], [10, 10, 5])
+        self.assertEqual([p.number for p in paginas], [1, 2, 3])
+        self.assertEqual([c.pk for pagina in paginas for c in pagina], self.orden)
+
+    def test_cursor_estable_con_filas_nuevas(self):
+        paginador = PaginadorKeyset(self.queryset, 10)
+        primera = paginador.pagina()
+        segunda = paginador.pagina(primera.cursor_siguiente)
+
+        # Una calificación nueva no corre las páginas ya entregadas
+        guardar_calificaciones(
+            [FilaCalificacion(99, rut_con_digito(76000001), 'Empresa 1 S.A.', 2023, 'Anual', 999.0, 0.5, 'CLP', 50, 'alto', 'bajo', '')],
+            self.cuenta.pk, 'por_enviar',
+        )
+        self.assertEqual([c.pk for c in paginador.pagina(primera.cursor_siguiente)], [c.pk for c in segunda])
+        tercera = paginador.pagina(segunda.cursor_siguiente)
+        self.assertEqual([c.pk for c in tercera], self.orden[20:])
+
+        # Hacia atrás se vuelve a la misma segunda página
+        self.assertEqual([c.pk for c in paginador.pagina(tercera.cursor_anterior)], self.orden[10:20])
+
+    def test_cursor_invalido_entrega_la_primera_pagina(self):
+        pagina = PaginadorKeyset(self.queryset, 10).pagina('no-es-un-cursor')
+        self.assertEqual(pagina.number, 1)
+        self.assertEqual([c.pk for c in pagina], self.orden[:10])
+
+
+class ListadosJefeTests(CalificadorMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        jefe_equipo = JefeEquipo.objects.create(rut=rut_con_digito(21086922), fecha_ingreso=date(2020, 1, 1))
+        self.jefe = Cuenta(
+            rut=rut_con_digito(21086922), nombre='Jefe', apellido='Uno', correo='jefe@nuam.cl', edad=40, contrasena='Abcdef1!'
+        )
+        self.jefe.save()
+        equipo = EquipoDeTrabajo.objects.create(nombre_equipo='Equipo 1', jefe_equipo_rut=jefe_equipo)
+        EquipoCalificador.objects.create(equipo=equipo, calificador=CalificadorTributario.objects.get())
+        with transaction.atomic():
+            guardar_calificaciones([fila_calificacion(i) for i in range(25)], self.cuenta.pk, 'por_aprobar')
+        self.jefe.refresh_from_db()
+
+        sesion = self.client.session
+        sesion['cuenta_id'] = self.jefe.pk
+        sesion['rol'] = self.jefe.rol
+        sesion.save()
+
+    def recorrer(self, nombre_url, **parametros):
+        paginas = [self.client.get(reverse(nombre_url), parametros).context['page_obj']]
+        while paginas[-1].has_next():
+            respuesta = self.client.get(reverse(nombre_url), {**parametros, 'cursor': paginas[-1].cursor_siguiente})
+            paginas.append(respuesta.context['page_obj'])
+        return paginas
+
+    def test_pendientes_del_equipo_por_cursor(self):
+        orden = list(
+            CalificacionTributaria.objects.order_by('-fecha_calculo', '-calificacion_id').values_list('pk', flat=True)
+        )
+        paginas = self.recorrer('calificaciones_pendientes_jefe', page_size=10)
+        self.assertEqual([pagina.number for pagina in paginas], [1, 2, 3])
+        self.assertEqual([c.pk for pagina in paginas for c in pagina], orden)
+
+        respuesta = self.client.get(reverse('calificaciones_pendientes_jefe'), {'cursor': paginas[1].cursor_siguiente})
+        self.assertEqual(respuesta.context['total_calificaciones'], 25)
+        self.assertContains(respuesta, 'Página 3')
+        self.assertContains(respuesta, f'?cursor={paginas[2].cursor_anterior}')
+
+        # Filtro por un calificador que no es del equipo
+        respuesta = self.client.get(reverse('calificaciones_pendientes_jefe'), {'calificador_id': self.jefe.pk})
+        self.assertEqual(len(respuesta.context['page_obj']), 0)
+
+    def test_aprobadas_por_el_jefe(self):
+        aprobadas = list(CalificacionTributaria.objects.order_by('pk')[:12])
+        for calificacion in aprobadas:
+            calificacion.registrar_revision(self.jefe, 'aprobado')
+        paginas = self.recorrer('calificaciones_aprobadas_jefe', page_size=10)
+        self.assertEqual([len(pagina) for pagina in paginas], [10, 2])
+        self.assertEqual(
+            sorted(c.pk for pagina in paginas for c in pagina), [calificacion.pk for calificacion in aprobadas]
+        )
+
+
+class ConteoTests(CalificadorMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        with transaction.atomic():
+            guardar_calificaciones([fila_calificacion(i) for i in range(8)], self.cuenta.pk, 'por_aprobar')
+        self.queryset = CalificacionTributaria.objects.filter(estado_calificacion='por_aprobar')
+
+    def test_conteo_se_usa_como_numero(self):
+        total = conteo.Conteo(12400)
+        self.assertTrue(total > 0 and total == 12400 and total < conteo.Conteo(12401))
+        self.assertEqual(int(total), 12400)
+        self.assertFalse(total == '12400')
+        with self.assertRaises(TypeError):
+            total < 'x'
+        agrupado = number_format(12400, force_grouping=True)
+        self.assertEqual(str(total), agrupado)
+        self.assertEqual(str(conteo.Conteo(12400, aproximado=True)), f'~{agrupado}')
+        self.assertFalse(conteo.Conteo(0))
+
+    @override_settings(LISTADOS_CONTEO_EXACTO_HASTA=20)
+    def test_resultado_chico_se_cuenta_exacto(self):
+        with self.assertNumQueries(1):
+            total = conteo.contar(self.queryset)
+        self.assertEqual((total.valor, total.aproximado), (8, False))
+
+    @override_settings(LISTADOS_CONTEO_EXACTO_HASTA=3)
+    def test_resultado_grande_queda_en_cache(self):
+        self.assertEqual(conteo.contar(self.queryset).valor, 8)
+        CalificacionTributaria.objects.filter(monto_tributario=100.0).delete()
+        # Sigue el total guardado: solo se hace el total acotado
+        with self.assertNumQueries(1):
+            self.assertEqual(conteo.contar(self.queryset).valor, 8)
+        self.assertEqual(conteo.contar(self.queryset.filter(anio_tributario=2023)).valor, 7)
+
+    @override_settings(LISTADOS_CONTEO_EXACTO_HASTA=3, LISTADOS_CONTEO_ESTIMADO_DESDE=1000)
+    def test_estimacion_para_resultados_enormes(self):
+        with mock.patch.object(conteo, 'estimar', return_value=123456):
+            total = conteo.contar(self.queryset)
+        self.assertEqual((total.valor, total.aproximado), (123000, True))
+        with mock.patch.object(conteo, 'estimar', return_value=500):
+            total = conteo.contar(self.queryset.filter(anio_tributario=2023))
+        self.assertEqual((total.valor, total.aproximado), (8, False))
+        self.assertIsNone(conteo.estimar(self.queryset))
+
+    @override_settings(LISTADOS_CONTEO_EXACTO_HASTA=20)
+    def test_paginador_con_conteo(self):
+        paginador = PaginadorConConteo(self.queryset.order_by('pk'), 3)
+        self.assertEqual((paginador.count, paginador.num_pages), (8, 3))
+        self.assertEqual(len(paginador.page(3).object_list), 2)
+
+
+class RevisionesTests(CalificadorMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        JefeEquipo.objects.create(rut=rut_con_digito(21086922), fecha_ingreso=date(2020, 1, 1))
+        self.jefe = Cuenta(
+            rut=rut_con_digito(21086922), nombre='Jefe', apellido='Uno', correo='jefe@nuam.cl', edad=40, contrasena='Abcdef1!'
+        )
+        self.jefe.save()
+        with transaction.atomic():
+            guardar_calificaciones([fila_calificacion(i) for i in range(5)], self.cuenta.pk, 'por_aprobar')
+        self.calificaciones = list(CalificacionTributaria.objects.order_by('pk'))
+
+    def test_registrar_revision_llena_las_columnas(self):
+        calificacion = self.calificaciones[0]
+        revision = calificacion.registrar_revision(self.jefe, 'rechazado', 'Monto mal ingresado')
+        calificacion.refresh_from_db()
+        self.assertEqual(
+            (calificacion.estado_calificacion, calificacion.revisado_por, calificacion.observacion_revision),
+            ('rechazado', self.jefe.rut, 'Monto mal ingresado'),
+        )
+        self.assertEqual(calificacion.fecha_revision, revision.fecha_rechazo)
+        self.assertEqual(CalificacionRechazada.objects.get().calificacion_id, calificacion.pk)
+
+    def test_rellenar_revisiones(self):
+        aprobada, rechazada, sin_registro = self.calificaciones[:3]
+        aprobada.registrar_revision(self.jefe, 'aprobado', 'ok')
+        rechazada.registrar_revision(self.jefe, 'rechazado', 'no')
+        # Como las calificaciones revisadas antes de la migración 0024
+        CalificacionTributaria.objects.filter(pk=sin_registro.pk).update(estado_calificacion='aprobado')
+        CalificacionTributaria.objects.update(revisado_por='', fecha_revision=None, observacion_revision='')
+
+        salida = io.StringIO()
+        call_command('rellenar_revisiones', '--tamano', '1', stdout=salida)
+        self.assertIn('Listo: 3 calificaciones', salida.getvalue())
+        revisiones = {
+            calificacion.pk: (calificacion.revisado_por, calificacion.fecha_revision, calificacion.observacion_revision)
+            for calificacion in CalificacionTributaria.objects.all()
+        }
+        self.assertEqual(revisiones[aprobada.pk], (self.jefe.rut, aprobada.aprobacion.get().fecha_aprovacion, 'ok'))
+        self.assertEqual(revisiones[rechazada.pk], (self.jefe.rut, rechazada.rechazo.get().fecha_rechazo, 'no'))
+        self.assertEqual(revisiones[sin_registro.pk], ('', sin_registro.fecha_calculo, ''))
+        self.assertEqual(revisiones[self.calificaciones[3].pk], ('', None, ''))
+
+        # Lo ya relleno no se vuelve a recorrer
+        salida = io.StringIO()
+        call_command('rellenar_revisiones', stdout=salida)
+        self.assertIn('Listo: 0 calificaciones', salida.getvalue())
+
+
+def indice(nombre, columnas, usos=1, unico=False, metodo='btree', predicado=''):
+    """Indice como lo lee leer_indices de pg_index (columnas por número)."""
+    return indices.Indice(
+        'calificacion_tributaria', nombre, usos, 8192, unico, metodo,
+        columnas, ' '.join(['3124'] * len(columnas.split())), ' '.join(['0'] * len(columnas.split())), '', predicado,
+    )
+
+
+class IndicesTests(CalificadorMixin, TestCase):
+
+    def test_sin_uso_no_cuenta_los_unicos(self):
+        lista = [indice('a', '2', usos=0), indice('b', '3', usos=0, unico=True), indice('c', '4', usos=7)]
+        self.assertEqual([i.nombre for i in indices.sin_uso(lista)], ['a'])
+
+    def test_duplicados_y_prefijos(self):
+        lista = [
+            indice('cuenta', '2'),
+            indice('cuenta_estado', '2 5'),
+            indice('cuenta_estado_bis', '2 5'),
+            indice('cuenta_unico', '2', unico=True),
+            indice('cuenta_parcial', '2', predicado="(estado = 'por_aprobar')"),
+            indice('cuenta_hash', '2', metodo='hash'),
+        ]
+        pares = [(sobrante.nombre, cubre.nombre) for sobrante, cubre in indices.duplicados(lista)]
+        # El único se queda aunque cubra al otro; un predicado o método distinto no es duplicado
+        self.assertEqual(pares, [
+            ('cuenta_estado_bis', 'cuenta_estado'),
+            ('cuenta', 'cuenta_unico'),
+        ])
+
+        pares = indices.duplicados([indice('cuenta', '2'), indice('cuenta_estado', '2 5')])
+        self.assertEqual([(s.nombre, c.nombre) for s, c in pares], [('cuenta', 'cuenta_estado')])
+
+    def test_plan_de_las_consultas_frecuentes(self):
+        self.assertEqual(indices.consultas_frecuentes(), {})
+        with transaction.atomic():
+            guardar_calificaciones([fila_calificacion(i) for i in range(5)], self.cuenta.pk, 'por_aprobar')
+
+        consultas = indices.consultas_frecuentes()
+        self.assertEqual(len(consultas['tus_calificaciones']), 5)
+        datos = indices.plan(consultas['tus_calificaciones'])
+        self.assertIn('idx_calificacion_cuenta_estado', datos['indices'])
+        self.assertIsNone(datos['costo'])
+
+    def test_comando_guarda_y_compara_planes(self):
+        salida = io.StringIO()
+        call_command('reportar_indices', '--planes', stdout=salida)
+        self.assertIn('No hay calificaciones', salida.getvalue())
+
+        with transaction.atomic():
+            guardar_calificaciones([fila_calificacion(i) for i in range(5)], self.cuenta.pk, 'por_aprobar')
+        ruta = os.path.join(self.directorio, 'planes.json')
+        call_command('reportar_indices', '--guardar', ruta, stdout=io.StringIO())
+        with open(ruta, encoding='utf-8') as archivo:
+            self.assertEqual(set(json.load(archivo)), set(indices.consultas_frecuentes()))
+
+        salida = io.StringIO()
+        call_command('reportar_indices', '--comparar', ruta, stdout=salida)
+        self.assertIn('antes -> después', salida.getvalue())
+        self.assertIn('idx_calificacion_cuenta_estado', salida.getvalue())
+
+        with self.assertRaisesRegex(CommandError, 'No se pudo leer'):
+            call_command('reportar_indices', '--comparar', os.path.join(self.directorio, 'no_existe.json'), stdout=io.StringIO())
+
+
+class BusquedaTests(CalificadorMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        with transaction.atomic():
+            guardar_calificaciones([fila_calificacion(i) for i in range(10)], self.cuenta.pk, 'por_aprobar')
+        self.ruts = sorted(Empresa.objects.values_list('empresa_rut', flat=True))
+
+    def test_indice_ngramas(self):
+        indice = busqueda.IndiceNgramas([(1, 'Ñandú Ltda.'), (2, 'Viña del Mar S.A.'), (3, None)])
+        self.assertEqual(indice.buscar('ñan'), {1})
+        self.assertEqual(indice.buscar('ÑANDÚ LTDA'), {1})
+        self.assertEqual(indice.buscar('a.'), {1, 2})  # menos de 3 caracteres: se compara contra todos
+        self.assertEqual(indice.buscar('mar s'), {2})
+        self.assertEqual(indice.buscar('xyz'), set())
+
+    def test_filtra_como_icontains(self):
+        calificaciones = CalificacionTributaria.objects.order_by('pk')
+        for rut, nombre in (('', 'empresa 3'), (self.ruts[1][2:6], ''), ('', 's.a'), (self.ruts[0][:4], 'EMPRESA 0'), ('', 'no existe')):
+            filtros = {}
+            if rut:
+                filtros['rut_empresa__empresa_rut__icontains'] = rut
+            if nombre:
+                filtros['rut_empresa__nombre_empresa__icontains'] = nombre
+            self.assertEqual(
+                list(busqueda.filtrar_por_empresa(calificaciones, rut=rut, nombre=nombre)),
+                list(calificaciones.filter(**filtros)),
+            )
+        self.assertEqual(busqueda.filtrar_por_empresa(calificaciones).count(), 10)
+
+    def test_sobre_maximo_de_ruts_vuelve_al_icontains(self):
+        calificaciones = CalificacionTributaria.objects.order_by('pk')
+        with mock.patch.object(busqueda, 'MAXIMO_RUTS', 1):
+            filtrado = busqueda.filtrar_por_empresa(calificaciones, nombre='empresa')
+        self.assertIn('LIKE', str(filtrado.query))
+        self.assertEqual(filtrado.count(), 10)
+
+    def test_guardar_o_borrar_empresa_invalida_el_indice(self):
+        self.assertEqual(busqueda.ruts_que_contienen(nombre='nueva'), set())
+        empresa = Empresa(
+            empresa_rut=rut_con_digito(77000000), nombre_empresa='Nueva SpA', ingresado_por=self.cuenta,
+            pais='Chile', tipo_de_empresa='SPA',
+        )
+        empresa.save()
+        self.assertEqual(busqueda.ruts_que_contienen(nombre='nueva'), {empresa.empresa_rut})
+
+        Empresa.objects.filter(pk=empresa.pk).update(nombre_empresa='Otra SpA')
+        # Un update no envía señales: se ve al vencer BUSQUEDA_INDICE_SEGUNDOS
+        self.assertEqual(busqueda.ruts_que_contienen(nombre='nueva'), {empresa.empresa_rut})
+        with self.settings(BUSQUEDA_INDICE_SEGUNDOS=0):
+            self.assertEqual(busqueda.ruts_que_contienen(nombre='nueva'), set())
+
+        empresa.refresh_from_db()
+        empresa.delete()
+        self.assertEqual(busqueda.ruts_que_contienen(nombre='otra'), set())
+
+
+class BenchmarkTests(CalificadorMixin, TestCase):
+
+    def test_rut_con_digito(self):
+        self.assertEqual(rut_con_digito(12345678), '12.345.678-5')
+        self.assertEqual(rut_con_digito('10000013'), '10.000.013-K')
+        validate_rut_chileno(rut_con_digito(59999999))
+
+    def test_libro_sintetico_y_medicion(self):
+        empresas = dict(Empresa.objects.values_list('empresa_rut', 'nombre_empresa'))
+        ruta = f'{self.directorio}/benchmark.xlsx'
+        benchmark.generar_libro(ruta, 200, empresas, proporcion_invalidas=0.2, semilla=3)
+
+        resultado = benchmark.medir_carga(ruta, self.cuenta.pk, tamano_bloque=64)
+        self.assertEqual(resultado['filas'], 200)
+        self.assertTrue(120 < resultado['filas_validas'] < 200)
+        self.assertEqual(resultado['filas_guardadas'], resultado['filas_validas'])
+        self.assertEqual(set(resultado['segundos']), set(benchmark.FASES))
+        # El guardado del benchmark se deshace
+        self.assertFalse(CalificacionTributaria.objects.exists())
+
+        # La misma semilla genera el mismo archivo
+        otra = f'{self.directorio}/benchmark_2.xlsx'
+        benchmark.generar_libro(otra, 200, empresas, proporcion_invalidas=0.2, semilla=3)
+        self.assertEqual(benchmark.medir_carga(otra, None, 64, guardar=False)['filas_validas'], resultado['filas_validas'])
+
+    def test_comando_guarda_los_resultados(self):
+        salida = f'{self.directorio}/resultados.json'
+        call_command(
+            'benchmark_carga_masiva', filas=[50, 120], directorio=self.directorio, salida=salida,
+            memoria=True, stdout=io.StringIO(),
+        )
+        with open(salida, encoding='utf-8') as archivo:
+            datos = json.load(archivo)
+        self.assertEqual([r['filas'] for r in datos['resultados']], [50, 120])
+        self.assertEqual(datos['resultados'][1]['memoria']['filas'], 120)
+
+
+class EmpresasPorRutTests(CalificadorMixin, TestCase):
+
+    def test_consulta_por_partes(self):
+        ruts = [rut_con_digito(76000000 + i % 5) for i in range(12)] + [rut_con_digito(55555555), '', None]
+        with mock.patch.object(empresas, 'RUTS_POR_CONSULTA', 2), self.assertNumQueries(3):
+            encontradas = empresas.empresas_por_rut(ruts)
+        self.assertEqual(sorted(encontradas), [rut_con_digito(76000000 + i) for i in range(5)])
+        registrada = Empresa.objects.get(pk=rut_con_digito(76000002))
+        self.assertEqual(encontradas[registrada.pk], registrada.nombre_empresa)
+
+    def test_bloque_resuelve_sus_empresas_una_vez(self):
+        resolver = mock.Mock(wraps=empresas.empresas_por_rut)
+        datos = validar_bloque(
+            bloque_excel(
+                *[fila_excel(i) for i in range(10)],
+                fila_excel(10, rut_empresa=rut_con_digito(55555555)),
+                fila_excel(11, nombre_empresa='Otra Empresa Ltda.'),
+                fila_excel(12, rut_empresa='123'),
+            ),
+            resolver,
+        )
+        resolver.assert_called_once()
+        self.assertEqual(len(resolver.call_args.args[0]), 6)
+        self.assertEqual([dato.valido for dato in datos], [True] * 10 + [False] * 3)
+        self.assertEqual(datos[10].errores, (f'Empresa con RUT {rut_con_digito(55555555)} no está registrada.',))
+        self.assertIn('no coincide con la empresa registrada', datos[11].errores[0])
+
+
+class EmpresasParecidasTests(CalificadorMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        Empresa(
+            empresa_rut=rut_con_digito(77000001), nombre_empresa='Comercial Ñuñoa S.A.', ingresado_por=self.cuenta,
+            pais='Chile', tipo_de_empresa='SA',
+        ).save()
+
+    def test_normalizar_nombre_empresa(self):
+        for nombre in ('Comercial Ñuñoa S.A.', '  COMERCIAL  nuñoa s. a. ', 'Comercial Nunoa SA'):
+            self.assertEqual(normalizar_nombre_empresa(nombre), 'comercial nunoa sa')
+        self.assertEqual(normalizar_nombre_empresa(None), '')
+        self.assertEqual(Empresa.objects.get(pk=rut_con_digito(77000001)).nombre_normalizado, 'comercial nunoa sa')
+
+    def test_migracion_usa_una_copia_igual_a_la_actual(self):
+        migracion = importlib.import_module('Contenedor_Calificaciones.migrations.0022_empresa_nombre_normalizado')
+        for nombre in ('Comercial Ñuñoa S.A.', 'Inversiones Los Andes Ltda.', 'A. B. C. Spa', ''):
+            self.assertEqual(migracion.normalizar_nombre_empresa(nombre), normalizar_nombre_empresa(nombre))
+
+    def test_similitud_como_pg_trgm(self):
+        self.assertEqual(trigramas('ab'), {'  a', ' ab', 'ab '})
+        self.assertEqual(similitud('comercial nunoa sa', 'comercial nunoa sa'), 1.0)
+        self.assertEqual(similitud('abc', 'xyz'), 0.0)
+        self.assertGreater(similitud('comercial nunoa', 'comercial nunoa sa'), empresas.SIMILITUD_MINIMA)
+
+    @mock.patch.object(empresas, '_usa_pg_trgm', return_value=False)
+    def test_sugiere_la_empresa_parecida(self, _):
+        datos = validar_bloque(
+            bloque_excel(
+                fila_excel(0, rut_empresa=rut_con_digito(77000001), nombre_empresa='COMERCIAL NUNOA SA'),
+                fila_excel(1, rut_empresa=rut_con_digito(55555555), nombre_empresa='Comercial Nunoa'),
+                fila_excel(2, rut_empresa=rut_con_digito(55555555), nombre_empresa='zzzz qqqq'),
+            ),
+            empresas.empresas_por_rut, empresas.BuscadorParecidas(),
+        )
+        self.assertTrue(datos[0].valido)
+        nombre = Empresa.objects.get(pk=rut_con_digito(77000001)).nombre_empresa
+        self.assertIn(f'¿Quiso decir "{nombre}" (RUT {rut_con_digito(77000001)})?', datos[1].errores[0])
+        self.assertNotIn('¿Quiso decir', datos[2].errores[0])
+
+    @mock.patch.object(empresas, '_usa_pg_trgm', return_value=False)
+    def test_indice_en_memoria_se_arma_una_vez(self, _):
+        buscar = empresas.BuscadorParecidas()
+        with mock.patch.object(empresas, 'IndiceEmpresas', wraps=empresas.IndiceEmpresas) as indice:
+            primero = buscar(['comercial nunoa'])
+            with self.assertNumQueries(0):
+                segundo = buscar(['empresa 3 sa', 'comercial nunoa'])
+        self.assertEqual(indice.call_count, 1)
+        self.assertEqual(primero['comercial nunoa'][0], rut_con_digito(77000001))
+        self.assertEqual(segundo['empresa 3 sa'][0], rut_con_digito(76000003))
+
+
+class FilaCalificacionTests(CalificadorMixin, TestCase):
+
+    def test_errores_de_la_fila(self):
+        valida, otra = fila_calificacion(1), fila_calificacion(2)
+        self.assertTrue(valida.valido)
+        self.assertEqual(valida.errores, ())
+        self.assertFalse(hasattr(valida, '__dict__'))
+        with self.assertRaises(AttributeError):
+            valida.campo_nuevo = 1
+
+        valida.agregar_error('Monto inválido')
+        valida.agregar_error('Factor inválido')
+        self.assertFalse(valida.valido)
+        self.assertEqual(valida.errores, ('Monto inválido', 'Factor inválido'))
+        # La tupla vacía es compartida, pero agregar un error no toca las otras filas
+        self.assertEqual((otra.errores, otra.valido), ((), True))
+        self.assertFalse(FilaCalificacion(*[None] * 12, errores=['x']).valido)
+
+    def test_ida_y_vuelta_por_el_staging(self):
+        lote = LoteCargaMasiva.objects.create(cuenta=self.cuenta, archivo_nombre='x.xlsx')
+        datos = [fila_calificacion(i, huella=f'{i:032x}', hash_contenido=f'{i:032x}') for i in range(1, 6)]
+        datos[2].agregar_error('Monto inválido')
+        lotes.agregar_filas(lote, datos)
+
+        validas = list(lotes.filas_validas(lote, tamano=2))
+        self.assertEqual([dato.fila for dato in validas], [1, 2, 4, 5])
+        for leida, original in zip(validas, [d for d in datos if d.valido]):
+            self.assertEqual(
+                [getattr(leida, campo) for campo in FilaCalificacion.__slots__],
+                [getattr(original, campo) for campo in FilaCalificacion.__slots__],
+            )
+        self.assertEqual(lotes.filas_con_errores(lote)[0]['errores'], ['Monto inválido'])
+
+    def test_slots_ocupan_menos_que_un_dict(self):
+        ruta = os.path.join(self.directorio, 'memoria.xlsx')
+        with open(ruta, 'wb') as archivo:
+            archivo.write(archivo_xlsx([fila_excel(i) for i in range(200)]).read())
+        memoria = benchmark.bytes_por_fila(ruta, 64)
+        self.assertEqual(memoria['filas'], 200)
+        self.assertLess(memoria['bytes_por_fila_slots'], memoria['bytes_por_fila_dict'])
+
+
+class GuardadoTests(CalificadorMixin, TestCase):
+
+    def test_copy_en_postgresql(self):
+        cursor = mock.Mock()
+        with mock.patch.object(guardado, 'connection', vendor='postgresql'):
+            guardado.escribir_filas(cursor, 'tabla', ['a', 'b', 'c'], [(1, None, 'x,y'), (2, '', 'z')], ['b'])
+        sql, buffer = cursor.copy_expert.call_args.args
+        self.assertEqual(sql, 'COPY tabla (a, b, c) FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (b))')
+        self.assertEqual(buffer.read(), '1,,"x,y"\r\n2,,z\r\n')
+        cursor.executemany.assert_not_called()
+
+    def test_guarda_con_el_nombre_registrado_y_omite_las_ya_importadas(self):
+        filas = [fila_calificacion(i) for i in range(6)]
+        with transaction.atomic():
+            guardadas, _ = guardar_calificaciones(filas[:4], self.cuenta.pk, 'por_enviar', tamano=3)
+        self.assertEqual(guardadas, 4)
+
+        with transaction.atomic():
+            guardadas, _ = guardar_calificaciones(filas, self.cuenta.pk, 'por_enviar', tamano=3)
+        self.assertEqual(guardadas, 2)
+        self.assertEqual(CalificacionTributaria.objects.count(), 6)
+
+        calificacion = CalificacionTributaria.objects.get(monto_tributario=101.0)
+        empresa = Empresa.objects.get(pk=rut_con_digito(76000001))
+        self.assertEqual(calificacion.nombre_empresa, empresa.nombre_empresa)
+        self.assertEqual(
+            (calificacion.metodo_calificacion, calificacion.estado_calificacion, calificacion.cuenta_id_id),
+            ('masiva', 'por_enviar', self.cuenta.pk),
+        )
+        self.assertEqual(calificacion.huella, filas[1].huella)
+
+    def test_validar_filas_omite_las_que_no_cumplen_el_modelo(self):
+        rechazadas = []
+        filas = [fila_calificacion(1), fila_calificacion(2, unidad_valor='U' * 51)]
+        with transaction.atomic():
+            guardadas, _ = guardar_calificaciones(
+                filas, self.cuenta.pk, 'por_enviar', validar_filas=True, rechazadas=rechazadas
+            )
+        self.assertEqual(guardadas, 1)
+        self.assertEqual([(dato.fila, mensaje) for dato, mensaje in rechazadas], [
+            (2, 'La fila no cumple las reglas de la calificación tributaria.'),
+        ])
+
+
+class RestriccionesTests(CalificadorMixin, TestCase):
+
+    def test_la_bd_rechaza_valores_fuera_de_rango(self):
+        guardar_calificaciones([fila_calificacion(1)], self.cuenta.pk, 'por_enviar')
+        for campo, valor in (
+            ('anio_tributario', 1800), ('factor_tributario', 1.5), ('puntaje_calificacion', 101),
+            ('monto_tributario', -1), ('categoria_calificacion', 'x'), ('estado_calificacion', 'x'),
+        ):
+            with self.subTest(campo=campo), self.assertRaises(IntegrityError), transaction.atomic():
+                CalificacionTributaria.objects.update(**{campo: valor})
+
+    @override_settings(CARGA_MASIVA_MODO_GUARDADO='partes', CARGA_MASIVA_TAMANO_GUARDADO=8)
+    def test_filas_rechazadas_pasan_a_errores(self):
+        # Filas que pasaron la validación pero que la BD rechaza: se aíslan
+        # dividiendo la parte y el resto se guarda
+        lote = LoteCargaMasiva.objects.create(
+            cuenta=self.cuenta, archivo_nombre='x.xlsx', estado='por_guardar', estado_destino='por_enviar'
+        )
+        datos = [fila_calificacion(i, factor_tributario=5.0 if i in (7, 23) else 0.5) for i in range(1, 31)]
+        lotes.agregar_filas(lote, datos)
+        lotes.actualizar_lote(lote, total_filas=30, filas_validas=30)
+
+        tareas.ejecutar(lote.pk)
+        lote.refresh_from_db()
+        self.assertEqual(lote.estado, 'guardado')
+        self.assertEqual((lote.filas_guardadas, lote.filas_validas, lote.filas_con_errores), (28, 28, 2))
+        self.assertEqual(CalificacionTributaria.objects.count(), 28)
+        rechazadas = lote.filas.filter(valido=False).order_by('fila')
+        self.assertEqual([fila.fila for fila in rechazadas], [7, 23])
+        self.assertTrue(rechazadas[0].errores[0].startswith('La base de datos rechazó la fila'))
+
+    @override_settings(CARGA_MASIVA_MODO_GUARDADO='transaccion', CARGA_MASIVA_TAMANO_GUARDADO=8)
+    def test_filas_con_empresa_eliminada_pasan_a_errores(self):
+        lote = LoteCargaMasiva.objects.create(
+            cuenta=self.cuenta, archivo_nombre='x.xlsx', estado='por_guardar', estado_destino='por_enviar'
+        )
+        lotes.agregar_filas(lote, [fila_calificacion(i) for i in range(1, 21)])
+        lotes.actualizar_lote(lote, total_filas=20, filas_validas=20)
+        # La empresa se elimina después de validar el archivo
+        Empresa.objects.filter(empresa_rut=rut_con_digito(76000003)).delete()
+
+        tareas.ejecutar(lote.pk)
+        lote.refresh_from_db()
+        self.assertEqual(lote.estado, 'guardado')
+        self.assertEqual((lote.filas_guardadas, lote.filas_validas, lote.filas_con_errores), (16, 16, 4))
+        self.assertEqual(CalificacionTributaria.objects.count(), 16)
+        rechazadas = lote.filas.filter(valido=False).order_by('fila')
+        self.assertEqual([fila.fila for fila in rechazadas], [3, 8, 13, 18])
+        self.assertEqual(
+            rechazadas[0].errores, [f'La empresa con RUT {rut_con_digito(76000003)} ya no está registrada.']
+        )
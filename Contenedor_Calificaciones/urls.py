@@ -36,6 +36,9 @@ urlpatterns = [
     # Perfil del jefe
     path("api/perfil/", views.PerfilJefeAPIView.as_view(), name="api-perfil"),
     
+    # Carga masiva por API (integraciones del calificador)
+    path("api/calificaciones/ingesta/", views.IngestaCalificacionesAPIView.as_view(), name="api-ingesta-calificaciones"),
+    
     # JWT Tokens (opcional para autenticación avanzada)
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
@@ -51,6 +54,12 @@ urlpatterns = [
     path("agregar_calificacion/", views.agregar_calificacion, name="agregar_calificacion"),
     path("carga_masiva/", views.carga_masiva_view, name="carga_masiva"),
     path("guardar_calificaciones_masivas/", views.guardar_calificaciones_masivas, name="guardar_calificaciones_masivas"),
+    path("carga_masiva/progreso/<uuid:lote_id>/", views.progreso_carga_masiva, name="progreso_carga_masiva"),
+    path("carga_masiva/filas/<uuid:lote_id>/", views.filas_carga_masiva, name="filas_carga_masiva"),
+    path("carga_masiva/errores/<uuid:lote_id>/", views.reporte_errores_carga_masiva, name="reporte_errores_carga_masiva"),
+    path("carga_masiva/subidas/", views.iniciar_subida_masiva, name="iniciar_subida_masiva"),
+    path("carga_masiva/subidas/<uuid:subida_id>/", views.estado_subida_masiva, name="estado_subida_masiva"),
+    path("carga_masiva/subidas/<uuid:subida_id>/partes/", views.parte_subida_masiva, name="parte_subida_masiva"),
     path("tus_calificaciones/", views.tus_calificaciones, name="tus_calificaciones"),
     path("calificaciones_pendientes/", views.calificaciones_pendientes, name="calificaciones_pendientes"),
     path("calificaciones/editar/<int:calificacion_id>/", views.editar_calificacion_pendiente, name="editar_calificacion_pendiente"),
@@ -1,3 +1,6 @@
+import re
+import unicodedata
+
 from django.core.exceptions import ValidationError
 
 
@@ -61,3 +64,31 @@ def formatear_rut(value: str) -> str:
     cuerpo, dv = _clean_rut(value)
     cuerpo_formateado = f"{int(cuerpo):,}".replace(",", ".")
     return f"{cuerpo_formateado}-{dv}"
+
+
+def rut_con_digito(cuerpo) -> str:
+    """
+    Devuelve el RUT formateado (por ejemplo, `12.345.678-5`) para un cuerpo
+    numérico, calculando su dígito verificador con módulo 11.
+    """
+    cuerpo = str(int(cuerpo))
+    return formatear_rut(f"{cuerpo}-{_dv_mod11(cuerpo)}")
+
+
+def normalizar_nombre_empresa(value: str) -> str:
+    """
+    Devuelve el nombre de una empresa en minúsculas, sin tildes ni puntuación y con un
+    solo espacio entre palabras; las siglas se juntan ("S.A.", "S. A." y "SA" quedan como `sa`).
+    """
+    texto = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode("ascii")
+    palabras = re.sub(r"[^a-z0-9]+", " ", texto.lower().replace(".", "")).split()
+    resultado = []
+    sigla = False
+    for palabra in palabras:
+        # Letras sueltas seguidas forman una sigla
+        if len(palabra) == 1 and sigla:
+            resultado[-1] += palabra
+        else:
+            resultado.append(palabra)
+            sigla = len(palabra) == 1
+    return " ".join(resultado)
@@ -3,11 +3,18 @@ from django import forms
 from django.contrib import messages
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from .models import Empresa, Cuenta, CalificacionTributaria, CalificacionAprovada, CalificacionRechazada, EquipoCalificador, EquipoDeTrabajo
+from .models import Empresa, Cuenta, CalificacionTributaria, CalificacionAprovada, CalificacionRechazada, EquipoCalificador, EquipoDeTrabajo, EnvioIdempotente
 from .forms import CalificacionTributariaForm
 from .forms import RegistroCuentaForm
 from .validators import validate_rut_chileno, formatear_rut
+from .autenticacion import SesionCuentaAuthentication, TokenIntegracionAuthentication
+from .busqueda import filtrar_por_empresa
+from .conteo import contar
+from .paginacion import PaginadorConConteo, PaginadorKeyset
 from django.urls import reverse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+import io
 import json
 from django.db import transaction, connection
 import pandas as pd
@@ -20,7 +27,7 @@ from rest_framework import permissions, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Q, Count
+from django.db.models import Q, Count, F
 from datetime import datetime, timedelta
 from .serializers import (
     LoginJefeSerializer, PerfilJefeSerializer,
@@ -28,6 +35,8 @@ from .serializers import (
     CalificacionHistorialSerializer, DashboardSerializer,
     AccionCalificacionSerializer
 )
+from .carga_masiva import bloqueos, ingesta, lotes, reporte, subidas, tareas
+from .carga_masiva.lectores import EXTENSIONES_PERMITIDAS
 
 #Variables constantes para los roles:
 ROL_JEFE = 'Jefe De Equipo'
@@ -415,224 +424,236 @@ def agregar_calificacion(request):
     
     return render(request, 'Contenedor_Calificaciones/calificador_tributario/calificacion_manual.html', context)
 
+# Mensaje de éxito según el estado con que se guardó la carga masiva
+MENSAJES_GUARDADO_MASIVO = {
+    'por_enviar': 'guardadas como Por Enviar',
+    'por_aprobar': 'enviadas para aprobación',
+}
+
 #Vista para agregar calificacion tributaria mediante archivo masivo
 def carga_masiva_view(request):
     """
-    Vista para carga masiva de calificaciones desde archivo Excel.
-    Muestra vista previa de los datos con validaciones.
+    Vista para carga masiva de calificaciones desde archivo Excel, CSV, ODS o Parquet.
+    Al subir el archivo se crea un lote que se valida en segundo plano; con
+    ?lote=<id> muestra su progreso y, al terminar, la vista previa.
     """
     if not request.session.get('cuenta_id') or not request.session.get('rol') == ROL_CALIFICADOR:
         return redirect('identificacion')
     
-    datos_procesados = []
     errores_globales = []
     archivo_nombre = None
+    lote = None
     
     if request.method == 'POST' and request.FILES.get('archivo_excel'):
         archivo = request.FILES['archivo_excel']
         archivo_nombre = archivo.name
         
         # Validar extensión del archivo
-        if not archivo.name.endswith(('.xlsx', '.xls')):
-            errores_globales.append('El archivo debe ser formato Excel (. xlsx o .xls)')
+        if not archivo.name.lower().endswith(EXTENSIONES_PERMITIDAS):
+            errores_globales.append('El archivo debe ser formato Excel (.xlsx o .xls), CSV, ODS o Parquet')
         else:
             try:
-                # Leer el archivo Excel
-                df = pd.read_excel(archivo, engine='openpyxl')
-                
-                # Validar que no esté vacío
-                if df.empty:
-                    errores_globales.append('El archivo Excel está vacío.')
-                else:
-                    # Normalizar nombres de columnas (quitar espacios extra)
-                    df.columns = df.columns.str.strip()
-                    
-                    # Función helper para encontrar columna (tolera variaciones de tildes)
-                    def encontrar_columna(df, posibles_nombres):
-                        for nombre in posibles_nombres:
-                            if nombre in df.columns:
-                                return nombre
-                        return None
-                    
-                    # Mapeo flexible de columnas
-                    col_rut = encontrar_columna(df, ['RUT de la Empresa'])
-                    col_nombre = encontrar_columna(df, ['Nombre de la Empresa'])
-                    col_anio = encontrar_columna(df, ['Año Tributario'])
-                    col_tipo = encontrar_columna(df, ['Tipo de Calificación', 'Tipo de Calificacion'])
-                    col_monto = encontrar_columna(df, ['Monto Tributario'])
-                    col_factor = encontrar_columna(df, ['Factor Tributario'])
-                    col_unidad = encontrar_columna(df, ['Unidad de Valor'])
-                    col_puntaje = encontrar_columna(df, ['Puntaje de Calificación', 'Puntaje de Calificacion'])
-                    col_categoria = encontrar_columna(df, ['Categoría de la Calificación', 'Categoria de la Calificación', 'Categoría de la Calificacion', 'Categoria de la Calificacion'])
-                    col_riesgo = encontrar_columna(df, ['Nivel de Riesgo'])
-                    col_justificacion = encontrar_columna(df, ['Justificación del resultado (Observaciones)', 'Justificacion del resultado (Observaciones)'])
-                    
-                    # Validar que existan todas las columnas necesarias
-                    columnas_faltantes = []
-                    if not col_rut: columnas_faltantes.append('RUT de la Empresa')
-                    if not col_nombre: columnas_faltantes.append('Nombre de la Empresa')
-                    if not col_anio: columnas_faltantes.append('Año Tributario')
-                    if not col_tipo: columnas_faltantes.append('Tipo de Calificación')
-                    if not col_monto: columnas_faltantes.append('Monto Tributario')
-                    if not col_factor: columnas_faltantes.append('Factor Tributario')
-                    if not col_unidad: columnas_faltantes.append('Unidad de Valor')
-                    if not col_puntaje: columnas_faltantes.append('Puntaje de Calificación')
-                    if not col_categoria: columnas_faltantes.append('Categoría de la Calificación')
-                    if not col_riesgo: columnas_faltantes.append('Nivel de Riesgo')
-                    if not col_justificacion: columnas_faltantes.append('Justificación del resultado (Observaciones)')
-                    
-                    if columnas_faltantes:
-                        errores_globales.append(f"Faltan columnas en el Excel: {', '.join(columnas_faltantes)}")
-                    else:
-                        # Procesar cada fila (máximo 10)
-                        filas_procesadas = 0
-                        
-                        for index, row in df.iterrows():
-                            # Saltar filas vacías
-                            if pd.isna(row[col_rut]) or str(row[col_rut]).strip() == '':
-                                continue
-                            
-                            if filas_procesadas >= 10:
-                                errores_globales.append('⚠️ Se permiten máximo 10 calificaciones por archivo.  Las filas adicionales fueron ignoradas.')
-                                break
-                            
-                            filas_procesadas += 1
-                            errores_fila = []
-                            
-                            # Validar RUT empresa (debe existir en BD)
-                            rut_empresa_valor = str(row[col_rut]).strip()
-                            nombre_empresa_excel = str(row[col_nombre]).strip() if pd.notna(row[col_nombre]) else ''
-
-                            try:
-                                validate_rut_chileno(rut_empresa_valor)
-                                rut_formateado = formatear_rut(rut_empresa_valor)
-                                empresa = Empresa.objects.filter(empresa_rut=rut_formateado).first()
-                                
-                                if not empresa:
-                                    errores_fila.append(f'Empresa con RUT {rut_formateado} no está registrada.')
-                                else:
-                                    # Validar que el nombre coincida (normalizar para comparación)
-                                    nombre_bd = empresa.nombre_empresa.strip().lower()
-                                    nombre_excel = nombre_empresa_excel.strip().lower()
-                                    
-                                    # Comparación exacta (sin distinguir mayúsculas/minúsculas)
-                                    if nombre_bd != nombre_excel:
-                                        errores_fila.append(
-                                            f'El nombre "{nombre_empresa_excel}" no coincide con la empresa registrada para el RUT {rut_formateado}.'
-                                        )
-                                        empresa = None  # Marcar como inválida
-                                        
-                            except ValidationError as e:
-                                errores_fila.append(f'RUT inválido: {rut_empresa_valor}')
-                                rut_formateado = rut_empresa_valor
-                                empresa = None
-                            
-                            # Validar año tributario
-                            try:
-                                anio = int(row[col_anio])
-                                if anio < 1900 or anio > timezone.now().year:
-                                    errores_fila.append(f'Año tributario {anio} fuera de rango (1900-{timezone.now().year})')
-                            except (ValueError, TypeError):
-                                errores_fila.append(f'Año tributario inválido: {row[col_anio]}')
-                                anio = None
-                            
-                            # Validar monto tributario
-                            try:
-                                monto = float(row[col_monto])
-                                if monto < 0:
-                                    errores_fila.append('Monto tributario no puede ser negativo')
-                            except (ValueError, TypeError):
-                                errores_fila.append(f'Monto tributario inválido: {row[col_monto]}')
-                                monto = None
-                            
-                            # Validar factor tributario
-                            try:
-                                factor = float(row[col_factor])
-                                if factor < 0:
-                                    errores_fila.append('Factor tributario no puede ser negativo')
-                                elif factor > 1:
-                                    errores_fila.append('Factor tributario debe ser un valor entre 0 y 1 (Ej: 0.5 para 50%)')
-                            except (ValueError, TypeError):
-                                errores_fila.append(f'Factor tributario inválido: {row[col_factor]}')
-                                factor = None
-                            
-                            # Validar puntaje (0-100)
-                            try:
-                                puntaje = int(row[col_puntaje])
-                                if puntaje < 0 or puntaje > 100:
-                                    errores_fila.append('Puntaje debe estar entre 0 y 100')
-                            except (ValueError, TypeError):
-                                errores_fila.append(f'Puntaje inválido: {row[col_puntaje]}')
-                                puntaje = None
-                            
-                            # Validar categoría
-                            categoria_map = {
-                                'A': 'alto', 'B': 'medio', 'C': 'bajo',  
-                                'a': 'alto', 'b': 'medio', 'c': 'bajo',  
-                                'bajo': 'bajo', 'medio': 'medio', 'alto': 'alto',
-                                'BAJO': 'bajo', 'MEDIO': 'medio', 'ALTO': 'alto',
-                                'Bajo': 'bajo', 'Medio': 'medio', 'Alto': 'alto'
-                            }
-                            categoria_valor = str(row[col_categoria]).strip()
-                            if categoria_valor not in categoria_map:
-                                errores_fila.append(f'Categoría inválida: {categoria_valor}. Debe ser: A, B, C o Bajo, Medio, Alto')
-                                categoria = None
-                            else:
-                                categoria = categoria_map[categoria_valor]
-                            
-                            # Validar nivel de riesgo
-                            riesgo_map = {
-                                'bajo': 'bajo', 'medio': 'medio', 'alto': 'alto', 'critico': 'critico', 'crítico': 'critico',
-                                'BAJO': 'bajo', 'MEDIO': 'medio', 'ALTO': 'alto', 'CRITICO': 'critico', 'CRÍTICO': 'critico',
-                                'Bajo': 'bajo', 'Medio': 'medio', 'Alto': 'alto', 'Critico': 'critico', 'Crítico': 'critico'
-                            }
-                            riesgo_valor = str(row[col_riesgo]).strip()
-                            if riesgo_valor not in riesgo_map:
-                                errores_fila.append(f'Nivel de riesgo inválido: {riesgo_valor}.  Debe ser: Bajo, Medio, Alto o Crítico')
-                                riesgo = None
-                            else:
-                                riesgo = riesgo_map[riesgo_valor]
-                            
-                            # Agregar datos procesados
-                            datos_procesados.append({
-                                'fila': index + 2,  # +2 porque Excel empieza en 1 y tiene header
-                                'rut_empresa': rut_formateado if rut_formateado else rut_empresa_valor,
-                                'nombre_empresa': str(row[col_nombre]).strip() if pd.notna(row[col_nombre]) else '',
-                                'anio_tributario': anio,
-                                'tipo_calificacion': str(row[col_tipo]).strip() if pd.notna(row[col_tipo]) else '',
-                                'monto_tributario': monto,
-                                'factor_tributario': factor,
-                                'unidad_valor': str(row[col_unidad]).strip() if pd.notna(row[col_unidad]) else '',
-                                'puntaje_calificacion': puntaje,
-                                'categoria_calificacion': categoria,
-                                'nivel_riesgo': riesgo,
-                                'justificacion_resultado': str(row[col_justificacion]).strip() if pd.notna(row[col_justificacion]) else '',
-                                'errores': errores_fila,
-                                'valido': len(errores_fila) == 0
-                            })
-                        
-                        if filas_procesadas == 0:
-                            errores_globales.append('No se encontraron filas válidas con datos en el archivo.')
-                            
+                # Guardar el archivo y dejar el lote en cola; la lectura y
+                # validación ocurren fuera del request
+                cuenta = Cuenta.objects.get(pk=request.session.get('cuenta_id'))
+                lote = lotes.crear_lote(cuenta, archivo)
+                tareas.encolar(lote.pk)
+                return redirect(f"{reverse('carga_masiva')}?lote={lote.pk}")
+            except Cuenta.DoesNotExist:
+                messages.error(request, 'Sesión inválida. Por favor, inicie sesión nuevamente.')
+                return redirect('identificacion')
             except Exception as e:
                 errores_globales.append(f'Error al procesar el archivo: {str(e)}')
     
-    # Serializar datos válidos para pasarlos a la siguiente vista
-    datos_validos = [d for d in datos_procesados if d['valido']]
-    datos_json = json.dumps(datos_validos) if datos_validos else ''
+    elif request.GET.get('lote'):
+        lote = lotes.obtener_lote(request.GET.get('lote'), request.session.get('cuenta_id'))
+        
+        # Si el proceso que lo validaba o guardaba se detuvo, el lote se retoma
+        if lote is not None and lote.estado in ('validando', 'guardando'):
+            tareas.reanudar_interrumpidos(lote.pk)
+            lote.refresh_from_db()
+        
+        if lote is None:
+            errores_globales.append('La carga solicitada no existe o ya expiró.')
+        
+        elif lote.estado == 'guardado':
+            if lote.filas_guardadas > 0:
+                messages.success(
+                    request,
+                    f'✅ {lote.filas_guardadas} calificación(es) '
+                    f'{MENSAJES_GUARDADO_MASIVO.get(lote.estado_destino, "guardadas")} exitosamente '
+                    f'({lote.duracion_guardado or 0:.1f} s, {lote.filas_guardadas / max(lote.duracion_guardado or 0, 0.001):.0f} filas/s).'
+                )
+            else:
+                messages.warning(request, 'No se guardó ninguna calificación.')
+            return redirect('Inicio_Calificador')
+        
+        else:
+            archivo_nombre = lote.archivo_nombre
+            errores_globales = list(lote.errores_globales)
+            if lote.estado == 'validado' and lote.ultima_fila_guardada:
+                errores_globales.append(
+                    f'Ya se guardaron {lote.filas_guardadas} calificaciones (hasta la fila {lote.ultima_fila_guardada}). '
+                    'Al confirmar nuevamente se continúa desde ahí.'
+                )
+    
+    en_proceso = lote is not None and lote.estado in tareas.ESTADOS_EN_PROCESO
 
     context = {
-        'datos_procesados': datos_procesados,
         'errores_globales': errores_globales,
         'archivo_nombre': archivo_nombre,
-        'total_registros': len(datos_procesados),
-        'registros_validos': sum(1 for d in datos_procesados if d['valido']),
-        'registros_con_errores': sum(1 for d in datos_procesados if not d['valido']),
-        'datos_json': datos_json,  # ← NUEVO
+        'total_registros': lote.total_filas if lote else 0,
+        'registros_validos': lote.filas_validas if lote else 0,
+        'registros_con_errores': lote.filas_con_errores if lote else 0,
+        'registros_duplicados': lote.filas_duplicadas if lote else 0,
+        # El guardado solo referencia el lote; las filas ya están en el staging
+        'lote_id': lote.pk if lote and lote.estado == 'validado' else '',
+        'lote': lote,
+        'en_proceso': en_proceso,
+        'max_filas': settings.CARGA_MASIVA_MAX_FILAS,
+        # Las filas de la vista previa se piden por páginas a filas_carga_masiva
+        'mostrar_filas': lote is not None and lote.estado == 'validado' and lote.total_filas > 0,
+        'filtro_inicial': 'errores' if lote and lote.total_filas > lote.filas_validas else 'todas',
+        'tamano_pagina': settings.CARGA_MASIVA_FILAS_POR_PAGINA,
+        'tamano_parte': settings.CARGA_MASIVA_TAMANO_PARTE,
     }
     
     return render(request, 'Contenedor_Calificaciones/calificador_tributario/carga_masiva.html', context)
 
+# Progreso de un lote de carga masiva (lo consulta la vista previa cada pocos segundos)
+def progreso_carga_masiva(request, lote_id):
+    if not request.session.get('cuenta_id') or not request.session.get('rol') == ROL_CALIFICADOR:
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    lote = lotes.obtener_lote(lote_id, request.session.get('cuenta_id'))
+    if lote is None:
+        return JsonResponse({'error': 'Lote no encontrado'}, status=404)
+    
+    return JsonResponse({
+        'estado': lote.estado,
+        'estado_display': lote.get_estado_display(),
+        'en_proceso': lote.estado in tareas.ESTADOS_EN_PROCESO,
+        'filas_leidas': lote.total_filas,
+        'filas_validas': lote.filas_validas,
+        'filas_con_errores': lote.filas_con_errores,
+        'filas_duplicadas': lote.filas_duplicadas,
+        'filas_guardadas': lote.filas_guardadas,
+        'errores_globales': lote.errores_globales,
+    })
+
+# Página de la vista previa de un lote: ?filtro=todas|errores|validas&despues=<fila>
+def filas_carga_masiva(request, lote_id):
+    if not request.session.get('cuenta_id') or not request.session.get('rol') == ROL_CALIFICADOR:
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    lote = lotes.obtener_lote(lote_id, request.session.get('cuenta_id'))
+    if lote is None:
+        return JsonResponse({'error': 'Lote no encontrado'}, status=404)
+    
+    filtro = request.GET.get('filtro', 'todas')
+    if filtro not in lotes.FILTROS_PREVIEW:
+        return JsonResponse({'error': 'Filtro inválido'}, status=400)
+    try:
+        despues = int(request.GET.get('despues', 0))
+        tamano = min(max(int(request.GET.get('tamano', settings.CARGA_MASIVA_FILAS_POR_PAGINA)), 1), 200)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros de paginación inválidos'}, status=400)
+    
+    filas, siguiente = lotes.pagina_filas(lote, filtro, despues, tamano)
+    return JsonResponse({'filas': filas, 'siguiente': siguiente})
+
+# Descarga de las filas con errores de un lote (?formato=xlsx o csv)
+def reporte_errores_carga_masiva(request, lote_id):
+    if not request.session.get('cuenta_id') or not request.session.get('rol') == ROL_CALIFICADOR:
+        return redirect('identificacion')
+    
+    lote = lotes.obtener_lote(lote_id, request.session.get('cuenta_id'))
+    if lote is None or lote.estado in tareas.ESTADOS_EN_PROCESO:
+        raise Http404('La carga solicitada no existe o todavía se está procesando.')
+    
+    nombre = f"errores_{os.path.splitext(lote.archivo_nombre)[0] or 'carga_masiva'}"
+    if request.GET.get('formato') == 'csv':
+        respuesta = StreamingHttpResponse(reporte.reporte_csv(lote), content_type='text/csv; charset=utf-8')
+        respuesta['Content-Disposition'] = f'attachment; filename="{nombre}.csv"'
+        return respuesta
+    
+    respuesta = StreamingHttpResponse(
+        reporte.reporte_xlsx(lote),
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre}.xlsx"'
+    return respuesta
+
+# ---------- Subida por partes (reanudable) de archivos de carga masiva ----------
+def _subida_json(subida, estado_http=200, error=None):
+    datos = {
+        'subida_id': str(subida.subida_id),
+        'estado': subida.estado,
+        'bytes_recibidos': subida.bytes_recibidos,
+        'tamano_total': subida.tamano_total,
+        'tamano_parte': settings.CARGA_MASIVA_TAMANO_PARTE,
+        'lote_id': str(subida.lote_id) if subida.lote_id else None,
+        'url_lote': f"{reverse('carga_masiva')}?lote={subida.lote_id}" if subida.lote_id else None,
+    }
+    if error:
+        datos['error'] = error
+    return JsonResponse(datos, status=estado_http)
+
+
+# Inicia una subida: recibe nombre, tamano y sha256 del archivo
+def iniciar_subida_masiva(request):
+    if not request.session.get('cuenta_id') or not request.session.get('rol') == ROL_CALIFICADOR:
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    
+    try:
+        cuenta = Cuenta.objects.get(pk=request.session.get('cuenta_id'))
+        subida = subidas.iniciar_subida(
+            cuenta,
+            request.POST.get('nombre', ''),
+            request.POST.get('tamano'),
+            request.POST.get('sha256'),
+        )
+    except Cuenta.DoesNotExist:
+        return JsonResponse({'error': 'Sesión inválida'}, status=403)
+    except subidas.ErrorSubida as e:
+        return JsonResponse({'error': str(e)}, status=e.estado_http)
+    
+    return _subida_json(subida, 201)
+
+
+# Estado de una subida (para reanudarla desde bytes_recibidos)
+def estado_subida_masiva(request, subida_id):
+    if not request.session.get('cuenta_id') or not request.session.get('rol') == ROL_CALIFICADOR:
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    subida = subidas.obtener_subida(subida_id, request.session.get('cuenta_id'))
+    if subida is None:
+        return JsonResponse({'error': 'Subida no encontrada'}, status=404)
+    return _subida_json(subida)
+
+
+# Recibe una parte; el cuerpo del request son los bytes indicados en Content-Range
+def parte_subida_masiva(request, subida_id):
+    if not request.session.get('cuenta_id') or not request.session.get('rol') == ROL_CALIFICADOR:
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    if request.method not in ('POST', 'PUT'):
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    
+    subida = subidas.obtener_subida(subida_id, request.session.get('cuenta_id'))
+    if subida is None:
+        return JsonResponse({'error': 'Subida no encontrada'}, status=404)
+    
+    try:
+        # Se lee el cuerpo como flujo (request.read) para no cargarlo en memoria
+        subida = subidas.recibir_parte(subida, request.headers.get('Content-Range'), request)
+    except subidas.ErrorSubida as e:
+        subida.refresh_from_db()
+        return _subida_json(subida, e.estado_http, str(e))
+    
+    return _subida_json(subida)
+
 #Vista para crear cuenta
 def registro_view(request):
     """Vista para registro de nueva cuenta"""
@@ -675,13 +696,10 @@ def tus_calificaciones(request):
     calificaciones_qs = CalificacionTributaria.objects.filter(
         cuenta_id=cuenta,
         estado_calificacion__in=['por_aprobar', 'aprobado', 'rechazado']
-    ).select_related('rut_empresa').prefetch_related('aprobacion', 'rechazo').order_by('-fecha_calculo')
-    
-    if rut:
-        calificaciones_qs = calificaciones_qs.filter(rut_empresa__empresa_rut__icontains=rut)
+    ).select_related('rut_empresa').order_by('-fecha_calculo')
     
-    if nombre_empresa:
-        calificaciones_qs = calificaciones_qs.filter(rut_empresa__nombre_empresa__icontains=nombre_empresa)
+    # Búsqueda por RUT o nombre de empresa con índices de trigramas (ver busqueda.py)
+    calificaciones_qs = filtrar_por_empresa(calificaciones_qs, rut=rut, nombre=nombre_empresa)
     
     if anio:
         calificaciones_qs = calificaciones_qs.filter(anio_tributario=anio)
@@ -691,8 +709,9 @@ def tus_calificaciones(request):
         calificaciones_qs = calificaciones_qs.filter(estado_calificacion=estado)
     
     # Paginación
-    from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-    paginator = Paginator(calificaciones_qs, page_size)
+    from django.core.paginator import EmptyPage, PageNotAnInteger
+    # El total sale de conteo.contar (acotado, en caché o estimado)
+    paginator = PaginadorConConteo(calificaciones_qs, page_size)
     page = request.GET.get('page')
     
     try:
@@ -702,28 +721,12 @@ def tus_calificaciones(request):
     except EmptyPage:
         calificaciones = paginator.page(paginator.num_pages)
     
-    # Agregar observaciones a cada calificación
-    for calificacion in calificaciones:
-        calificacion.observacion_jefe = None
-        calificacion.fecha_revision = None
-        calificacion.jefe_revisor = None
-        
-        if calificacion.estado_calificacion == 'aprobado':
-            aprobacion = calificacion.aprobacion.first()
-            if aprobacion:
-                calificacion.observacion_jefe = aprobacion.observaciones
-                calificacion.fecha_revision = aprobacion.fecha_aprovacion
-                calificacion.jefe_revisor = aprobacion.jefe_rut
-        elif calificacion.estado_calificacion == 'rechazado':
-            rechazo = calificacion.rechazo.first()
-            if rechazo:
-                calificacion.observacion_jefe = rechazo.observaciones
-                calificacion.fecha_revision = rechazo.fecha_rechazo
-                calificacion.jefe_revisor = rechazo.jefe_rut
+    # Las observaciones, la fecha y el jefe de la revisión vienen en la misma
+    # fila (revisado_por, fecha_revision, observacion_revision)
     
     context = {
         'calificaciones': calificaciones,
-        'total_calificaciones': paginator.count,
+        'total_calificaciones': paginator.conteo,
         'page_obj': calificaciones,
         'paginator': paginator,
         'page_size': page_size,
@@ -759,18 +762,16 @@ def calificaciones_pendientes(request):
         estado_calificacion='por_enviar'
     ).select_related('rut_empresa').order_by('-fecha_calculo')
     
-    if rut:
-        calificaciones_qs = calificaciones_qs.filter(rut_empresa__empresa_rut__icontains=rut)
-    
-    if nombre_empresa:
-        calificaciones_qs = calificaciones_qs.filter(rut_empresa__nombre_empresa__icontains=nombre_empresa)
+    # Búsqueda por RUT o nombre de empresa con índices de trigramas (ver busqueda.py)
+    calificaciones_qs = filtrar_por_empresa(calificaciones_qs, rut=rut, nombre=nombre_empresa)
     
     if anio:
         calificaciones_qs = calificaciones_qs.filter(anio_tributario=anio)
     
     # Paginación
-    from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-    paginator = Paginator(calificaciones_qs, page_size)
+    from django.core.paginator import EmptyPage, PageNotAnInteger
+    # El total sale de conteo.contar (acotado, en caché o estimado)
+    paginator = PaginadorConConteo(calificaciones_qs, page_size)
     page = request.GET.get('page')
     
     try:
@@ -782,7 +783,7 @@ def calificaciones_pendientes(request):
     
     context = {
         'calificaciones': calificaciones,
-        'total_calificaciones': paginator.count,
+        'total_calificaciones': paginator.conteo,
         'page_obj': calificaciones,
         'paginator': paginator,
         'page_size': page_size,
@@ -983,29 +984,20 @@ def calificaciones_pendientes_jefe(request):
             pass
     
     if rut_empresa:
-        base_qs = base_qs.filter(rut_empresa__empresa_rut__icontains=rut_empresa)
-
-    calificaciones_qs = base_qs.select_related('cuenta_id', 'rut_empresa').order_by('-fecha_calculo')
+        base_qs = filtrar_por_empresa(base_qs, rut=rut_empresa)
 
-    from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-    paginator = Paginator(calificaciones_qs, page_size)
-    page = request.GET.get('page')
-    try:
-        calificaciones = paginator.page(page)
-    except PageNotAnInteger:
-        calificaciones = paginator.page(1)
-    except EmptyPage:
-        calificaciones = paginator.page(paginator.num_pages)
+    # Paginación por llave (fecha_calculo, calificacion_id): sin OFFSET ni COUNT
+    paginador = PaginadorKeyset(base_qs.select_related('cuenta_id', 'rut_empresa'), page_size)
+    calificaciones = paginador.pagina(request.GET.get('cursor'))
 
     context = {
         'calificaciones': calificaciones,
-        'total_calificaciones': paginator.count,
+        'total_calificaciones': contar(base_qs),
         'calificadores_equipo': cuentas_calificadores,
         'calificador_seleccionado': calificador_id,
         'rut_empresa_filtro': rut_empresa,
         'page_size': page_size,
         'page_obj': calificaciones,
-        'paginator': paginator,
     }
     return render(request, 'Contenedor_Calificaciones/jefe_tributario/calificaciones_pendientes_jefe.html', context)
 
@@ -1017,10 +1009,10 @@ def calificaciones_aprobadas_jefe(request):
 
     jefe = get_object_or_404(Cuenta, pk=request.session.get('cuenta_id'))
 
-    # Buscar todas las calificaciones aprobadas por este jefe (sin importar equipo actual)
-    aprobadas_ids = CalificacionAprovada.objects.filter(jefe=jefe).values_list('calificacion_id', flat=True)
+    # Buscar todas las calificaciones aprobadas por este jefe (sin importar equipo actual);
+    # revisado_por evita pasar por la tabla de aprobadas (índice idx_calificacion_revision)
     base_qs = CalificacionTributaria.objects.filter(
-        pk__in=aprobadas_ids,
+        revisado_por=jefe.rut,
         estado_calificacion='aprobado'
     )
 
@@ -1042,26 +1034,17 @@ def calificaciones_aprobadas_jefe(request):
         except ValueError:
             pass
 
-    calificaciones_qs = base_qs.select_related('cuenta_id', 'rut_empresa').order_by('-fecha_calculo')
-
-    from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-    paginator = Paginator(calificaciones_qs, page_size)
-    page = request.GET.get('page')
-    try:
-        calificaciones = paginator.page(page)
-    except PageNotAnInteger:
-        calificaciones = paginator.page(1)
-    except EmptyPage:
-        calificaciones = paginator.page(paginator.num_pages)
+    # Paginación por llave (fecha_calculo, calificacion_id): sin OFFSET ni COUNT
+    paginador = PaginadorKeyset(base_qs.select_related('cuenta_id', 'rut_empresa'), page_size)
+    calificaciones = paginador.pagina(request.GET.get('cursor'))
 
     context = {
         'calificaciones': calificaciones,
-        'total_calificaciones': paginator.count,
+        'total_calificaciones': contar(base_qs),
         'calificadores_equipo': calificadores_equipo,
         'calificador_seleccionado': calificador_id,
         'page_size': page_size,
         'page_obj': calificaciones,
-        'paginator': paginator,
     }
     return render(request, 'Contenedor_Calificaciones/jefe_tributario/calificaciones_aprobadas.html', context)
 
@@ -1073,10 +1056,10 @@ def calificaciones_rechazadas_jefe(request):
 
     jefe = get_object_or_404(Cuenta, pk=request.session.get('cuenta_id'))
 
-    # Buscar todas las calificaciones rechazadas por este jefe (sin importar equipo actual)
-    rechazadas_ids = CalificacionRechazada.objects.filter(jefe=jefe).values_list('calificacion_id', flat=True)
+    # Buscar todas las calificaciones rechazadas por este jefe (sin importar equipo actual);
+    # revisado_por evita pasar por la tabla de rechazadas (índice idx_calificacion_revision)
     base_qs = CalificacionTributaria.objects.filter(
-        pk__in=rechazadas_ids,
+        revisado_por=jefe.rut,
         estado_calificacion='rechazado'
     )
 
@@ -1098,26 +1081,17 @@ def calificaciones_rechazadas_jefe(request):
         except ValueError:
             pass
 
-    calificaciones_qs = base_qs.select_related('cuenta_id', 'rut_empresa').order_by('-fecha_calculo')
-
-    from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-    paginator = Paginator(calificaciones_qs, page_size)
-    page = request.GET.get('page')
-    try:
-        calificaciones = paginator.page(page)
-    except PageNotAnInteger:
-        calificaciones = paginator.page(1)
-    except EmptyPage:
-        calificaciones = paginator.page(paginator.num_pages)
+    # Paginación por llave (fecha_calculo, calificacion_id): sin OFFSET ni COUNT
+    paginador = PaginadorKeyset(base_qs.select_related('cuenta_id', 'rut_empresa'), page_size)
+    calificaciones = paginador.pagina(request.GET.get('cursor'))
 
     context = {
         'calificaciones': calificaciones,
-        'total_calificaciones': paginator.count,
+        'total_calificaciones': contar(base_qs),
         'calificadores_equipo': calificadores_equipo,
         'calificador_seleccionado': calificador_id,
         'page_size': page_size,
         'page_obj': calificaciones,
-        'paginator': paginator,
     }
     return render(request, 'Contenedor_Calificaciones/jefe_tributario/calificaciones_rechazadas.html', context)
 
@@ -1145,13 +1119,7 @@ def aprobar_calificacion(request, calificacion_id: int):
     observaciones = request.POST.get('observaciones', '').strip()
 
     try:
-        CalificacionAprovada.objects.create(
-            calificacion=calificacion,
-            jefe=jefe,
-            observaciones=observaciones,
-        )
-        calificacion.estado_calificacion = 'aprobado'
-        calificacion.save()
+        calificacion.registrar_revision(jefe, 'aprobado', observaciones)
         messages.success(request, f'Se aprobó la calificación #{calificacion.calificacion_id}.')
     except IntegrityError:
         messages.error(request, 'Ya existe un registro de aprobación para esta calificación.')
@@ -1184,13 +1152,7 @@ def rechazar_calificacion(request, calificacion_id: int):
     observaciones = request.POST.get('observaciones', '').strip()
 
     try:
-        CalificacionRechazada.objects.create(
-            calificacion=calificacion,
-            jefe=jefe,
-            observaciones=observaciones,
-        )
-        calificacion.estado_calificacion = 'rechazado'
-        calificacion.save()
+        calificacion.registrar_revision(jefe, 'rechazado', observaciones)
         messages.success(request, f'Se rechazó la calificación #{calificacion.calificacion_id}.')
     except IntegrityError:
         messages.error(request, 'Ya existe un registro de rechazo para esta calificación.')
@@ -1286,91 +1248,33 @@ def guardar_calificaciones_masivas(request):
     
     if request. method == 'POST':
         try:
-            # Obtener datos del formulario
-            datos_json = request.POST.get('datos_json', '')
-            accion = request. POST.get('accion', 'por_enviar')
+            # Obtener el lote validado en la vista previa
+            accion = request.POST.get('accion', 'por_enviar')
+            cuenta_id = request.session.get('cuenta_id')
+            lote = lotes.obtener_lote(request.POST.get('lote_id', ''), cuenta_id)
             
-            if not datos_json:
+            if lote is None or not lote.filas_validas:
                 messages.error(request, 'No hay datos válidos para guardar.')
                 return redirect('carga_masiva')
             
-            # Deserializar datos
-            datos_validos = json.loads(datos_json)
+            url_lote = f"{reverse('carga_masiva')}?lote={lote.pk}"
             
-            if not datos_validos:
-                messages. warning(request, 'No hay calificaciones válidas para guardar.')
-                return redirect('carga_masiva')
-            
-            # Obtener cuenta del usuario
-            cuenta_id = request.session.get('cuenta_id')
-            cuenta = Cuenta.objects.get(pk=cuenta_id)
+            # Ya confirmado: se muestra su progreso (o el resultado)
+            if lote.estado in ('por_guardar', 'guardando', 'guardado'):
+                return redirect(url_lote)
             
             # Determinar estado según la acción
-            if accion == 'por_enviar':
-                estado = 'por_enviar'
-                mensaje_exito = 'guardadas como Por Enviar'
-            elif accion == 'enviar':
+            if accion == 'enviar':
                 estado = 'por_aprobar'
-                mensaje_exito = 'enviadas para aprobación'
             else:
                 estado = 'por_enviar'
-                mensaje_exito = 'guardadas'
-            
-            # Guardar calificaciones usando SQL directo
-            from django.db import connection
-            guardadas = 0
-            
-            with transaction.atomic():
-                with connection.cursor() as cursor:
-                    for dato in datos_validos:
-                        # Validar que la empresa existe
-                        empresa = Empresa.objects.filter(empresa_rut=dato['rut_empresa']).first()
-                        if not empresa:
-                            continue
-                        
-                        # Insertar directamente con SQL
-                        cursor.execute("""
-                            INSERT INTO calificacion_tributaria (
-                                cuenta_id, empresa_rut, nombre_empresa, anio_tributario,
-                                tipo_calificacion, monto_tributario, factor_tributario,
-                                unidad_valor, puntaje_calificacion, categoria_calificacion,
-                                nivel_riesgo, justificacion_resultado, metodo_calificacion,
-                                estado_calificacion, fecha_calculo
-                            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-                        """, [
-                            cuenta. cuenta_id,
-                            dato['rut_empresa'],
-                            empresa.nombre_empresa,
-                            dato['anio_tributario'],
-                            dato['tipo_calificacion'],
-                            dato['monto_tributario'],
-                            dato['factor_tributario'],
-                            dato['unidad_valor'],
-                            dato['puntaje_calificacion'],
-                            dato['categoria_calificacion'],
-                            dato['nivel_riesgo'],
-                            dato. get('justificacion_resultado', ''),
-                            'masiva',
-                            estado
-                        ])
-                        guardadas += 1
             
-            if guardadas > 0:
-                messages.success(
-                    request, 
-                    f'✅ {guardadas} calificación(es) {mensaje_exito} exitosamente.'
-                )
-            else:
-                messages.warning(request, 'No se guardó ninguna calificación.')
+            # Dejar el lote en cola para guardarlo fuera del request
+            if lotes.tomar_lote(lote.pk, 'validado', 'por_guardar', estado_destino=estado):
+                tareas.encolar(lote.pk)
             
-            return redirect('Inicio_Calificador')
+            return redirect(url_lote)
             
-        except json.JSONDecodeError:
-            messages.error(request, 'Error al procesar los datos.  Intente nuevamente.')
-            return redirect('carga_masiva')
-        except Cuenta.DoesNotExist:
-            messages.error(request, 'Sesión inválida.')
-            return redirect('identificacion')
         except Exception as e:
             messages.error(request, f'Error al guardar: {str(e)}')
             return redirect('carga_masiva')
@@ -1573,15 +1477,8 @@ class AprobarCalificacionAPIView(APIView):
         observaciones = serializer.validated_data.get('observaciones', '')
         
         try:
-            with transaction.atomic():
-                calificacion.estado_calificacion = 'aprobado'
-                calificacion.save()
-                
-                CalificacionAprovada.objects.create(
-                    calificacion=calificacion,
-                    jefe=jefe,
-                    observaciones=observaciones
-                )
+            # Registro de revisión, estado y columnas de revisión en una transacción
+            calificacion.registrar_revision(jefe, 'aprobado', observaciones)
             
             return Response({
                 'success': True,
@@ -1618,15 +1515,8 @@ class RechazarCalificacionAPIView(APIView):
         observaciones = serializer.validated_data.get('observaciones', '')
         
         try:
-            with transaction.atomic():
-                calificacion.estado_calificacion = 'rechazado'
-                calificacion.save()
-                
-                CalificacionRechazada.objects.create(
-                    calificacion=calificacion,
-                    jefe=jefe,
-                    observaciones=observaciones
-                )
+            # Registro de revisión, estado y columnas de revisión en una transacción
+            calificacion.registrar_revision(jefe, 'rechazado', observaciones)
             
             return Response({
                 'success': True,
@@ -1658,62 +1548,38 @@ class HistorialCalificacionesAPIView(APIView):
             equipo = EquipoDeTrabajo.objects.get(equipo_id=equipo_id)
             cuentas_equipo = Cuenta.objects.filter(equipo_trabajo=equipo, rol=ROL_CALIFICADOR)
             
-            historial = []
+            estados = ['aprobado', 'rechazado'] if estado == 'all' else [estado]
             
-            # Aprobadas
-            if estado in ['all', 'aprobado']:
-                aprobadas = CalificacionAprovada.objects.filter(
-                    calificacion__cuenta_id__in=cuentas_equipo
-                ).select_related('calificacion__cuenta_id', 'calificacion__rut_empresa').order_by('-fecha_aprovacion')
-                
-                for apr in aprobadas:
-                    historial.append({
-                        'calificacion_id': apr.calificacion.calificacion_id,
-                        'empresa_rut': apr.calificacion.rut_empresa.empresa_rut,
-                        'empresa_nombre': apr.calificacion.rut_empresa.nombre_empresa,
-                        'empresa_pais': apr.calificacion.rut_empresa.pais,
-                        'anio_tributario': apr.calificacion.anio_tributario,
-                        'tipo_calificacion': apr.calificacion.tipo_calificacion,
-                        'monto_tributario': float(apr.calificacion.monto_tributario),
-                        'factor_tributario': float(apr.calificacion.factor_tributario),
-                        'unidad_valor': apr.calificacion.unidad_valor,
-                        'puntaje_calificacion': apr.calificacion.puntaje_calificacion,
-                        'categoria_calificacion': apr.calificacion.categoria_calificacion,
-                        'nivel_riesgo': apr.calificacion.nivel_riesgo,
-                        'estado': 'aprobado',
-                        'fecha_revision': apr.fecha_aprovacion,
-                        'observaciones': apr.observaciones,
-                        'calificador_nombre': f"{apr.calificacion.cuenta_id.nombre} {apr.calificacion.cuenta_id.apellido}"
-                    })
-            
-            # Rechazadas
-            if estado in ['all', 'rechazado']:
-                rechazadas = CalificacionRechazada.objects.filter(
-                    calificacion__cuenta_id__in=cuentas_equipo
-                ).select_related('calificacion__cuenta_id', 'calificacion__rut_empresa').order_by('-fecha_rechazo')
-                
-                for rec in rechazadas:
-                    historial.append({
-                        'calificacion_id': rec.calificacion.calificacion_id,
-                        'empresa_rut': rec.calificacion.rut_empresa.empresa_rut,
-                        'empresa_nombre': rec.calificacion.rut_empresa.nombre_empresa,
-                        'empresa_pais': rec.calificacion.rut_empresa.pais,
-                        'anio_tributario': rec.calificacion.anio_tributario,
-                        'tipo_calificacion': rec.calificacion.tipo_calificacion,
-                        'monto_tributario': float(rec.calificacion.monto_tributario),
-                        'factor_tributario': float(rec.calificacion.factor_tributario),
-                        'unidad_valor': rec.calificacion.unidad_valor,
-                        'puntaje_calificacion': rec.calificacion.puntaje_calificacion,
-                        'categoria_calificacion': rec.calificacion.categoria_calificacion,
-                        'nivel_riesgo': rec.calificacion.nivel_riesgo,
-                        'estado': 'rechazado',
-                        'fecha_revision': rec.fecha_rechazo,
-                        'observaciones': rec.observaciones,
-                        'calificador_nombre': f"{rec.calificacion.cuenta_id.nombre} {rec.calificacion.cuenta_id.apellido}"
-                    })
+            # Una sola lectura de calificacion_tributaria: la revisión (fecha y
+            # observaciones) está desnormalizada en la misma fila
+            revisadas = CalificacionTributaria.objects.filter(
+                cuenta_id__in=cuentas_equipo,
+                estado_calificacion__in=estados
+            ).select_related('cuenta_id', 'rut_empresa').order_by(
+                F('fecha_revision').desc(nulls_last=True), '-calificacion_id'
+            )
             
-            # Ordenar por fecha
-            historial.sort(key=lambda x: x['fecha_revision'], reverse=True)
+            historial = [
+                {
+                    'calificacion_id': cal.calificacion_id,
+                    'empresa_rut': cal.rut_empresa.empresa_rut,
+                    'empresa_nombre': cal.rut_empresa.nombre_empresa,
+                    'empresa_pais': cal.rut_empresa.pais,
+                    'anio_tributario': cal.anio_tributario,
+                    'tipo_calificacion': cal.tipo_calificacion,
+                    'monto_tributario': float(cal.monto_tributario),
+                    'factor_tributario': float(cal.factor_tributario),
+                    'unidad_valor': cal.unidad_valor,
+                    'puntaje_calificacion': cal.puntaje_calificacion,
+                    'categoria_calificacion': cal.categoria_calificacion,
+                    'nivel_riesgo': cal.nivel_riesgo,
+                    'estado': cal.estado_calificacion,
+                    'fecha_revision': cal.fecha_revision,
+                    'observaciones': cal.observacion_revision,
+                    'calificador_nombre': f"{cal.cuenta_id.nombre} {cal.cuenta_id.apellido}"
+                }
+                for cal in revisadas
+            ]
             
             serializer = CalificacionHistorialSerializer(historial, many=True)
             return Response({
@@ -1845,4 +1711,76 @@ class DashboardAPIView(APIView):
             return Response(serializer.data)
         
         except EquipoDeTrabajo.DoesNotExist:
-            return Response({'error': 'Equipo no encontrado'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response({'error': 'Equipo no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class IngestaCalificacionesAPIView(APIView):
+    """
+    Carga masiva por API para integraciones (Calificador Tributario)
+    POST: /api/calificaciones/ingesta/?accion=enviar
+    Requiere la cabecera `Authorization: Token <clave>` con un token de
+    integración (comando crear_token_integracion) o la sesión iniciada de un
+    Calificador Tributario (y el token CSRF); las calificaciones quedan a
+    nombre de esa cuenta.
+    Body: NDJSON (un objeto por línea) o arreglo JSON, con las claves
+    rut_empresa, nombre_empresa, anio_tributario, tipo_calificacion,
+    monto_tributario, factor_tributario, unidad_valor, puntaje_calificacion,
+    categoria_calificacion, nivel_riesgo y justificacion_resultado.
+    Respuesta: NDJSON con el resultado de cada línea y un resumen al final.
+    Con la cabecera Idempotency-Key, un reintento con la misma clave no se
+    vuelve a procesar: recibe el resumen del envío original.
+    """
+    authentication_classes = [TokenIntegracionAuthentication, SesionCuentaAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request):
+        cuenta = request.user.cuenta
+        if cuenta.rol != ROL_CALIFICADOR:
+            return Response(
+                {'error': 'Solo un Calificador Tributario puede ingresar calificaciones'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        envio = None
+        clave = request.headers.get('Idempotency-Key', '').strip()
+        if clave:
+            lotes.limpiar_lotes_vencidos()
+            envio, creado = EnvioIdempotente.objects.get_or_create(cuenta=cuenta, clave=clave[:255])
+            if not creado:
+                if envio.estado == 'completado':
+                    respuesta = StreamingHttpResponse(
+                        [json.dumps({'resumen': envio.resumen, 'repetido': True}, ensure_ascii=False) + '\n'],
+                        content_type='application/x-ndjson; charset=utf-8'
+                    )
+                    respuesta['Idempotent-Replayed'] = 'true'
+                    return respuesta
+                return Response(
+                    {'error': 'Un envío con esta Idempotency-Key todavía se está procesando'},
+                    status=status.HTTP_409_CONFLICT
+                )
+        
+        estado = 'por_aprobar' if request.query_params.get('accion') == 'enviar' else 'por_enviar'
+        # El cuerpo se lee como flujo (sin request.data) para no cargarlo en memoria
+        flujo = request.stream or io.BytesIO()
+        
+        def lineas():
+            completado = False
+            try:
+                for resultado in ingesta.ingerir(flujo, cuenta.pk, estado, settings.CARGA_MASIVA_TAMANO_INGESTA):
+                    if envio and 'resumen' in resultado:
+                        envio.estado = 'completado'
+                        envio.resumen = resultado['resumen']
+                        envio.save(update_fields=['estado', 'resumen'])
+                        completado = True
+                    yield json.dumps(resultado, ensure_ascii=False) + '\n'
+            except bloqueos.CuentaOcupada as e:
+                yield json.dumps({'error': str(e)}, ensure_ascii=False) + '\n'
+            except Exception as e:
+                # Los bloques anteriores ya quedaron guardados; se informa dónde se cortó
+                yield json.dumps({'error': f'Error al procesar la ingesta: {str(e)}'}, ensure_ascii=False) + '\n'
+            finally:
+                # Si no terminó, la clave se libera para poder reintentar
+                if envio and not completado:
+                    envio.delete()
+        
+        return StreamingHttpResponse(lineas(), content_type='application/x-ndjson; charset=utf-8')
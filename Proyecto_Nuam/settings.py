@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
+import tempfile
 from dotenv import load_dotenv
 import os
 from datetime import timedelta
@@ -195,3 +196,61 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Carga masiva de calificaciones tributarias
+# Máximo de filas que se procesan por archivo (las siguientes se ignoran)
+CARGA_MASIVA_MAX_FILAS = int(os.getenv('CARGA_MASIVA_MAX_FILAS', '500000'))
+# Motor para leer los Excel: 'openpyxl' (por defecto) o 'calamine' (requiere python-calamine)
+CARGA_MASIVA_MOTOR_EXCEL = os.getenv('CARGA_MASIVA_MOTOR_EXCEL', 'openpyxl')
+# Filas que se leen y validan juntas (columna por columna) en cada bloque
+CARGA_MASIVA_TAMANO_BLOQUE = int(os.getenv('CARGA_MASIVA_TAMANO_BLOQUE', '5000'))
+# Procesos que validan los bloques en paralelo (1 = validar en el mismo proceso);
+# por defecto uno por CPU, hasta 4
+CARGA_MASIVA_PROCESOS = int(os.getenv('CARGA_MASIVA_PROCESOS', min(4, os.cpu_count() or 1)))
+# Filas a partir de las cuales conviene validar en paralelo; bajo esto se valida en serie
+CARGA_MASIVA_UMBRAL_PARALELO = int(os.getenv('CARGA_MASIVA_UMBRAL_PARALELO', '50000'))
+# Horas que se conservan los lotes de staging antes de eliminarlos
+CARGA_MASIVA_RETENCION_HORAS = int(os.getenv('CARGA_MASIVA_RETENCION_HORAS', '24'))
+# Cómo se procesan los lotes: 'hilo' (en el proceso web, por defecto), 'sincrono'
+# (dentro del request) o 'worker' (con `manage.py procesar_cargas_masivas`, la
+# entrada worker del Procfile). 'hilo' procesa dentro de los workers de gunicorn
+# y guarda el archivo en el disco del dyno: sirve con un solo dyno web. Con más
+# dynos web, o para no cargar al proceso web, use 'worker' con un
+# CARGA_MASIVA_DIRECTORIO compartido (ver readme.md, "Carga masiva en producción")
+CARGA_MASIVA_EJECUCION = os.getenv('CARGA_MASIVA_EJECUCION', 'hilo')
+# Hilos que procesan lotes en paralelo en el modo 'hilo'
+CARGA_MASIVA_HILOS = int(os.getenv('CARGA_MASIVA_HILOS', '2'))
+# Carpeta donde esperan los archivos subidos hasta ser validados. La carpeta
+# temporal solo la ve el propio dyno: en modo 'worker' debe ser un volumen
+# compartido (la revisión Contenedor_Calificaciones.E001 lo exige)
+CARGA_MASIVA_DIRECTORIO = os.getenv('CARGA_MASIVA_DIRECTORIO', os.path.join(tempfile.gettempdir(), 'nuam_carga_masiva'))
+# Subida por partes: tamaño máximo de cada parte (bytes) y del archivo completo (MB)
+CARGA_MASIVA_TAMANO_PARTE = int(os.getenv('CARGA_MASIVA_TAMANO_PARTE', str(5 * 1024 * 1024)))
+CARGA_MASIVA_MAX_ARCHIVO_MB = int(os.getenv('CARGA_MASIVA_MAX_ARCHIVO_MB', '200'))
+# Tamaño máximo (MB) de los .ods: a diferencia de los otros formatos se leen completos en memoria
+CARGA_MASIVA_MAX_ODS_MB = int(os.getenv('CARGA_MASIVA_MAX_ODS_MB', '20'))
+# Filas por página en la vista previa de la carga masiva (los errores completos se descargan)
+CARGA_MASIVA_FILAS_POR_PAGINA = int(os.getenv('CARGA_MASIVA_FILAS_POR_PAGINA', '50'))
+# Guardado de la carga masiva: 'partes' confirma cada CARGA_MASIVA_TAMANO_GUARDADO
+# filas en su propia transacción y puede reanudarse; 'transaccion' guarda todo junto
+CARGA_MASIVA_MODO_GUARDADO = os.getenv('CARGA_MASIVA_MODO_GUARDADO', 'partes')
+CARGA_MASIVA_TAMANO_GUARDADO = int(os.getenv('CARGA_MASIVA_TAMANO_GUARDADO', '5000'))
+# Minutos sin avance tras los que una validación o un guardado de carga masiva se considera interrumpido
+CARGA_MASIVA_MINUTOS_SIN_PROGRESO = int(os.getenv('CARGA_MASIVA_MINUTOS_SIN_PROGRESO', '10'))
+# Registros por transacción en la carga masiva por API (NDJSON / JSON)
+CARGA_MASIVA_TAMANO_INGESTA = int(os.getenv('CARGA_MASIVA_TAMANO_INGESTA', '1000'))
+# Carga confiable (por defecto): el guardado masivo confía en la validación del archivo y
+# en los CHECK de la BD; con True revalida cada fila en Python antes de escribirla
+CARGA_MASIVA_VALIDAR_FILAS = os.getenv('CARGA_MASIVA_VALIDAR_FILAS', 'False') == 'True'
+
+# Totales de los listados paginados (ver Contenedor_Calificaciones/conteo.py): exactos hasta
+# LISTADOS_CONTEO_EXACTO_HASTA filas; sobre eso se guardan en caché unos segundos y, en
+# PostgreSQL, desde LISTADOS_CONTEO_ESTIMADO_DESDE filas se muestra una estimación ("~N")
+LISTADOS_CONTEO_EXACTO_HASTA = int(os.getenv('LISTADOS_CONTEO_EXACTO_HASTA', '10000'))
+LISTADOS_CONTEO_ESTIMADO_DESDE = int(os.getenv('LISTADOS_CONTEO_ESTIMADO_DESDE', '100000'))
+LISTADOS_CONTEO_CACHE_SEGUNDOS = int(os.getenv('LISTADOS_CONTEO_CACHE_SEGUNDOS', '60'))
+
+# Filtros por RUT o nombre de empresa fuera de PostgreSQL (ver Contenedor_Calificaciones/busqueda.py):
+# segundos que se reutiliza el índice de trigramas en memoria antes de volver a leer las empresas
+BUSQUEDA_INDICE_SEGUNDOS = int(os.getenv('BUSQUEDA_INDICE_SEGUNDOS', '300'))